@@ -0,0 +1,79 @@
+"""
+Сравнение пакетного и поэлементного расчета КБЖУ
+
+Запуск из корня проекта:
+    python -m benchmarks.nutrition_batch --lists 10000 --names 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from food_recognition.nutrition_calc import NutritionCalculator
+
+def make_detections(list_count, name_count, seed=0):
+    """
+    Случайные списки распознанных продуктов: названия из встроенного словаря
+    и выдуманные (для них работает компонентный расчет)
+    """
+    rng = random.Random(seed)
+    known = list(NutritionCalculator.NUTRITION_DB)
+    names = rng.sample(known, min(name_count // 2, len(known)))
+    names += [f"блюдо {i}" for i in range(name_count - len(names))]
+
+    detections_list = []
+    for _ in range(list_count):
+        items = [{'name': rng.choice(names), 'confidence': round(rng.random(), 2)}
+                 for _ in range(rng.randint(0, 5))]
+        detections_list.append(items)
+    return detections_list
+
+def run_scalar(detections_list):
+    return [NutritionCalculator.calculate_nutrition([dict(item) for item in items])
+            for items in detections_list]
+
+def run_batch(detections_list):
+    return NutritionCalculator.calculate_nutrition_batch(detections_list)
+
+def check_results(scalar_results, batch_result):
+    """Расхождения между двумя способами расчета"""
+    mismatches = 0
+    for i, expected in enumerate(scalar_results):
+        for column in ('calories', 'proteins', 'fats', 'carbs'):
+            if abs(expected[column] - batch_result[column][i]) > 1e-9:
+                mismatches += 1
+                break
+        else:
+            if bool(expected.get('estimated', False)) != bool(batch_result['estimated'][i]):
+                mismatches += 1
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пропускная способность calculate_nutrition_batch")
+    parser.add_argument('--lists', type=int, default=10000, help="Количество списков продуктов")
+    parser.add_argument('--names', type=int, default=200, help="Количество различных названий")
+    parser.add_argument('--repeat', type=int, default=3, help="Повторов замера (берется лучший)")
+    args = parser.parse_args(argv)
+
+    detections_list = make_detections(args.lists, args.names)
+
+    timings = {}
+    for label, runner in (('поэлементно', run_scalar), ('пакетно', run_batch)):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = runner(detections_list)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = (best, result)
+        print(f"{label}: {best:.3f} с, {args.lists / best:,.0f} списков/с")
+
+    scalar_time, scalar_results = timings['поэлементно']
+    batch_time, batch_result = timings['пакетно']
+    print(f"Ускорение: {scalar_time / batch_time:.1f}x")
+    print(f"Расхождений: {check_results(scalar_results, batch_result)}")
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
+# Процессы распознавания штрихкодов создаются через fork до импорта остальных
+# модулей: пока в процессе нет других потоков (см. food_recognition.barcode_decoder)
+from food_recognition.barcode_decoder import barcode_decoder
+barcode_decoder.start()
+
 import telebot
-from telebot import types
+from telebot import types, apihelper
 import os
 import sys
 import logging
@@ -13,7 +18,6 @@ from database.models import User, FoodAnalysis
 from datetime import datetime, timedelta, date
 from utils.helpers import get_nutrition_indicators
 from database.models import User, FoodAnalysis, UserSubscription
-from food_recognition.barcode_scanner import BarcodeScanner
 from monitoring.metrics import metrics_collector
 from monitoring.decorators import track_command, track_api_call, track_user_action
 import time
@@ -31,13 +35,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Импорт модулей проекта
-from config import TELEGRAM_BOT_TOKEN, SUBSCRIPTION_COST, FREE_REQUESTS_LIMIT
+from config import (
+    TELEGRAM_BOT_TOKEN, SUBSCRIPTION_COST, FREE_REQUESTS_LIMIT,
+    ASYNC_UPDATES, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, PROVIDERS_WARM_UP
+)
 from database.db_manager import DatabaseManager
-from food_recognition.vision_api import FoodRecognition
+from food_recognition.providers import providers
 from food_recognition.nutrition_calc import NutritionCalculator
+from food_recognition.dish_cache import dish_cache
 from payments.yukassa import YuKassaPayment
+from utils.update_queue import UpdateDispatcher
+from utils.http_client import http_client
 from utils.helpers import (
-    download_photo, format_nutrition_result, get_subscription_info,
+    download_photo, save_debug_photo, format_nutrition_result, get_subscription_info,
     format_datetime, get_remaining_subscription_days
 )
 
@@ -47,11 +57,16 @@ TIMEZONE_OFFSET = 3  # Часы
 # ID администраторов, которые могут просматривать метрики
 ADMIN_IDS = [931190875]
 
+# Все запросы telebot к Bot API идут через общий пул keep-alive соединений
+apihelper.session = http_client.session
+
 # Инициализация хранилища состояний
 state_storage = StateMemoryStorage()
 
 # Инициализация бота с поддержкой состояний
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, state_storage=state_storage)
+# В асинхронном режиме обработчики выполняются в нашем пуле потоков,
+# поэтому собственный пул telebot не нужен
+bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, state_storage=state_storage, threaded=not ASYNC_UPDATES)
 
 # Создаем класс состояний
 class BotStates(StatesGroup):
@@ -72,8 +87,10 @@ user_data = {}
 user_stats_dates = {}
 
 # Инициализация компонентов
-food_recognition = FoodRecognition()
 aitunnel_adapter = AITunnelNutritionAdapter()
+if PROVIDERS_WARM_UP:
+    # Клиент Google Vision нужен только резервному методу - создаем его заранее в фоне
+    providers.warm_up()
 
 # Обработчик команды /start
 @bot.message_handler(commands=['start'])
@@ -177,6 +194,18 @@ def metrics_command(message):
             
             bot.send_message(message.chat.id, api_text)
         
+        # Очереди, кэши и прочие внутренние метрики - без Markdown
+        if metrics_summary.get('gauges') or metrics_summary.get('counters') or metrics_summary.get('avg_timings'):
+            internal_text = "Внутренние метрики:\n"
+            for name, value in metrics_summary.get('gauges', {}).items():
+                internal_text += f"• {name}: {value}\n"
+            for name, value in metrics_summary.get('counters', {}).items():
+                internal_text += f"• {name}: {value}\n"
+            for name, avg_time in metrics_summary.get('avg_timings', {}).items():
+                internal_text += f"• {name}: {avg_time:.3f} сек\n"
+            
+            bot.send_message(message.chat.id, internal_text)
+        
         # Ошибки - без Markdown
         if metrics_summary.get('top_errors'):
             errors_text = "Частые ошибки:\n"
@@ -1267,7 +1296,7 @@ def process_product_pfc(message):
         )
         
         # Сохраняем продукт в локальную базу данных штрихкодов
-        barcode_scanner = BarcodeScanner()
+        barcode_scanner = providers.get('barcode_scanner')
         barcode_scanner._save_to_local_database(product_data['barcode'], product_data)
         
         # Сохраняем в базу данных пользователя
@@ -1317,14 +1346,18 @@ def handle_food_name(message):
     processing_message = bot.send_message(chat_id, "🔍 Уточняю информацию о блюде... Пожалуйста, подождите.")
     
     try:
-        # Ищем пищевую ценность по указанному названию
-        nutrition_data = NutritionCalculator.lookup_nutrition(food_name)
+        # Ищем пищевую ценность по указанному названию (повторные названия - из кэша)
+        nutrition_data = dish_cache.lookup(food_name)
         
         # Если информация найдена, обновляем данные
         if nutrition_data and not nutrition_data.get('estimated', False):
             # Форматирование результатов
             result_text = format_nutrition_result(nutrition_data, user_id)
             
+            # Название найдено с учетом опечатки - показываем, что именно нашли
+            if nutrition_data.get('matched_name'):
+                result_text = f"🔎 Найдено похожее: {nutrition_data['matched_name']}\n\n" + result_text
+            
             # Проверка статуса подписки
             is_subscribed = DatabaseManager.check_subscription_status(user_id)
             remaining_requests = DatabaseManager.get_remaining_free_requests(user_id)
@@ -1646,23 +1679,35 @@ def photo_handler(message):
     
     photo_path = None
     try:
-        # Получение информации о фото
-        file_info = bot.get_file(message.photo[-1].file_id)
-        file_url = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_info.file_path}"
+        photo = message.photo[-1]
         
-        # Загрузка фото
-        photo_path = download_photo(file_url)
+        # Эту фотографию уже анализировали - не загружаем ее повторно
+        nutrition_data = aitunnel_adapter.get_cached_result(photo.file_unique_id)
         
-        if not photo_path:
-            bot.edit_message_text(
-                "❌ Не удалось загрузить фотографию. Пожалуйста, попробуйте еще раз.",
-                message.chat.id,
-                processing_message.message_id
+        if nutrition_data is None:
+            # Получение информации о фото
+            file_info = bot.get_file(photo.file_id)
+            file_url = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_info.file_path}"
+            
+            # Загрузка фото в память
+            photo_content = download_photo(file_url)
+            
+            if not photo_content:
+                bot.edit_message_text(
+                    "❌ Не удалось загрузить фотографию. Пожалуйста, попробуйте еще раз.",
+                    message.chat.id,
+                    processing_message.message_id
+                )
+                return
+            
+            # На диск фото пишется только в режиме отладки
+            photo_path = save_debug_photo(photo_content)
+            
+            # Используем AITunnel для распознавания и расчета КБЖУ
+            nutrition_data = aitunnel_adapter.process_image(
+                image_content=photo_content,
+                file_unique_id=photo.file_unique_id
             )
-            return
-        
-        # Используем AITunnel для распознавания и расчета КБЖУ
-        nutrition_data = aitunnel_adapter.process_image(image_path=photo_path)
         
         if nutrition_data is None:
             # Обработка случая, когда API вернул None
@@ -1823,9 +1868,6 @@ def photo_handler(message):
             message.chat.id,
             processing_message.message_id
         )
-    finally:
-        # Мы не удаляем временный файл, так как он может понадобиться для сохранения в БД
-        pass
 
 # Обработчик кнопки добавления в статистику
 @bot.callback_query_handler(func=lambda call: call.data.startswith("add_stats_"))
@@ -2010,6 +2052,18 @@ def run_polling():
     """Запуск бота в режиме поллинга"""
     logger.info("Запуск бота в режиме поллинга...")
     bot.remove_webhook()
+    
+    if ASYNC_UPDATES:
+        # Параллельная обработка с сохранением порядка обновлений каждого пользователя.
+        # Поток поллинга ждет, пока в очереди диспетчера не освободится место
+        dispatcher = UpdateDispatcher(
+            bot.process_new_updates,
+            workers=UPDATE_WORKERS,
+            max_queue_size=UPDATE_QUEUE_SIZE
+        )
+        dispatcher.start()
+        bot.process_new_updates = dispatcher.submit_many
+    
     bot.infinity_polling()
 
 # Точка входа
@@ -7,6 +7,42 @@ load_dotenv()
 # Ключ API AITunnel
 AITUNNEL_API_KEY = os.getenv('AITUNNEL_API_KEY')
 
+# Подготовка изображений перед отправкой в AITunnel
+VISION_MAX_LONG_EDGE = int(os.getenv('VISION_MAX_LONG_EDGE', 1024))  # Длинная сторона для detail=high
+VISION_LOW_DETAIL_MAX_EDGE = int(os.getenv('VISION_LOW_DETAIL_MAX_EDGE', 512))  # Для detail=low
+VISION_JPEG_QUALITY = int(os.getenv('VISION_JPEG_QUALITY', 85))
+# Политика детализации: 'high' - всегда высокая, 'low' - всегда низкая,
+# 'size' - низкая для маленьких изображений, 'retry' - низкая, а высокая повторным запросом,
+# если модель сама оценила уверенность ниже 0.6 (поле confidence) или не указала калорийность;
+# фото без еды и неразобранные ответы не повторяются
+VISION_DETAIL_POLICY = os.getenv('VISION_DETAIL_POLICY', 'size').lower()
+
+# Распознавание штрихкода и запрос к модели выполняются одновременно
+PARALLEL_RECOGNITION = os.getenv('PARALLEL_RECOGNITION', 'false').lower() == 'true'
+RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', 8))
+
+# Асинхронный клиент AITunnel (AsyncOpenAI в отдельном цикле событий)
+AITUNNEL_ASYNC_CLIENT = os.getenv('AITUNNEL_ASYNC_CLIENT', 'false').lower() == 'true'
+AITUNNEL_MAX_CONCURRENCY = int(os.getenv('AITUNNEL_MAX_CONCURRENCY', 16))  # Одновременных запросов к модели
+AITUNNEL_REQUEST_TIMEOUT = float(os.getenv('AITUNNEL_REQUEST_TIMEOUT', 30))  # Таймаут одной попытки, сек
+AITUNNEL_DEADLINE = float(os.getenv('AITUNNEL_DEADLINE', 60))  # Общий срок с учетом повторов и ожидания, сек
+AITUNNEL_MAX_RETRIES = int(os.getenv('AITUNNEL_MAX_RETRIES', 3))
+
+# Создавать клиентов внешних сервисов (Google Vision и др.) при запуске, а не при первом запросе
+PROVIDERS_WARM_UP = os.getenv('PROVIDERS_WARM_UP', 'false').lower() == 'true'
+
+# Предохранители (circuit breaker) для внешних провайдеров
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW', 20))  # Последних вызовов в оценке
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', 5))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', 0.5))  # Доля ошибок и медленных вызовов
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', 30))  # Сек до пробного вызова
+
+# Дублирующий запрос к резервному провайдеру, если основной отвечает дольше p95
+HEDGED_REQUESTS = os.getenv('HEDGED_REQUESTS', 'true').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 0.95))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))  # Меньше замеров - без дублирования
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 2))  # Нижняя граница задержки, сек
+
 # Токен бота Telegram
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
@@ -37,6 +73,23 @@ WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')
 WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
 WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
 
+# Асинхронная обработка обновлений: webhook сразу отвечает 200,
+# а обновления разбирает пул рабочих потоков из ограниченной очереди
+ASYNC_UPDATES = os.getenv('ASYNC_UPDATES', 'false').lower() == 'true'
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 4))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 100))
+
+# Отсев повторно доставленных обновлений по update_id
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', 10000))
+UPDATE_DEDUP_STATE_FILE = os.getenv('UPDATE_DEDUP_STATE_FILE', 'data/update_dedup.json')
+
+# Общий пул HTTP-соединений (Telegram, Edadeal, OpenFoodFacts)
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # Количество хостов
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))  # Соединений на хост
+HTTP_KEEP_ALIVE = os.getenv('HTTP_KEEP_ALIVE', 'true').lower() == 'true'
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 15))
+
 # Путь к SSL-сертификатам (для продакшена)
 WEBHOOK_SSL_CERT = os.getenv('WEBHOOK_SSL_CERT')
 WEBHOOK_SSL_PRIV = os.getenv('WEBHOOK_SSL_PRIV')
@@ -45,6 +98,71 @@ WEBHOOK_SSL_PRIV = os.getenv('WEBHOOK_SSL_PRIV')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE = os.getenv('LOG_FILE', 'logs/bot.log')
 
+# Кэш результатов анализа фотографий (по хэшу содержимого и file_unique_id)
+PHOTO_CACHE_SIZE = int(os.getenv('PHOTO_CACHE_SIZE', 1000))
+PHOTO_CACHE_TTL = int(os.getenv('PHOTO_CACHE_TTL', 7 * 24 * 3600))  # 7 дней
+PHOTO_CACHE_DB = os.getenv('PHOTO_CACHE_DB')  # Например, data/photo_cache.db; пусто - только память
+
+# Локальная база продуктов по штрихкоду (SQLite) и старая база в JSON для однократного переноса
+BARCODE_DB_PATH = os.getenv('BARCODE_DB_PATH', 'data/barcodes.db')
+BARCODE_JSON_PATH = os.getenv('BARCODE_JSON_PATH', 'data/barcodes.json')
+# Фильтр Блума по штрихкодам локальной базы: неизвестные штрихкоды отсеиваются без запроса к базе.
+# Память - около 1.2 МБ на миллион штрихкодов при доле ложных срабатываний 1% (0.1% - 1.8 МБ)
+BARCODE_BLOOM_FILTER = os.getenv('BARCODE_BLOOM_FILTER', 'true').lower() == 'true'
+BARCODE_BLOOM_PATH = os.getenv('BARCODE_BLOOM_PATH', 'data/barcodes.bloom')
+BARCODE_BLOOM_CAPACITY = int(os.getenv('BARCODE_BLOOM_CAPACITY', 1000000))
+BARCODE_BLOOM_ERROR_RATE = float(os.getenv('BARCODE_BLOOM_ERROR_RATE', 0.01))
+# Локальное распознавание штрихкодов (pyzbar) в пуле процессов; 0 - в потоке обработчика.
+# Необязательные проходы после пирамиды размеров: contrast (автоконтраст), rotate (наклон ±45°)
+BARCODE_DECODE_WORKERS = int(os.getenv('BARCODE_DECODE_WORKERS', 2))
+BARCODE_DECODE_TIMEOUT = float(os.getenv('BARCODE_DECODE_TIMEOUT', 5))  # сек
+BARCODE_DECODE_PASSES = tuple(name.strip() for name in os.getenv('BARCODE_DECODE_PASSES', 'contrast,rotate').split(',')
+                              if name.strip())
+# Быстрая проверка "похоже ли фото на штрихкод" перед платным Google Vision OCR (pyzbar
+# выполняется всегда). off - не проверять; shadow - только считать оценку и метрики
+# (barcode_classifier_would_skip / _would_miss), OCR вызывается как раньше; on - не вызывать
+# OCR при оценке ниже порога. Включать on только после проверки модели на реальных фото
+# (python -m food_recognition.barcode_classifier eval); обученная модель берется из BARCODE_CLASSIFIER_MODEL
+BARCODE_CLASSIFIER = os.getenv('BARCODE_CLASSIFIER', 'shadow').lower()
+BARCODE_CLASSIFIER_THRESHOLD = float(os.getenv('BARCODE_CLASSIFIER_THRESHOLD', 0.2))
+BARCODE_CLASSIFIER_MODEL = os.getenv('BARCODE_CLASSIFIER_MODEL', 'data/barcode_classifier.json')
+# Кэш поиска продуктов по штрихкоду в памяти: найденные продукты и штрихкоды,
+# которых нет ни в одном источнике (их повторно ищем реже, чем раз в BARCODE_NEGATIVE_CACHE_TTL)
+BARCODE_CACHE_SIZE = int(os.getenv('BARCODE_CACHE_SIZE', 10000))
+BARCODE_CACHE_TTL = int(os.getenv('BARCODE_CACHE_TTL', 24 * 3600))  # 1 день
+BARCODE_NEGATIVE_CACHE_TTL = int(os.getenv('BARCODE_NEGATIVE_CACHE_TTL', 3600))  # 1 час
+
+# Внешние сервисы штрихкодов опрашиваются одновременно; порядок в списке - приоритет
+BARCODE_PROVIDERS = [name.strip() for name in os.getenv('BARCODE_PROVIDERS', 'edadeal,openfoodfacts').split(',')
+                     if name.strip()]
+BARCODE_PROVIDER_TIMEOUT = float(os.getenv('BARCODE_PROVIDER_TIMEOUT', 5))  # Таймаут одного сервиса, сек
+BARCODE_LOOKUP_DEADLINE = float(os.getenv('BARCODE_LOOKUP_DEADLINE', 6))  # Общий срок поиска, сек
+# Сервис, у которого p95 времени ответа во столько раз больше, чем у самого быстрого,
+# опускается в конец списка приоритетов (решение принимается по BARCODE_DEMOTE_MIN_SAMPLES замерам)
+BARCODE_DEMOTE_LATENCY_RATIO = float(os.getenv('BARCODE_DEMOTE_LATENCY_RATIO', 2))
+BARCODE_DEMOTE_MIN_SAMPLES = int(os.getenv('BARCODE_DEMOTE_MIN_SAMPLES', 20))
+
+# Кэш поиска КБЖУ по введенному названию блюда (по нормализованному тексту)
+DISH_CACHE_SIZE = int(os.getenv('DISH_CACHE_SIZE', 5000))
+DISH_CACHE_TTL = int(os.getenv('DISH_CACHE_TTL', 30 * 24 * 3600))  # 30 дней
+DISH_CACHE_DB = os.getenv('DISH_CACHE_DB', 'data/dish_cache.db')  # Пусто - только память
+# Оценочные результаты (блюда нет в базе) храним недолго: блюдо могут добавить в базу
+DISH_CACHE_ESTIMATED_TTL = int(os.getenv('DISH_CACHE_ESTIMATED_TTL', 3600))  # 1 час
+
+# Бинарная база пищевой ценности (собирается командой python -m food_recognition.food_db build)
+FOOD_DB_PATH = os.getenv('FOOD_DB_PATH', 'data/food_db.bin')
+# Минимальная уверенность поиска по названию с опечатками (1 - расстояние / длина названия)
+FUZZY_MATCH_MIN_CONFIDENCE = float(os.getenv('FUZZY_MATCH_MIN_CONFIDENCE', 0.7))
+
+# Поиск почти одинаковых фотографий по перцептивному хэшу перед запросом к модели
+# (максимальное расстояние Хэмминга; отрицательное значение отключает поиск)
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 4))
+NEAR_DUPLICATE_INDEX_SIZE = int(os.getenv('NEAR_DUPLICATE_INDEX_SIZE', 200000))
+
+# Директория для сохранения присланных фотографий (только для отладки,
+# по умолчанию фотографии обрабатываются в памяти и на диск не пишутся)
+DEBUG_PHOTOS_DIR = os.getenv('DEBUG_PHOTOS_DIR')
+
 # Директория для резервного копирования
 BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
 
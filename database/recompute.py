@@ -0,0 +1,324 @@
+"""
+Пересчет КБЖУ в сохраненных анализах (food_analyses) после исправления
+базы пищевой ценности
+
+Записи читаются порциями по первичному ключу (WHERE id > последний
+обработанный ORDER BY id LIMIT порция), поэтому память не зависит от
+размера таблицы, а каждая порция - отдельная короткая транзакция, которая
+не блокирует работающего бота. Номер последней обработанной записи
+сохраняется в файл вместе с отпечатком снимка (см. ниже), и прерванный
+пересчет продолжается с того же места. Контрольная точка другого снимка или
+законченного пересчета не используется: пересчет идет с начала.
+
+В таблице хранятся не только значения калькулятора: там же оценки модели
+для целого блюда и данные продуктов по штрихкоду, а источник записи не
+сохраняется. Поэтому перед исправлением базы делается снимок старых КБЖУ
+на 100 г для всех названий из таблицы, и пересчитываются только записи,
+значения которых совпадают со снимком (старое значение, умноженное на вес
+порции), то есть посчитаны калькулятором по старой базе. Новые значения -
+КБЖУ на 100 г из новой базы, умноженные на вес порции. Записываются только
+изменившиеся строки.
+
+Запуск из корня проекта:
+    # до обновления NUTRITION_DB / FOOD_DB_PATH
+    python -m database.recompute --snapshot data/nutrition_snapshot.json
+    # после обновления
+    python -m database.recompute --previous data/nutrition_snapshot.json --dry-run
+    python -m database.recompute --previous data/nutrition_snapshot.json --chunk-size 5000 --pause 0.2
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from sqlalchemy import select, update, bindparam
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import FoodAnalysis
+from database.db_manager import engine
+from food_recognition.nutrition_calc import NutritionCalculator
+from utils.cache import LRUCache
+
+DEFAULT_CHECKPOINT = 'data/recompute_checkpoint.json'
+# Значения хранятся с точностью до 0.1 - меньшие расхождения не считаем изменением
+CHANGE_TOLERANCE = 0.05
+NUTRIENT_COLUMNS = ('calories', 'proteins', 'fats', 'carbs')
+
+def resolve_exact(food_name):
+    """
+    КБЖУ на 100 г только при точном совпадении нормализованного названия
+    с ключом встроенного словаря или внешней базы
+
+    Args:
+        food_name (str): Сохраненное название блюда
+
+    Returns:
+        list: [калории, белки, жиры, углеводы] или None
+    """
+    food_name_norm = NutritionCalculator.normalize_food_name(food_name)
+    if food_name_norm in NutritionCalculator.NUTRITION_DB:
+        return NutritionCalculator.NUTRITION_DB[food_name_norm]
+    food_db = NutritionCalculator._food_db
+    if food_db is not None:
+        row = food_db.find_row(food_name_norm)
+        if row is not None:
+            return food_db.values(row)
+    return None
+
+def resolve_lookup(food_name):
+    """КБЖУ на 100 г через полный поиск (частичные совпадения и опечатки) или None"""
+    nutrition = NutritionCalculator.lookup_nutrition(food_name)
+    if nutrition.get('estimated', False):
+        return None
+    return [nutrition[column] for column in NUTRIENT_COLUMNS]
+
+def save_snapshot(path, engine=engine, exact=True):
+    """
+    Снимок текущих КБЖУ на 100 г для всех названий из food_analyses
+    (делается до обновления базы пищевой ценности)
+
+    Args:
+        path (str): Файл снимка (JSON)
+        engine: SQLAlchemy engine базы бота
+        exact (bool): Способ поиска названий (должен совпадать с пересчетом)
+
+    Returns:
+        int: Количество найденных названий
+    """
+    resolver = resolve_exact if exact else resolve_lookup
+    table = FoodAnalysis.__table__
+    values = {}
+    with engine.connect() as connection:
+        for (food_name,) in connection.execute(select(table.c.food_name).distinct()):
+            if food_name and food_name not in values:
+                found = resolver(food_name)
+                if found:
+                    values[food_name] = [float(value) for value in found]
+    save_checkpoint(path, {'match': 'exact' if exact else 'lookup', 'values': values})
+    return len(values)
+
+def load_snapshot(path, exact=True):
+    """
+    Снимок КБЖУ на 100 г до обновления базы
+
+    Returns:
+        dict: {название: [калории, белки, жиры, углеводы]}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if snapshot.get('match') != ('exact' if exact else 'lookup'):
+        raise ValueError(f"Снимок {path} сделан с --match {snapshot.get('match')}")
+    return snapshot['values']
+
+def snapshot_fingerprint(previous, exact=True):
+    """Отпечаток снимка для проверки, к какому пересчету относится контрольная точка"""
+    payload = json.dumps([exact, previous], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def load_checkpoint(path, fingerprint=None):
+    """
+    Состояние прерванного пересчета или пустое состояние
+
+    Args:
+        path (str): Файл контрольной точки
+        fingerprint (str, optional): Отпечаток текущего снимка
+
+    Returns:
+        dict: Состояние; пустое, если точки нет, она от другого снимка
+              или пересчет по ней уже закончен
+    """
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('snapshot') == fingerprint and not state.get('finished'):
+            return state
+        print(f"Контрольная точка {path} от другого снимка или законченного пересчета - начинаем сначала")
+    return {'last_id': 0, 'scanned': 0, 'updated': 0, 'snapshot': fingerprint}
+
+def save_checkpoint(path, state):
+    """Атомарная запись состояния (через временный файл)"""
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+class AnalysisRecompute:
+    """Пересчет сохраненных анализов порциями с продолжением по контрольной точке"""
+
+    def __init__(self, previous, engine=engine, chunk_size=2000, exact=True, dry_run=False,
+                 checkpoint_path=DEFAULT_CHECKPOINT, pause=0.0, name_cache_size=50000):
+        """
+        Args:
+            previous (dict): КБЖУ на 100 г до обновления базы (см. save_snapshot);
+                             пересчитываются только записи, посчитанные по этим значениям
+            engine: SQLAlchemy engine базы бота
+            chunk_size (int): Записей в одной порции (и в одной транзакции)
+            exact (bool): Только точные совпадения названий; False - полный поиск
+            dry_run (bool): Только посчитать изменения, не записывая их
+            checkpoint_path (str): Файл контрольной точки (None - без продолжения)
+            pause (float): Пауза между порциями, сек (чтобы не мешать боту)
+            name_cache_size (int): Сколько найденных названий помнить между порциями
+        """
+        self.previous = previous
+        self.fingerprint = snapshot_fingerprint(previous, exact)
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.resolver = resolve_exact if exact else resolve_lookup
+        self.dry_run = dry_run
+        self.checkpoint_path = checkpoint_path
+        self.pause = pause
+        self.names = LRUCache(max_size=name_cache_size, name='recompute_names')
+
+        table = FoodAnalysis.__table__
+        self.select_chunk = (
+            select(table.c.id, table.c.food_name, table.c.portion_weight,
+                   table.c.calories, table.c.proteins, table.c.fats, table.c.carbs)
+            .where(table.c.id > bindparam('last_id'))
+            .order_by(table.c.id)
+            .limit(bindparam('chunk_size'))
+        )
+        # Массовое обновление: один запрос, параметры для каждой строки (executemany)
+        self.update_rows = (
+            update(table)
+            .where(table.c.id == bindparam('row_id'))
+            .values({column: bindparam(f'new_{column}') for column in NUTRIENT_COLUMNS})
+        )
+
+    def resolve(self, food_name):
+        """КБЖУ на 100 г для названия (с кэшем между порциями); пустой список - не найдено"""
+        values = self.names.get(food_name, track=False)
+        if values is None:
+            values = (self.resolver(food_name) if food_name else None) or []
+            self.names.set(food_name, list(values))
+        return values
+
+    def compute_changes(self, rows):
+        """
+        Новые значения для порции записей
+
+        Args:
+            rows (list): Записи (id, food_name, portion_weight, calories, proteins, fats, carbs)
+
+        Returns:
+            list: Параметры UPDATE для изменившихся записей
+        """
+        ids, per_100g, old_per_100g, portions, stored = [], [], [], [], []
+        for row in rows:
+            old_values = self.previous.get(row.food_name)
+            if not old_values:
+                continue
+            values = self.resolve(row.food_name)
+            if not values:
+                continue
+            ids.append(row.id)
+            per_100g.append(values)
+            old_per_100g.append(old_values)
+            portions.append(row.portion_weight or 100)
+            stored.append([np.nan if getattr(row, column) is None else getattr(row, column)
+                           for column in NUTRIENT_COLUMNS])
+        if not ids:
+            return []
+
+        scale = np.array(portions, dtype=np.float64)[:, None] / 100
+        new_values = np.round(np.array(per_100g, dtype=np.float64) * scale, 1)
+        old_values = np.round(np.array(old_per_100g, dtype=np.float64) * scale, 1)
+        stored_values = np.array(stored, dtype=np.float64)
+        # Трогаем только записи, посчитанные калькулятором по старой базе: оценки
+        # модели и данные штрихкодов со старыми значениями не совпадают
+        # (NaN - пустое значение в базе - тоже не совпадает)
+        calculated = (np.abs(old_values - stored_values) <= CHANGE_TOLERANCE).all(axis=1)
+        changed = calculated & ~(np.abs(new_values - stored_values) <= CHANGE_TOLERANCE).all(axis=1)
+
+        return [
+            dict({'row_id': ids[i]},
+                 **{f'new_{column}': float(new_values[i, j]) for j, column in enumerate(NUTRIENT_COLUMNS)})
+            for i in np.flatnonzero(changed)
+        ]
+
+    def run(self, restart=False, limit=None):
+        """
+        Пересчет всех записей после контрольной точки
+
+        Args:
+            restart (bool): Начать сначала, игнорируя контрольную точку
+            limit (int, optional): Остановиться после стольких просмотренных записей
+
+        Returns:
+            dict: Состояние: last_id, scanned, updated, snapshot, finished
+        """
+        state = load_checkpoint(None if restart else self.checkpoint_path, self.fingerprint)
+        scanned_in_run = 0
+        started = time.time()
+
+        while limit is None or scanned_in_run < limit:
+            with self.engine.connect() as connection:
+                rows = connection.execute(self.select_chunk, {
+                    'last_id': state['last_id'], 'chunk_size': self.chunk_size
+                }).fetchall()
+            if not rows:
+                # Весь проход сделан: следующий запуск (с новым снимком) начнется сначала
+                state['finished'] = True
+                if not self.dry_run:
+                    save_checkpoint(self.checkpoint_path, state)
+                break
+
+            changes = self.compute_changes(rows)
+            if changes and not self.dry_run:
+                # Отдельная короткая транзакция на порцию
+                with self.engine.begin() as connection:
+                    connection.execute(self.update_rows, changes)
+
+            state['last_id'] = rows[-1].id
+            state['scanned'] += len(rows)
+            state['updated'] += len(changes)
+            scanned_in_run += len(rows)
+            if not self.dry_run:
+                save_checkpoint(self.checkpoint_path, state)
+
+            elapsed = time.time() - started
+            print(f"До id={state['last_id']}: просмотрено {state['scanned']}, "
+                  f"изменено {state['updated']} ({scanned_in_run / max(elapsed, 1e-6):.0f} записей/с)")
+            if self.pause:
+                time.sleep(self.pause)
+
+        return state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пересчет КБЖУ в сохраненных анализах")
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help="Сохранить КБЖУ до обновления базы в файл и выйти")
+    parser.add_argument('--previous', metavar='PATH', help="Снимок КБЖУ до обновления базы (--snapshot)")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="Записей в порции")
+    parser.add_argument('--match', choices=('exact', 'lookup'), default='exact',
+                        help="exact - только точные совпадения названий, lookup - полный поиск")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Файл контрольной точки")
+    parser.add_argument('--restart', action='store_true', help="Начать сначала")
+    parser.add_argument('--dry-run', action='store_true', help="Не записывать изменения")
+    parser.add_argument('--pause', type=float, default=0.0, help="Пауза между порциями, сек")
+    parser.add_argument('--limit', type=int, help="Максимум записей за запуск")
+    args = parser.parse_args(argv)
+    exact = args.match == 'exact'
+
+    if args.snapshot:
+        count = save_snapshot(args.snapshot, exact=exact)
+        print(f"Снимок сохранен в {args.snapshot}: названий {count}")
+        return
+    if not args.previous:
+        parser.error("нужен --previous: снимок КБЖУ до обновления базы (см. --snapshot)")
+
+    job = AnalysisRecompute(load_snapshot(args.previous, exact), chunk_size=args.chunk_size, exact=exact,
+                            dry_run=args.dry_run, checkpoint_path=args.checkpoint, pause=args.pause)
+    state = job.run(restart=args.restart, limit=args.limit)
+    action = "нужно изменить" if args.dry_run else "изменено"
+    print(f"Готово: просмотрено {state['scanned']}, {action} {state['updated']}")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,40 @@
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
 from typing import Dict, Any, List, Optional
-from food_recognition.barcode_scanner import BarcodeScanner
 
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from food_recognition.aitunnel_vision_api import AITunnelVisionFoodRecognition
+from food_recognition.providers import providers
 from food_recognition.nutrition_calc import NutritionCalculator
+from food_recognition.dish_cache import dish_cache
+from food_recognition.image_buffer import ImageBuffer
+from food_recognition.result_cache import PhotoResultCache
+from food_recognition.perceptual_hash import NearDuplicateIndex
+from monitoring.metrics import metrics_collector
+from utils.circuit_breaker import circuit_breakers
+from config import (
+    NEAR_DUPLICATE_MAX_DISTANCE, NEAR_DUPLICATE_INDEX_SIZE,
+    PARALLEL_RECOGNITION, RECOGNITION_WORKERS,
+    HEDGED_REQUESTS, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY
+)
+
+# Пул потоков для распознавания еды параллельно с распознаванием штрихкода
+recognition_executor = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS, thread_name_prefix='recognition')
+
+# Пул потоков для вызовов провайдеров при дублирующих запросах. Отдельный от
+# recognition_executor: задачи из него сами ждут эти вызовы
+provider_executor = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS, thread_name_prefix='provider')
+
+UNKNOWN_DISH_RESULT = {
+    'name': 'Неизвестное блюдо',
+    'calories': 0,
+    'proteins': 0,
+    'fats': 0,
+    'carbs': 0,
+    'estimated': True
+}
 
 class AITunnelNutritionAdapter:
     """
@@ -15,22 +43,178 @@ class AITunnelNutritionAdapter:
     """
     
     def __init__(self):
-        self.aitunnel_vision = AITunnelVisionFoodRecognition()
-        self.barcode_scanner = BarcodeScanner()  # Добавляем сканер штрихкодов
+        # Клиенты общие для всего процесса (см. food_recognition.providers)
+        self.aitunnel_vision = providers.get('aitunnel_vision')
+        self.barcode_scanner = providers.get('barcode_scanner')
+        self.result_cache = PhotoResultCache()  # Кэш результатов по содержимому фото
+        
+        # Индекс перцептивных хэшей для почти одинаковых фото (хэш -> ключ в кэше результатов)
+        self.near_duplicates = None
+        if NEAR_DUPLICATE_MAX_DISTANCE >= 0:
+            self.near_duplicates = NearDuplicateIndex(
+                max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+                max_entries=NEAR_DUPLICATE_INDEX_SIZE
+            )
+            metrics_collector.register_gauge_provider(
+                lambda: {'near_duplicate_index_size': len(self.near_duplicates)}
+            )
+    
+    def get_cached_result(self, file_unique_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Поиск готового результата по Telegram file_unique_id до загрузки фотографии
+        
+        Args:
+            file_unique_id (str): Уникальный идентификатор файла в Telegram
+            
+        Returns:
+            dict: Результат предыдущего анализа или None
+        """
+        return self.result_cache.get_by_file_id(file_unique_id)
     
-    def process_image(self, image_path: Optional[str] = None, image_content: Optional[bytes] = None) -> Dict[str, Any]:
+    def process_image(self, image_path: Optional[str] = None, image_content: Optional[bytes] = None,
+                      file_unique_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Обработка изображения для распознавания пищи или штрихкода
         
         Args:
             image_path (str, optional): Путь к файлу изображения
-            image_content (bytes, optional): Содержимое изображения в байтах
+            image_content (bytes | ImageBuffer, optional): Содержимое изображения
+            file_unique_id (str, optional): Уникальный идентификатор файла в Telegram
                 
         Returns:
             dict: Данные о пищевой ценности в стандартном формате
         """
+        # Загружаем изображение в память один раз и передаем один буфер во все этапы
+        try:
+            image_buffer = ImageBuffer.from_source(image_path, image_content)
+        except ValueError as e:
+            print(f"Ошибка в AITunnelNutritionAdapter.process_image: {str(e)}")
+            return None
+        
+        # Та же фотография уже анализировалась - отдаем готовый результат
+        content_hash = image_buffer.content_hash
+        cached_result = self.result_cache.get(content_hash)
+        if cached_result is not None:
+            if file_unique_id:
+                self.result_cache.remember_file_id(file_unique_id, content_hash)
+            return cached_result
+        
+        result = self._analyze_image(image_buffer)
+        
+        if self._is_cacheable(result):
+            self.result_cache.put(content_hash, result, file_unique_id)
+            # Штрихкоды в индекс не добавляем: разные штрихкоды выглядят почти одинаково
+            if self.near_duplicates is not None and not result.get('is_barcode'):
+                try:
+                    self.near_duplicates.add(image_buffer.perceptual_hash, content_hash)
+                except Exception as e:
+                    print(f"Ошибка при вычислении перцептивного хэша: {str(e)}")
+        
+        return result
+    
+    def _find_near_duplicate(self, image_buffer: ImageBuffer) -> Optional[Dict[str, Any]]:
+        """
+        Поиск результата для почти такой же фотографии (серия снимков, пережатая пересылка)
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            dict: Результат анализа похожей фотографии или None
+        """
+        if self.near_duplicates is None:
+            return None
+        
+        try:
+            similar_hash, distance = self.near_duplicates.find(image_buffer.perceptual_hash)
+        except Exception as e:
+            print(f"Ошибка при вычислении перцептивного хэша: {str(e)}")
+            return None
+        
+        # Результат мог быть уже вытеснен из кэша результатов
+        result = self.result_cache.get(similar_hash) if similar_hash else None
+        metrics_collector.increment('near_duplicate_miss' if result is None else 'near_duplicate_hit')
+        return result
+    
+    @staticmethod
+    def _is_cacheable(result: Optional[Dict[str, Any]]) -> bool:
+        """
+        Проверка, можно ли сохранить результат в кэш
+        
+        Args:
+            result (dict): Результат анализа
+            
+        Returns:
+            bool: False для сбоев распознавания и для ненайденных штрихкодов
+                (продукт может появиться в базе после ручного ввода)
+        """
+        if not result:
+            return False
+        if result.get('is_barcode'):
+            return not result.get('estimated', False)
+        return result.get('name') != 'Неизвестное блюдо'
+    
+    def _analyze_image(self, image_buffer: ImageBuffer) -> Dict[str, Any]:
+        """
+        Распознавание штрихкода или еды на изображении без учета кэша
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            dict: Данные о пищевой ценности в стандартном формате
+        """
+        if PARALLEL_RECOGNITION:
+            return self._analyze_image_parallel(image_buffer)
+        
         # Сначала пробуем распознать штрихкод
-        barcode = self.barcode_scanner.detect_barcode(image_path, image_content)
+        product_info = self._recognize_barcode(image_buffer)
+        if product_info:
+            return product_info
+        
+        # Если штрихкод не найден или не удалось получить информацию,
+        # продолжаем с распознаванием еды
+        return self._recognize_food(image_buffer)
+    
+    def _analyze_image_parallel(self, image_buffer: ImageBuffer) -> Dict[str, Any]:
+        """
+        Одновременное распознавание штрихкода и еды: запрос к модели стартует
+        сразу, не дожидаясь pyzbar и Google Vision OCR
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            dict: Данные о пищевой ценности в стандартном формате
+        """
+        start_time = time.time()
+        food_future = recognition_executor.submit(self._recognize_food, image_buffer)
+        
+        # Штрихкод распознаем в текущем потоке
+        product_info = self._recognize_barcode(image_buffer)
+        if product_info:
+            # Штрихкод приоритетнее: запрос к модели отменяем, если он еще не начался,
+            # иначе просто не используем его результат
+            if not food_future.cancel():
+                metrics_collector.increment('parallel_recognition_vision_discarded')
+            metrics_collector.track_timing('parallel_recognition_barcode', time.time() - start_time)
+            return product_info
+        
+        result = food_future.result()
+        metrics_collector.track_timing('parallel_recognition_food', time.time() - start_time)
+        return result
+    
+    def _recognize_barcode(self, image_buffer: ImageBuffer) -> Optional[Dict[str, Any]]:
+        """
+        Распознавание штрихкода и поиск продукта
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            dict: Информация о продукте с флагом is_barcode или None
+        """
+        barcode = self.barcode_scanner.detect_barcode(image_buffer=image_buffer)
         
         if barcode:
             # Если штрихкод найден, получаем информацию о продукте
@@ -39,15 +223,125 @@ class AITunnelNutritionAdapter:
                 # Добавляем флаг, что это штрихкод
                 product_info['is_barcode'] = True
                 return product_info
+        
+        return None
+    
+    def _recognize_food(self, image_buffer: ImageBuffer) -> Dict[str, Any]:
+        """
+        Распознавание еды на изображении
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
             
-        # Если штрихкод не найден или не удалось получить информацию,
-        # продолжаем с обычным распознаванием изображения
-        food_items = self.aitunnel_vision.detect_food(image_path, image_content)
+        Returns:
+            dict: Данные о пищевой ценности в стандартном формате
+        """
+        # Проверяем, не анализировали ли мы почти такую же фотографию
+        near_duplicate_result = self._find_near_duplicate(image_buffer)
+        if near_duplicate_result is not None:
+            return near_duplicate_result
+        
+        # AITunnel недоступен - сразу переходим к резервному методу
+        if not circuit_breakers.get('aitunnel_vision').allow_request():
+            metrics_collector.increment('aitunnel_vision_short_circuit')
+            return self._fallback_nutrition_calculation(image_buffer)
+        
+        food_items, fallback_future = self._detect_food_hedged(image_buffer)
         
         if not food_items:
             # Если AITunnel Vision не смог распознать еду, пробуем резервный метод
-            return self._fallback_nutrition_calculation(image_path, image_content)
+            # (если дублирующий запрос уже отправлен, ждем его результат)
+            if fallback_future is not None:
+                return self._hedged_fallback_result(fallback_future)
+            return self._fallback_nutrition_calculation(image_buffer)
+        
+        return self._build_food_result(food_items)
+    
+    @staticmethod
+    def _hedged_fallback_result(fallback_future) -> Dict[str, Any]:
+        """
+        Результат дублирующего запроса к резервному методу
+        
+        Args:
+            fallback_future: future резервного метода
+            
+        Returns:
+            dict: Данные о пищевой ценности (неизвестное блюдо, если резервный метод упал)
+        """
+        try:
+            return fallback_future.result()
+        except Exception as e:
+            print(f"Ошибка в резервном методе распознавания: {str(e)}")
+            return dict(UNKNOWN_DISH_RESULT)
+    
+    def _detect_food_hedged(self, image_buffer: ImageBuffer):
+        """
+        Запрос к AITunnel с дублированием в резервный метод, если ответ
+        задерживается дольше обычного (p95 времени ответа AITunnel)
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            tuple: (список продуктов от AITunnel или None, future резервного метода или None)
+        """
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return self.aitunnel_vision.detect_food(image_buffer=image_buffer), None
+        
+        # Асинхронный клиент ждет ответа в своем цикле событий, без отдельного потока
+        detect_food_future = getattr(self.aitunnel_vision, 'detect_food_future', None)
+        if detect_food_future is not None:
+            primary_future = detect_food_future(image_buffer)
+        else:
+            primary_future = provider_executor.submit(self.aitunnel_vision.detect_food, image_buffer=image_buffer)
+        try:
+            return primary_future.result(timeout=hedge_delay), None
+        except FutureTimeoutError:
+            pass
+        
+        metrics_collector.increment('vision_hedged_requests')
+        fallback_future = provider_executor.submit(self._fallback_nutrition_calculation, image_buffer)
+        wait([primary_future, fallback_future], return_when=FIRST_COMPLETED)
         
+        # Резервный метод ответил первым и что-то распознал - ответ AITunnel не ждем
+        # (запрос завершится в фоне и попадет в метрики и предохранитель).
+        # Упавший резервный метод не в счет: ждем AITunnel
+        if (not primary_future.done() and fallback_future.exception() is None
+                and fallback_future.result().get('name') != UNKNOWN_DISH_RESULT['name']):
+            metrics_collector.increment('vision_hedge_wins')
+            return None, fallback_future
+        
+        return primary_future.result(), fallback_future
+    
+    @staticmethod
+    def _hedge_delay() -> Optional[float]:
+        """
+        Задержка перед дублирующим запросом
+        
+        Returns:
+            float: p95 времени ответа AITunnel (не меньше HEDGE_MIN_DELAY) или None,
+                если дублирование выключено или замеров пока мало
+        """
+        if not HEDGED_REQUESTS:
+            return None
+        p95 = metrics_collector.get_response_time_percentile(
+            'aitunnel_vision', HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES
+        )
+        if p95 is None:
+            return None
+        return max(p95, HEDGE_MIN_DELAY)
+    
+    def _build_food_result(self, food_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Преобразование ответа AITunnel в стандартный формат
+        
+        Args:
+            food_items (list): Список обнаруженных продуктов
+            
+        Returns:
+            dict: Данные о пищевой ценности в стандартном формате
+        """
         # Берем первый (и обычно единственный) элемент из результатов
         food_item = food_items[0]
         
@@ -83,33 +377,27 @@ class AITunnelNutritionAdapter:
             # Если в ответе нет данных о КБЖУ, используем наш калькулятор
             return self._calculate_nutrition_from_name(food_item['name'])
     
-    def _fallback_nutrition_calculation(self, image_path: Optional[str], image_content: Optional[bytes]) -> Dict[str, Any]:
+    def _fallback_nutrition_calculation(self, image_buffer: ImageBuffer) -> Dict[str, Any]:
         """
         Резервный метод расчета питательной ценности с использованием существующего кода
         
         Args:
-            image_path (str, optional): Путь к файлу изображения
-            image_content (bytes, optional): Содержимое изображения в байтах
+            image_buffer (ImageBuffer): Изображение в памяти
             
         Returns:
             dict: Данные о пищевой ценности
         """
-        # Здесь можно использовать ваш существующий код для распознавания пищи
-        # Например, через Google Vision API
-        from food_recognition.vision_api import FoodRecognition
+        # Google Vision недоступен - не тратим время на заведомо неудачный вызов
+        if not circuit_breakers.get('google_vision').allow_request():
+            metrics_collector.increment('google_vision_short_circuit')
+            return dict(UNKNOWN_DISH_RESULT)
         
-        vision_api = FoodRecognition()
-        food_items = vision_api.detect_food(image_path, image_content)
+        # Google Vision через общий клиент: gRPC-канал создается один раз
+        vision_api = providers.get('food_recognition')
+        food_items = vision_api.detect_food(image_buffer=image_buffer)
         
         if not food_items:
-            return {
-                'name': 'Неизвестное блюдо',
-                'calories': 0,
-                'proteins': 0,
-                'fats': 0,
-                'carbs': 0,
-                'estimated': True
-            }
+            return dict(UNKNOWN_DISH_RESULT)
         
         # Используем существующий калькулятор КБЖУ
         return NutritionCalculator.calculate_nutrition(food_items)
@@ -124,8 +412,8 @@ class AITunnelNutritionAdapter:
         Returns:
             dict: Данные о пищевой ценности
         """
-        # Используем существующий калькулятор КБЖУ
-        nutrition = NutritionCalculator.lookup_nutrition(food_name)
+        # Используем существующий калькулятор КБЖУ через кэш по названию
+        nutrition = dish_cache.lookup(food_name)
         
         # Добавляем detected_items для совместимости
         if 'detected_items' not in nutrition:
@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import asyncio
+import random
+import concurrent.futures
+import openai
+from openai import AsyncOpenAI
+from typing import Optional, List, Dict, Any
+from monitoring.decorators import track_api_call
+from monitoring.metrics import metrics_collector
+from utils.async_runner import async_runner
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    AITUNNEL_API_KEY, VISION_DETAIL_POLICY, AITUNNEL_MAX_CONCURRENCY,
+    AITUNNEL_REQUEST_TIMEOUT, AITUNNEL_DEADLINE, AITUNNEL_MAX_RETRIES
+)
+from food_recognition.image_buffer import ImageBuffer
+from food_recognition.aitunnel_vision_api import AITunnelVisionFoodRecognition
+
+# Ошибки, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # включая APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+# Начальная задержка перед повтором и множитель экспоненциального отступа
+RETRY_DELAY = 2
+BACKOFF_FACTOR = 2
+
+# Общий для всех экземпляров лимит одновременных запросов к модели.
+# Создается при первом запросе внутри цикла событий async_runner.
+_vision_semaphore = None
+_in_flight = 0
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _vision_semaphore
+    if _vision_semaphore is None:
+        _vision_semaphore = asyncio.Semaphore(AITUNNEL_MAX_CONCURRENCY)
+    return _vision_semaphore
+
+class AsyncAITunnelVisionFoodRecognition(AITunnelVisionFoodRecognition):
+    """
+    Распознавание еды через AITunnel на AsyncOpenAI.
+
+    Запросы выполняются в общем фоновом цикле событий: ожидание ответа и
+    паузы между повторами не занимают потоки, число одновременных запросов
+    ограничено глобальным семафором, а у каждого вызова есть общий срок.
+    Подготовка изображения и разбор ответа - как в синхронном клиенте.
+    """
+
+    def __init__(self):
+        self.api_key = AITUNNEL_API_KEY
+        if not self.api_key:
+            raise ValueError("AITUNNEL_API_KEY не задан в конфигурации")
+
+        # Повторы выполняем сами, без блокирующих пауз внутри клиента
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url='https://api.aitunnel.ru/v1/',
+            timeout=AITUNNEL_REQUEST_TIMEOUT,
+            max_retries=0
+        )
+
+        self.model = "gpt-4o"
+        metrics_collector.register_gauge_provider(lambda: {'aitunnel_vision_in_flight': _in_flight})
+
+    @track_api_call('aitunnel_vision', none_is_error=True)
+    def detect_food(self, image_path: Optional[str] = None, image_content: Optional[bytes] = None,
+                    image_buffer: Optional[ImageBuffer] = None) -> List[Dict[str, Any]]:
+        """
+        Синхронная обертка над detect_food_async для обработчиков бота
+
+        Args:
+            image_path (str, optional): Путь к файлу изображения
+            image_content (bytes, optional): Содержимое изображения в байтах
+            image_buffer (ImageBuffer, optional): Уже загруженное в память изображение
+
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ или None
+        """
+        try:
+            if image_buffer is None:
+                image_buffer = ImageBuffer.from_source(image_path, image_content)
+            # Небольшой запас сверх срока: по истечении срока корутина завершится сама
+            return async_runner.run(self.detect_food_async(image_buffer), timeout=AITUNNEL_DEADLINE + 1)
+        except concurrent.futures.TimeoutError:
+            metrics_collector.increment('aitunnel_vision_deadline_exceeded')
+            print("Ошибка в AsyncAITunnelVisionFoodRecognition.detect_food: превышен срок ожидания")
+            return None
+        except Exception as e:
+            print(f"Ошибка в AsyncAITunnelVisionFoodRecognition.detect_food: {str(e)}")
+            return None
+
+    def detect_food_future(self, image_buffer: ImageBuffer) -> concurrent.futures.Future:
+        """
+        Запуск распознавания без ожидания результата: пока запрос идет,
+        вызывающий поток не занят (см. дублирование запросов в aitunnel_adapter)
+
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+
+        Returns:
+            concurrent.futures.Future: Список продуктов или None (исключений не бывает)
+        """
+        return async_runner.submit(self._detect_food_tracked(image_buffer))
+
+    async def _detect_food_tracked(self, image_buffer: ImageBuffer) -> Optional[List[Dict[str, Any]]]:
+        """detect_food_async с теми же метриками, что у detect_food"""
+        start_time = time.time()
+        food_items = None
+        try:
+            food_items = await self.detect_food_async(image_buffer)
+        except Exception as e:
+            print(f"Ошибка в AsyncAITunnelVisionFoodRecognition.detect_food: {str(e)}")
+        metrics_collector.track_api_call('aitunnel_vision', time.time() - start_time, food_items is None)
+        return food_items
+
+    async def detect_food_async(self, image_buffer: ImageBuffer,
+                                deadline: float = AITUNNEL_DEADLINE) -> Optional[List[Dict[str, Any]]]:
+        """
+        Распознавание пищи на изображении с общим сроком на все попытки
+
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            deadline (float): Общий срок в секундах, включая ожидание семафора и повторы
+
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ или None
+        """
+        try:
+            return await asyncio.wait_for(self._detect(image_buffer), timeout=deadline)
+        except asyncio.TimeoutError:
+            metrics_collector.increment('aitunnel_vision_deadline_exceeded')
+            print(f"Ошибка в AsyncAITunnelVisionFoodRecognition: превышен срок {deadline} с")
+            return None
+
+    async def _detect(self, image_buffer: ImageBuffer) -> List[Dict[str, Any]]:
+        """Выбор уровня детализации по политике VISION_DETAIL_POLICY"""
+        if VISION_DETAIL_POLICY == 'retry':
+            # Сначала дешевый запрос с низкой детализацией, при неуверенном ответе - высокая
+            food_items = await self._detect_with_retries(image_buffer, 'low')
+            if self._is_low_confidence(food_items):
+                metrics_collector.increment('aitunnel_vision_detail_escalations')
+                food_items = await self._detect_with_retries(image_buffer, 'high')
+            return food_items
+
+        detail = await self._run_blocking(self._choose_detail, image_buffer)
+        return await self._detect_with_retries(image_buffer, detail)
+
+    async def _detect_with_retries(self, image_buffer: ImageBuffer, detail: str) -> List[Dict[str, Any]]:
+        """
+        Запрос к модели с повторами и неблокирующим экспоненциальным отступом
+
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            detail (str): Уровень детализации 'low' или 'high'
+
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ
+        """
+        # Уменьшение и пережатие - работа для CPU, не держим на ней цикл событий
+        request = await self._run_blocking(self._build_request, image_buffer, detail)
+
+        delay = RETRY_DELAY
+        for attempt in range(AITUNNEL_MAX_RETRIES + 1):
+            try:
+                return await self._request(request, detail)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= AITUNNEL_MAX_RETRIES:
+                    raise
+                metrics_collector.increment('aitunnel_vision_retries')
+                print(f"Попытка {attempt + 1}/{AITUNNEL_MAX_RETRIES} запроса к AITunnel: {str(e)}. "
+                      f"Повтор через {delay} с")
+                # Случайный разброс, чтобы повторы после общего сбоя не шли одной волной
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay *= BACKOFF_FACTOR
+
+    async def _request(self, request: Dict[str, Any], detail: str) -> List[Dict[str, Any]]:
+        """
+        Одна попытка запроса с ограничением по семафору и таймаутом
+
+        Args:
+            request (dict): Параметры chat.completions.create
+            detail (str): Уровень детализации (для метрик)
+
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ
+        """
+        global _in_flight
+        async with _get_semaphore():
+            _in_flight += 1
+            start_time = time.time()
+            try:
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(**request),
+                    timeout=AITUNNEL_REQUEST_TIMEOUT
+                )
+            finally:
+                _in_flight -= 1
+            metrics_collector.track_timing(f'aitunnel_vision_{detail}', time.time() - start_time)
+
+        message_content = response.choices[0].message.content.strip()
+        return self._parse_response(message_content)
+
+    @staticmethod
+    async def _run_blocking(func, *args):
+        """Выполнение блокирующей функции в пуле потоков цикла событий"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
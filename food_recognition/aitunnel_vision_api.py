@@ -4,6 +4,7 @@ import base64
 import requests
 import json
 import re
+import time
 from openai import OpenAI
 from typing import Optional, List, Dict, Any
 from utils.api_helpers import retry_on_exception
@@ -12,7 +13,50 @@ from monitoring.metrics import metrics_collector
 
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import AITUNNEL_API_KEY
+from config import (
+    AITUNNEL_API_KEY, VISION_MAX_LONG_EDGE, VISION_LOW_DETAIL_MAX_EDGE,
+    VISION_JPEG_QUALITY, VISION_DETAIL_POLICY
+)
+from food_recognition.image_buffer import ImageBuffer
+from food_recognition.image_preprocessing import prepare_for_vision
+
+# Инструкция для модели с запросом определить еду и КБЖУ
+FOOD_ANALYSIS_PROMPT = """
+            Ты эксперт-диетолог с обширными знаниями о пищевой ценности продуктов.
+            Проанализируй это изображение и определи, какая еда на нем показана.
+            
+            Важно:
+            1. Если на изображении нет еды, укажи "Еда не обнаружена" в поле name и верни пустые значения
+            2. Если еда есть, определи как можно точнее, что это за блюдо/продукт
+            3. Укажи основные ингредиенты
+            4. Оцени приблизительный вес всей порции в граммах
+            5. Рассчитай пищевую ценность ВСЕЙ порции (не на 100г):
+               - Калории (ккал)
+               - Белки (г)
+               - Жиры (г)
+               - Углеводы (г)
+            6. Оцени свою уверенность в названии блюда и весе порции числом от 0 до 1
+               (меньше 0.6 - если блюдо плохо видно или его трудно определить)
+            
+            Верни ответ только в таком формате JSON:
+            {
+                "name": "Название блюда",
+                "has_food": true/false,
+                "ingredients": ["ингредиент1", "ингредиент2", ...],
+                "portion_weight": число_в_граммах,
+                "confidence": число_от_0_до_1,
+                "nutrition": {
+                    "calories": число,
+                    "proteins": число,
+                    "fats": число,
+                    "carbs": число
+                }
+            }
+            """
+
+# Уверенность модели (поле confidence ответа), ниже которой при политике 'retry'
+# запрос повторяется с высокой детализацией
+LOW_CONFIDENCE_THRESHOLD = 0.6
 
 class AITunnelVisionFoodRecognition:
     """Класс для распознавания еды с использованием GPT-4 Vision через AITunnel API"""
@@ -32,165 +76,242 @@ class AITunnelVisionFoodRecognition:
         self.model = "gpt-4o"  # или "gpt-4-vision-preview" в зависимости от доступных моделей
 
     @track_api_call('aitunnel_encode_image')
-    def _encode_image(self, image_path: str) -> str:
+    def _encode_image(self, image_bytes: bytes) -> str:
         """
         Кодирование изображения в base64 для отправки в API
         
         Args:
-            image_path (str): Путь к файлу изображения
+            image_bytes (bytes): Подготовленное изображение
             
         Returns:
             str: Изображение, закодированное в base64
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return base64.b64encode(image_bytes).decode('utf-8')
             
     @retry_on_exception(max_retries=3, retry_delay=2, 
                    exceptions=(requests.exceptions.RequestException, ValueError))
-    @track_api_call('aitunnel_vision')
-    def detect_food(self, image_path: Optional[str] = None, image_content: Optional[bytes] = None) -> List[Dict[str, Any]]:
+    @track_api_call('aitunnel_vision', none_is_error=True)
+    def detect_food(self, image_path: Optional[str] = None, image_content: Optional[bytes] = None,
+                    image_buffer: Optional[ImageBuffer] = None) -> List[Dict[str, Any]]:
         """
         Распознавание пищи на изображении с помощью GPT-4 Vision через AITunnel
         
         Args:
             image_path (str, optional): Путь к файлу изображения
             image_content (bytes, optional): Содержимое изображения в байтах
+            image_buffer (ImageBuffer, optional): Уже загруженное в память изображение
             
         Returns:
             list: Список обнаруженных продуктов с информацией о КБЖУ
         """
         try:
             # Подготовка изображения
-            if image_path and os.path.exists(image_path):
-                base64_image = self._encode_image(image_path)
-            elif image_content:
-                base64_image = base64.b64encode(image_content).decode('utf-8')
-            else:
-                raise ValueError("Необходимо предоставить либо путь к изображению, либо его содержимое")
+            if image_buffer is None:
+                image_buffer = ImageBuffer.from_source(image_path, image_content)
             
-            # Инструкция для модели с запросом определить еду и КБЖУ
-            prompt = """
-            Ты эксперт-диетолог с обширными знаниями о пищевой ценности продуктов.
-            Проанализируй это изображение и определи, какая еда на нем показана.
+            if VISION_DETAIL_POLICY == 'retry':
+                # Сначала дешевый запрос с низкой детализацией, при неуверенном ответе - высокая
+                food_items = self._detect_with_detail(image_buffer, 'low')
+                if self._is_low_confidence(food_items):
+                    metrics_collector.increment('aitunnel_vision_detail_escalations')
+                    food_items = self._detect_with_detail(image_buffer, 'high')
+                return food_items
             
-            Важно:
-            1. Если на изображении нет еды, укажи "Еда не обнаружена" в поле name и верни пустые значения
-            2. Если еда есть, определи как можно точнее, что это за блюдо/продукт
-            3. Укажи основные ингредиенты
-            4. Оцени приблизительный вес всей порции в граммах
-            5. Рассчитай пищевую ценность ВСЕЙ порции (не на 100г):
-               - Калории (ккал)
-               - Белки (г)
-               - Жиры (г)
-               - Углеводы (г)
+            return self._detect_with_detail(image_buffer, self._choose_detail(image_buffer))
+                
+        except Exception as e:
+            print(f"Ошибка в AITunnelVisionFoodRecognition.detect_food: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _choose_detail(image_buffer: ImageBuffer) -> str:
+        """
+        Выбор уровня детализации по политике VISION_DETAIL_POLICY
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
             
-            Верни ответ только в таком формате JSON:
-            {
-                "name": "Название блюда",
-                "has_food": true/false,
-                "ingredients": ["ингредиент1", "ингредиент2", ...],
-                "portion_weight": число_в_граммах,
-                "nutrition": {
-                    "calories": число,
-                    "proteins": число,
-                    "fats": число,
-                    "carbs": число
-                }
-            }
-            """
+        Returns:
+            str: 'low' или 'high'
+        """
+        if VISION_DETAIL_POLICY == 'size':
+            # Маленькому изображению высокая детализация ничего не добавит
+            if max(image_buffer.pil_image.size) <= VISION_LOW_DETAIL_MAX_EDGE:
+                return 'low'
+        elif VISION_DETAIL_POLICY == 'low':
+            return 'low'
+        return 'high'
+    
+    @staticmethod
+    def _is_low_confidence(food_items: Optional[List[Dict[str, Any]]]) -> bool:
+        """
+        Проверка, стоит ли повторить запрос с высокой детализацией
+        
+        Args:
+            food_items (list): Результат распознавания
             
-            # Формирование запроса к API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url", 
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"  # Высокая детализация для лучшего распознавания
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.2  # Низкая температура для более точных и стабильных ответов
-            )
+        Returns:
+            bool: True, если модель сама оценила ответ как неуверенный или не указала калорийность
+        """
+        if not food_items:
+            return False
+        food_item = food_items[0]
+        # Еды нет или ответ не разобран - высокая детализация тут не поможет,
+        # а стоила бы второго платного запроса на каждое такое фото
+        if food_item.get('no_food') or 'raw_response' in food_item:
+            return False
+        model_confidence = food_item.get('model_confidence')
+        if model_confidence is not None and model_confidence < LOW_CONFIDENCE_THRESHOLD:
+            return True
+        nutrition = food_item.get('nutrition') or {}
+        return not nutrition.get('calories')
+    
+    def _detect_with_detail(self, image_buffer: ImageBuffer, detail: str) -> List[Dict[str, Any]]:
+        """
+        Запрос к модели с заданным уровнем детализации
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            detail (str): Уровень детализации 'low' или 'high'
             
-            # Получение ответа от модели
-            message_content = response.choices[0].message.content.strip()
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ
+        """
+        # Формирование запроса к API
+        start_time = time.time()
+        response = self.client.chat.completions.create(**self._build_request(image_buffer, detail))
+        # Время ответа по уровням детализации для сравнения low/high
+        metrics_collector.track_timing(f'aitunnel_vision_{detail}', time.time() - start_time)
+        
+        # Получение ответа от модели
+        message_content = response.choices[0].message.content.strip()
+        return self._parse_response(message_content)
+    
+    def _build_request(self, image_buffer: ImageBuffer, detail: str) -> Dict[str, Any]:
+        """
+        Подготовка изображения и параметров запроса chat.completions
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            detail (str): Уровень детализации 'low' или 'high'
             
-            # Проверка на наличие еды в ответе модели
-            if "еда не обнаружена" in message_content.lower() or "нет еды" in message_content.lower():
-                return [{
-                    'name': "Еда не обнаружена",
-                    'confidence': 0,
-                    'no_food': True  # Специальный флаг для обозначения отсутствия еды
-                }]
+        Returns:
+            dict: Именованные аргументы для chat.completions.create
+        """
+        # Уменьшаем и пережимаем изображение: для 'low' модель все равно смотрит на 512px
+        max_long_edge = VISION_LOW_DETAIL_MAX_EDGE if detail == 'low' else VISION_MAX_LONG_EDGE
+        image_bytes, _ = prepare_for_vision(image_buffer, max_long_edge, VISION_JPEG_QUALITY)
+        metrics_collector.increment('aitunnel_vision_upload_bytes', len(image_bytes))
+        metrics_collector.increment('aitunnel_vision_bytes_saved', max(0, len(image_buffer) - len(image_bytes)))
+        
+        base64_image = self._encode_image(image_bytes)
+        
+        return {
+            'model': self.model,
+            'messages': [
+                {
+                    "role": "user", 
+                    "content": [
+                        {"type": "text", "text": FOOD_ANALYSIS_PROMPT},
+                        {
+                            "type": "image_url", 
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}",
+                                "detail": detail
+                            }
+                        }
+                    ]
+                }
+            ],
+            'max_tokens': 1000,
+            'temperature': 0.2  # Низкая температура для более точных и стабильных ответов
+        }
+    
+    @staticmethod
+    def _parse_confidence(value) -> Optional[float]:
+        """Уверенность из ответа модели или None, если это не число от 0 до 1"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        return value if 0 <= value <= 1 else None
+    
+    @staticmethod
+    def _parse_response(message_content: str) -> List[Dict[str, Any]]:
+        """
+        Разбор ответа модели
+        
+        Args:
+            message_content (str): Текст ответа модели
             
-            # Извлечение JSON из ответа
-            json_match = re.search(r'({[\s\S]*})', message_content)
-            if json_match:
-                json_str = json_match.group(1)
-                try:
-                    food_data = json.loads(json_str)
-                    
-                    # Проверка на отсутствие еды в JSON
-                    if 'has_food' in food_data and not food_data['has_food']:
-                        return [{
-                            'name': "Еда не обнаружена",
-                            'confidence': 0,
-                            'no_food': True  # Специальный флаг для обозначения отсутствия еды
-                        }]
-                    
-                    # Формируем список для совместимости с существующим кодом
-                    food_items = [{
-                        'name': food_data.get('name', 'Неизвестное блюдо'),
-                        'confidence': 0.95,  # GPT-4 обычно дает точные ответы
-                        'ingredients': food_data.get('ingredients', []),
-                        'nutrition': food_data.get('nutrition', {
-                            'calories': 0,
-                            'proteins': 0,
-                            'fats': 0,
-                            'carbs': 0
-                        }),
-                        'portion_weight': food_data.get('portion_weight', 0)
-                    }]
-                    
-                    return food_items
-                except json.JSONDecodeError:
-                    # Если не удалось распарсить JSON
-                    # Проверим еще раз, нет ли упоминания отсутствия еды
-                    if "еда не обнаружена" in message_content.lower() or "нет еды" in message_content.lower():
-                        return [{
-                            'name': "Еда не обнаружена",
-                            'confidence': 0,
-                            'no_food': True
-                        }]
+        Returns:
+            list: Список обнаруженных продуктов с информацией о КБЖУ
+        """
+        # Проверка на наличие еды в ответе модели
+        if "еда не обнаружена" in message_content.lower() or "нет еды" in message_content.lower():
+            return [{
+                'name': "Еда не обнаружена",
+                'confidence': 0,
+                'no_food': True  # Специальный флаг для обозначения отсутствия еды
+            }]
+        
+        # Извлечение JSON из ответа
+        json_match = re.search(r'({[\s\S]*})', message_content)
+        if json_match:
+            json_str = json_match.group(1)
+            try:
+                food_data = json.loads(json_str)
+                
+                # Проверка на отсутствие еды в JSON
+                if 'has_food' in food_data and not food_data['has_food']:
                     return [{
-                        'name': "Нераспознанное блюдо",
-                        'confidence': 0.5,
-                        'raw_response': message_content
+                        'name': "Еда не обнаружена",
+                        'confidence': 0,
+                        'no_food': True  # Специальный флаг для обозначения отсутствия еды
                     }]
-            else:
-                # Если JSON не найден, проверим на упоминание отсутствия еды
+                
+                # Формируем список для совместимости с существующим кодом
+                food_items = [{
+                    'name': food_data.get('name', 'Неизвестное блюдо'),
+                    'confidence': 0.95,  # GPT-4 обычно дает точные ответы
+                    # Собственная оценка модели (None - не указана или не число от 0 до 1)
+                    'model_confidence': AITunnelVisionFoodRecognition._parse_confidence(food_data.get('confidence')),
+                    'ingredients': food_data.get('ingredients', []),
+                    'nutrition': food_data.get('nutrition', {
+                        'calories': 0,
+                        'proteins': 0,
+                        'fats': 0,
+                        'carbs': 0
+                    }),
+                    'portion_weight': food_data.get('portion_weight', 0)
+                }]
+                
+                return food_items
+            except json.JSONDecodeError:
+                # Если не удалось распарсить JSON
+                # Проверим еще раз, нет ли упоминания отсутствия еды
                 if "еда не обнаружена" in message_content.lower() or "нет еды" in message_content.lower():
                     return [{
                         'name': "Еда не обнаружена",
                         'confidence': 0,
                         'no_food': True
                     }]
-                # Если JSON не найден
                 return [{
                     'name': "Нераспознанное блюдо",
                     'confidence': 0.5,
                     'raw_response': message_content
                 }]
-                
-        except Exception as e:
-            print(f"Ошибка в AITunnelVisionFoodRecognition.detect_food: {str(e)}")
-            return None
\ No newline at end of file
+        else:
+            # Если JSON не найден, проверим на упоминание отсутствия еды
+            if "еда не обнаружена" in message_content.lower() or "нет еды" in message_content.lower():
+                return [{
+                    'name': "Еда не обнаружена",
+                    'confidence': 0,
+                    'no_food': True
+                }]
+            # Если JSON не найден
+            return [{
+                'name': "Нераспознанное блюдо",
+                'confidence': 0.5,
+                'raw_response': message_content
+            }]
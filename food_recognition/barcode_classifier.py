@@ -0,0 +1,316 @@
+"""
+Быстрая локальная проверка "похоже ли фото на штрихкод"
+
+Каждое фото еды, на котором pyzbar не нашел штрихкод, отправлялось в
+платный text_detection Google Vision только для того, чтобы выяснить, что
+штрихкода нет. Перед этим запросом изображение оценивается линейной
+моделью по признакам из градиентов яркости; при оценке ниже порога
+(BARCODE_CLASSIFIER_THRESHOLD) и BARCODE_CLASSIFIER=on запрос не делается.
+В режиме shadow (по умолчанию) оценка только попадает в метрики.
+
+Признаки считаются на уменьшенном (до 320 точек по длинной стороне)
+изображении в оттенках серого; JPEG при этом декодируется сразу в
+уменьшенном виде, поэтому проверка фото из Telegram (до 1280 точек)
+занимает 5-10 мс.
+Штрихкод - это участок с сильными градиентами одного направления, поэтому
+изображение делится на клетки и для каждой считается согласованность
+направлений градиента (по тензору структуры), а для всего изображения -
+гистограмма направлений.
+
+Модель по умолчанию обучена только на синтетических примерах (этикетки со
+штрихкодом на размытом фоне против фона, текста и полосатых тканей) и
+пропускает небольшие штрихкоды рядом с текстом. Перед включением режима on
+модель нужно обучить заново на размеченных реальных фото и проверить:
+    python -m food_recognition.barcode_classifier train samples/ --output data/barcode_classifier.json
+    python -m food_recognition.barcode_classifier eval samples/ --target-recall 0.99
+В каталоге samples/ фото со штрихкодами лежат в подкаталоге barcode/,
+остальные - в other/.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import BARCODE_CLASSIFIER_MODEL, BARCODE_CLASSIFIER_THRESHOLD
+
+THUMBNAIL_SIZE = 320
+GRID_SIZE = 6  # Клеток по каждой стороне
+ORIENTATION_BINS = 8
+# Градиент сильнее этого (в единицах яркости 0-255) считается краем
+EDGE_THRESHOLD = 24.0
+# Клетка считается полосатой при согласованности направлений и доле краев выше этих значений
+COHERENT_CELL = 0.5
+STRIPED_CELL_EDGES = 0.2
+
+FEATURES = (
+    'stripes_max',        # Наибольшая полосатость клетки: согласованность направлений x доля краев
+    'stripes_top3',       # Средняя полосатость трех лучших клеток
+    'striped_cells',      # Доля полосатых клеток
+    'edge_density',       # Доля краев во всем изображении
+    'orientation_peak',   # Доля самого частого направления в гистограмме всего изображения
+    'gradient_mean',      # Средняя величина градиента (0-1)
+)
+
+DEFAULT_MODEL = {
+    'features': list(FEATURES),
+    'weights': [7.63, 5.75, -1.89, -11.21, 0.66, -9.91],
+    'bias': -2.59,
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+def load_thumbnail(content):
+    """
+    Уменьшенное изображение в оттенках серого
+
+    Args:
+        content (bytes): Содержимое изображения
+
+    Returns:
+        numpy.ndarray: Яркость float32, длинная сторона не больше THUMBNAIL_SIZE
+    """
+    image = Image.open(io.BytesIO(content))
+    # Для JPEG декодер сразу уменьшает изображение в 2-8 раз - это почти бесплатно
+    image.draft('L', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    image = image.convert('L')
+    if max(image.size) > THUMBNAIL_SIZE:
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+def extract_features(gray):
+    """
+    Признаки изображения для модели
+
+    Args:
+        gray (numpy.ndarray): Яркость (см. load_thumbnail)
+
+    Returns:
+        numpy.ndarray: Значения признаков в порядке FEATURES
+    """
+    if gray.shape[0] < GRID_SIZE * 3 or gray.shape[1] < GRID_SIZE * 3:
+        return np.zeros(len(FEATURES))
+
+    # Центральные разности, обрезанные до общего размера
+    gx = (gray[1:-1, 2:] - gray[1:-1, :-2]) / 2
+    gy = (gray[2:, 1:-1] - gray[:-2, 1:-1]) / 2
+    gxx, gyy, gxy = gx * gx, gy * gy, gx * gy
+    magnitude = np.sqrt(gxx + gyy)
+    edges = magnitude > EDGE_THRESHOLD
+
+    # Суммы по клеткам сетки GRID_SIZE x GRID_SIZE (остаток по краям отбрасываем)
+    height, width = gx.shape
+    cell_h, cell_w = height // GRID_SIZE, width // GRID_SIZE
+
+    def cell_sums(values):
+        cropped = values[:cell_h * GRID_SIZE, :cell_w * GRID_SIZE]
+        return cropped.reshape(GRID_SIZE, cell_h, GRID_SIZE, cell_w).sum(axis=(1, 3)).ravel()
+
+    # Согласованность направлений считаем только по краям: одиночный плавный
+    # перепад (край тарелки) тоже согласован, но краев в клетке у него мало
+    edge_weight = edges.astype(np.float32)
+    jxx, jyy, jxy = cell_sums(gxx * edge_weight), cell_sums(gyy * edge_weight), cell_sums(gxy * edge_weight)
+    coherence = np.sqrt((jxx - jyy) ** 2 + 4 * jxy ** 2) / (jxx + jyy + 1e-6)
+    edge_density = cell_sums(edge_weight) / (cell_h * cell_w)
+    stripes = np.sort(coherence * edge_density)[::-1]
+
+    # Гистограмма направлений (по модулю 180 градусов), взвешенная по величине градиента
+    angles = np.arctan2(gy[edges], gx[edges]) % np.pi
+    bins = np.minimum((angles * (ORIENTATION_BINS / np.pi)).astype(np.int64), ORIENTATION_BINS - 1)
+    histogram = np.bincount(bins, weights=magnitude[edges], minlength=ORIENTATION_BINS)
+    orientation_peak = histogram.max() / histogram.sum() if histogram.sum() > 0 else 0.0
+
+    return np.array([
+        stripes[0],
+        stripes[:3].mean(),
+        float(np.count_nonzero((coherence > COHERENT_CELL) & (edge_density > STRIPED_CELL_EDGES))) / len(coherence),
+        float(edge_weight.mean()),
+        orientation_peak,
+        min(1.0, float(magnitude.mean()) / 64),
+    ])
+
+class BarcodeClassifier:
+    """Логистическая регрессия по признакам extract_features"""
+
+    def __init__(self, model=None, threshold=BARCODE_CLASSIFIER_THRESHOLD):
+        """
+        Args:
+            model (dict, optional): features, weights, bias (по умолчанию DEFAULT_MODEL)
+            threshold (float): Порог оценки, ниже которого фото не считается штрихкодом
+        """
+        model = model or DEFAULT_MODEL
+        if list(model['features']) != list(FEATURES):
+            raise ValueError(f"Модель обучена на других признаках: {model['features']}")
+        self.weights = np.array(model['weights'], dtype=np.float64)
+        self.bias = float(model['bias'])
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path=BARCODE_CLASSIFIER_MODEL, threshold=BARCODE_CLASSIFIER_THRESHOLD):
+        """Модель из JSON-файла или модель по умолчанию, если файла нет"""
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f), threshold)
+        return cls(None, threshold)
+
+    def score_features(self, features):
+        """Оценки (0-1) для строк матрицы признаков или одного вектора"""
+        return 1 / (1 + np.exp(-(np.asarray(features) @ self.weights + self.bias)))
+
+    def score(self, content):
+        """
+        Оценка вероятности того, что на фото штрихкод
+
+        Args:
+            content (bytes): Содержимое изображения
+
+        Returns:
+            float: Оценка от 0 до 1
+        """
+        return float(self.score_features(extract_features(load_thumbnail(content))))
+
+    def is_barcode(self, content):
+        """True, если оценка фото не ниже порога"""
+        return self.score(content) >= self.threshold
+
+def train_model(features, labels, l2=0.01, iterations=3000, learning_rate=0.5):
+    """
+    Обучение логистической регрессии градиентным спуском
+
+    Args:
+        features (numpy.ndarray): Матрица признаков (строка - фото)
+        labels (numpy.ndarray): 1 - штрихкод, 0 - нет
+        l2 (float): Коэффициент регуляризации
+        iterations (int): Количество шагов
+        learning_rate (float): Шаг спуска
+
+    Returns:
+        dict: Модель для BarcodeClassifier
+    """
+    # Обучаем на стандартизованных признаках, затем переносим масштаб в веса
+    mean = features.mean(axis=0)
+    std = features.std(axis=0) + 1e-6
+    x = (features - mean) / std
+    y = labels.astype(np.float64)
+    # Классы взвешиваем одинаково: фото еды обычно намного больше
+    sample_weights = np.where(y == 1, 0.5 / max(1, y.sum()), 0.5 / max(1, len(y) - y.sum()))
+
+    weights = np.zeros(x.shape[1])
+    bias = 0.0
+    for _ in range(iterations):
+        error = (1 / (1 + np.exp(-(x @ weights + bias))) - y) * sample_weights
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+
+    return {
+        'features': list(FEATURES),
+        'weights': [round(float(value), 6) for value in weights / std],
+        'bias': round(float(bias - (weights / std) @ mean), 6),
+    }
+
+def load_samples(directory):
+    """
+    Размеченные фото: подкаталог barcode/ - штрихкоды, other/ - остальные
+
+    Returns:
+        tuple: (список путей, numpy.ndarray меток)
+    """
+    paths, labels = [], []
+    for label, subdirectory in ((1, 'barcode'), (0, 'other')):
+        folder = os.path.join(directory, subdirectory)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(folder, name))
+                labels.append(label)
+    return paths, np.array(labels, dtype=np.int64)
+
+def compute_features(paths):
+    """Матрица признаков и время расчета (сек) для каждого фото"""
+    rows, timings = [], []
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        start_time = time.perf_counter()
+        rows.append(extract_features(load_thumbnail(content)))
+        timings.append(time.perf_counter() - start_time)
+    return np.array(rows).reshape(-1, len(FEATURES)), np.array(timings)
+
+def evaluate(scores, labels, threshold):
+    """
+    Качество при пороге
+
+    Returns:
+        dict: recall - доля найденных штрихкодов, precision, skipped - доля фото,
+              для которых распознавание штрихкода пропускается
+    """
+    predicted = scores >= threshold
+    positives = labels == 1
+    true_positives = np.count_nonzero(predicted & positives)
+    return {
+        'recall': true_positives / max(1, np.count_nonzero(positives)),
+        'precision': true_positives / max(1, np.count_nonzero(predicted)),
+        'skipped': 1 - np.count_nonzero(predicted) / max(1, len(labels)),
+    }
+
+def threshold_for_recall(scores, labels, target_recall):
+    """Наибольший порог, при котором доля найденных штрихкодов не ниже target_recall"""
+    positive_scores = np.sort(scores[labels == 1])
+    if len(positive_scores) == 0:
+        return 0.0
+    allowed_misses = int(np.floor(len(positive_scores) * (1 - target_recall) + 1e-9))
+    return float(positive_scores[allowed_misses])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обучение и проверка классификатора фото штрихкодов")
+    parser.add_argument('command', choices=('eval', 'train'), help="eval - проверка модели, train - обучение")
+    parser.add_argument('samples', help="Каталог с подкаталогами barcode/ и other/")
+    parser.add_argument('--model', default=BARCODE_CLASSIFIER_MODEL, help="Файл модели для проверки")
+    parser.add_argument('--output', default=BARCODE_CLASSIFIER_MODEL, help="Куда сохранить обученную модель")
+    parser.add_argument('--threshold', type=float, default=BARCODE_CLASSIFIER_THRESHOLD, help="Порог оценки")
+    parser.add_argument('--target-recall', type=float, default=0.99,
+                        help="Подобрать порог, при котором находится не меньше этой доли штрихкодов")
+    args = parser.parse_args(argv)
+
+    paths, labels = load_samples(args.samples)
+    if len(paths) == 0:
+        parser.error(f"В {args.samples} нет фото в подкаталогах barcode/ и other/")
+    features, timings = compute_features(paths)
+    print(f"Фото: {len(paths)} (штрихкодов {np.count_nonzero(labels)}), "
+          f"признаки: среднее {timings.mean() * 1000:.1f} мс, p95 {np.percentile(timings, 95) * 1000:.1f} мс")
+
+    if args.command == 'train':
+        model = train_model(features, labels)
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(model, f, indent=2)
+        print(f"Модель сохранена в {args.output}")
+        classifier = BarcodeClassifier(model, args.threshold)
+    else:
+        classifier = BarcodeClassifier.load(args.model, args.threshold)
+
+    scores = classifier.score_features(features)
+    for threshold in sorted({0.05, 0.1, 0.2, 0.3, 0.5, args.threshold}):
+        quality = evaluate(scores, labels, threshold)
+        marker = ' <- текущий' if threshold == args.threshold else ''
+        print(f"Порог {threshold:.2f}: найдено штрихкодов {quality['recall']:.1%}, "
+              f"точность {quality['precision']:.1%}, пропущено фото {quality['skipped']:.1%}{marker}")
+
+    suggested = threshold_for_recall(scores, labels, args.target_recall)
+    quality = evaluate(scores, labels, suggested)
+    print(f"Для доли найденных штрихкодов {args.target_recall:.0%}: порог {suggested:.3f} "
+          f"(пропущено фото {quality['skipped']:.1%})")
+    for path, label, score in zip(paths, labels, scores):
+        if label == 1 and score < args.threshold:
+            print(f"Пропущен штрихкод: {path} (оценка {score:.3f})")
+
+if __name__ == '__main__':
+    main()
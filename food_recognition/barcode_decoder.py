@@ -0,0 +1,236 @@
+"""
+Локальное распознавание штрихкодов (pyzbar) в отдельных процессах
+
+pyzbar работает с изображением целиком и надолго занимает процессор (и GIL)
+на больших фото с телефона, поэтому декодирование вынесено в пул процессов,
+который создается один раз. Изображение передается в процесс как байты и
+там же открывается.
+
+Перед распознаванием изображение переводится в оттенки серого и
+уменьшается; затем пробуются ступени по возрастанию стоимости:
+    gray_640, gray_1024, gray_1600, gray_full - пирамида размеров
+        (по длинной стороне, больше исходного не увеличиваем);
+    contrast - автоконтраст и повышение резкости;
+    rotate - повороты на 45 и -45 градусов (вертикальные и горизонтальные
+        штрихкоды zbar находит и без поворота, а наклонные - нет).
+Последние две ступени необязательные (BARCODE_DECODE_PASSES). Время
+каждой ступени возвращается вызывающему коду для метрик
+barcode_decode_<ступень>. Модуль не импортирует ничего, что запускает
+потоки (в том числе monitoring): он импортируется до создания пула.
+"""
+import io
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageFilter, ImageOps
+from pyzbar.pyzbar import decode
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import BARCODE_DECODE_WORKERS, BARCODE_DECODE_TIMEOUT, BARCODE_DECODE_PASSES
+
+PYRAMID_SIZES = (640, 1024, 1600)
+# Размер, на котором выполняются дополнительные проходы (контраст, повороты)
+PASS_SIZE = 1024
+ROTATION_ANGLES = (45, -45)
+
+def _scaled(gray, max_side):
+    """Уменьшенная копия изображения (длинная сторона не больше max_side)"""
+    if max(gray.size) <= max_side:
+        return gray
+    scale = max_side / max(gray.size)
+    size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+    return gray.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+def _first_barcode(image):
+    """Первый найденный pyzbar штрихкод или None"""
+    for obj in decode(image):
+        return obj.data.decode('utf-8')
+    return None
+
+def _ladder(gray, passes):
+    """
+    Ступени распознавания по возрастанию стоимости
+
+    Yields:
+        tuple: (название ступени, функция без аргументов, возвращающая изображение)
+    """
+    previous_size = None
+    for max_side in PYRAMID_SIZES:
+        if previous_size is not None and previous_size >= max(gray.size):
+            break
+        yield f'gray_{max_side}', lambda max_side=max_side: _scaled(gray, max_side)
+        previous_size = max_side
+    if max(gray.size) > PYRAMID_SIZES[-1]:
+        yield 'gray_full', lambda: gray
+
+    if 'contrast' in passes:
+        yield 'contrast', lambda: ImageOps.autocontrast(_scaled(gray, PASS_SIZE), cutoff=2).filter(ImageFilter.SHARPEN)
+    if 'rotate' in passes:
+        for angle in ROTATION_ANGLES:
+            yield f'rotate_{angle}', lambda angle=angle: _scaled(gray, PASS_SIZE).rotate(
+                angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+
+def decode_barcode_image(content, passes=BARCODE_DECODE_PASSES, budget=BARCODE_DECODE_TIMEOUT):
+    """
+    Распознавание штрихкода по ступеням (выполняется в процессе пула)
+
+    Args:
+        content (bytes): Содержимое изображения
+        passes (tuple): Включенные дополнительные проходы ('contrast', 'rotate')
+        budget (float): Время на все ступени, сек; после него следующие ступени не запускаются
+
+    Returns:
+        tuple: (штрихкод или None, список (ступень, время в секундах))
+    """
+    timings = []
+    started = start_time = time.time()
+    # Учитываем ориентацию из EXIF: фото с телефона часто хранятся повернутыми
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    gray = image.convert('L')
+    timings.append(('prepare', time.time() - start_time))
+
+    for stage, build in _ladder(gray, passes):
+        if budget and time.time() - started > budget:
+            timings.append(('budget_exceeded', 0.0))
+            break
+        start_time = time.time()
+        barcode = _first_barcode(build())
+        timings.append((stage, time.time() - start_time))
+        if barcode:
+            return barcode, timings
+    return None, timings
+
+def _warm_up():
+    """Инициализация процесса пула: импорт pyzbar и загрузка libzbar заранее"""
+    decode(Image.new('L', (8, 8), 255))
+
+class BarcodeDecoder:
+    """
+    Пул процессов для распознавания штрихкодов.
+
+    Процессы создаются через fork один раз - при старте бота, пока в процессе
+    нет других потоков (fork многопоточного процесса может оставить дочерний
+    процесс с захваченными блокировками). forkserver и spawn не подходят:
+    каждый процесс пула заново импортировал бы главный модуль бота со всеми
+    его глобальными объектами и фоновыми потоками. Поэтому этот модуль при
+    импорте не запускает потоков, а позже, из многопоточного процесса, пул не
+    пересоздается: если он сломался, распознавание идет в потоке обработчика.
+
+    В пул одновременно отправляется не больше заданий, чем в нем процессов,
+    поэтому ожидание очереди не съедает таймаут следующего задания, а задание,
+    превысившее таймаут, занимает только свой процесс. Время работы задания
+    ограничено и в самом процессе (budget в decode_barcode_image).
+    """
+
+    def __init__(self, workers=BARCODE_DECODE_WORKERS, timeout=BARCODE_DECODE_TIMEOUT):
+        """
+        Args:
+            workers (int): Количество процессов (0 - распознавание в текущем потоке)
+            timeout (float): Максимальное время распознавания одного изображения, сек
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._broken = False
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._lock = threading.Lock()
+        self._stats = {'timeouts': 0, 'busy': 0, 'in_thread': 0}
+
+    def _get_pool(self):
+        """Пул процессов или None, если создать его безопасно уже нельзя"""
+        with self._lock:
+            if self._pool is None and not self._broken:
+                if threading.active_count() > 1 or 'fork' not in multiprocessing.get_all_start_methods():
+                    print("Пул распознавания штрихкодов не создан: в процессе уже есть потоки "
+                          "(barcode_decoder.start() нужно вызвать до импорта бота)")
+                    self._broken = True
+                else:
+                    context = multiprocessing.get_context('fork')
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                     initializer=_warm_up)
+                    # С fork все процессы создаются при первом задании - прямо сейчас
+                    self._pool.submit(_warm_up).result()
+            return self._pool
+
+    def _disable_pool(self, reason):
+        """Остановка пула (процесс завис или упал); дальше распознаем в потоке обработчика"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._broken = True
+        if pool is None:
+            return
+        print(f"Пул распознавания штрихкодов остановлен ({reason}), распознавание - в потоке обработчика")
+        # Зависший процесс сам не завершится
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def start(self):
+        """Заранее запустить процессы пула (в самом начале старта бота, до других потоков)"""
+        if self.workers > 0:
+            self._get_pool()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Счетчики для метрик"""
+        with self._lock:
+            return {f'barcode_decode_{name}': value for name, value in self._stats.items()}
+
+    def decode(self, content):
+        """
+        Распознавание штрихкода на изображении
+
+        Args:
+            content (bytes): Содержимое изображения
+
+        Returns:
+            tuple: (штрихкод или None, список (ступень, время в секундах))
+        """
+        pool = self._get_pool() if self.workers > 0 else None
+        if pool is None:
+            self._count('in_thread')
+            return decode_barcode_image(content, budget=self.timeout)
+
+        # Свободный процесс ждем не дольше таймаута; не дождались - локально не распознаем
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('busy')
+            return None, []
+        try:
+            future = pool.submit(decode_barcode_image, content, BARCODE_DECODE_PASSES, self.timeout)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._disable_pool("процесс пула завершился аварийно")
+            return self.decode(content)
+        # Место освобождается, только когда задание действительно закончилось
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            if future.cancel():
+                return None, []
+            # Бюджет в процессе уже истек: задание, не закончившееся и через
+            # двойной таймаут, зависло в libzbar
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                self._disable_pool("задание зависло")
+                return None, []
+            except BrokenProcessPool:
+                self._disable_pool("процесс пула завершился аварийно")
+                return None, []
+        except BrokenProcessPool:
+            self._disable_pool("процесс пула завершился аварийно")
+            return decode_barcode_image(content, budget=self.timeout)
+
+# Глобальный экземпляр
+barcode_decoder = BarcodeDecoder()
@@ -1,9 +1,12 @@
 import io
 import os
 import sys
-import requests
-import json
-from pyzbar.pyzbar import decode
+import copy
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image
 from google.cloud import vision
 from monitoring.decorators import track_api_call
@@ -12,52 +15,144 @@ from monitoring.metrics import metrics_collector
 
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import GOOGLE_APPLICATION_CREDENTIALS
+from config import (GOOGLE_APPLICATION_CREDENTIALS, BARCODE_CACHE_SIZE, BARCODE_CACHE_TTL, BARCODE_NEGATIVE_CACHE_TTL,
+                    BARCODE_PROVIDERS, BARCODE_PROVIDER_TIMEOUT, BARCODE_LOOKUP_DEADLINE,
+                    BARCODE_DEMOTE_LATENCY_RATIO, BARCODE_DEMOTE_MIN_SAMPLES, BARCODE_CLASSIFIER)
 from food_recognition.nutrition_calc import NutritionCalculator
+from food_recognition.image_buffer import ImageBuffer
+from food_recognition.barcode_store import barcode_store, normalize_barcode
+from food_recognition.barcode_decoder import barcode_decoder
+from food_recognition.barcode_classifier import BarcodeClassifier
+from utils.http_client import http_client
+from utils.circuit_breaker import circuit_breakers
+from utils.cache import LRUCache
+
+# Кэш поиска по штрихкоду, общий для всех потоков и экземпляров сканера:
+# найденные продукты и штрихкоды, которых нет ни в одном источнике
+product_cache = LRUCache(max_size=BARCODE_CACHE_SIZE, ttl=BARCODE_CACHE_TTL, name='barcode_cache')
+missing_product_cache = LRUCache(max_size=BARCODE_CACHE_SIZE, ttl=BARCODE_NEGATIVE_CACHE_TTL,
+                                 name='barcode_negative_cache')
+metrics_collector.register_gauge_provider(product_cache.stats)
+metrics_collector.register_gauge_provider(missing_product_cache.stats)
+metrics_collector.register_gauge_provider(barcode_decoder.stats)
+
+# Блокировки поиска по отдельным штрихкодам: одновременные запросы одного
+# штрихкода ждут первый, а не идут во внешние сервисы параллельно
+_lookup_locks = {}
+_lookup_locks_guard = threading.Lock()
+
+# Пул потоков для одновременного опроса внешних сервисов штрихкодов
+barcode_provider_executor = ThreadPoolExecutor(max_workers=max(2, 4 * len(BARCODE_PROVIDERS)),
+                                               thread_name_prefix='barcode_provider')
+
+# Сколько раз ответ каждого сервиса оказался выбранным (для доли побед в метриках)
+_provider_wins = Counter()
+_provider_lookups = 0
+_provider_stats_lock = threading.Lock()
+
+def _provider_stats():
+    """Доля поисков, в которых выбран ответ сервиса"""
+    with _provider_stats_lock:
+        return {f'barcode_{name}_win_rate': round(_provider_wins[name] / _provider_lookups, 3) if _provider_lookups else 0
+                for name in BARCODE_PROVIDERS}
+
+metrics_collector.register_gauge_provider(_provider_stats)
+
+@contextmanager
+def _barcode_lookup_lock(barcode):
+    with _lookup_locks_guard:
+        entry = _lookup_locks.get(barcode)
+        if entry is None:
+            entry = _lookup_locks[barcode] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lookup_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _lookup_locks[barcode]
 
 class BarcodeScanner:
     """Класс для сканирования штрихкодов и получения информации о продуктах"""
     
-    def __init__(self):
-        """Инициализация сканера штрихкодов"""
-        self.vision_client = None
-        if GOOGLE_APPLICATION_CREDENTIALS:
+    def __init__(self, vision_client=None):
+        """
+        Инициализация сканера штрихкодов
+        
+        Args:
+            vision_client (vision.ImageAnnotatorClient, optional): Общий клиент Vision API
+        """
+        self.vision_client = vision_client
+        if self.vision_client is None and GOOGLE_APPLICATION_CREDENTIALS:
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
             self.vision_client = vision.ImageAnnotatorClient()
+        # Быстрая проверка перед Google Vision OCR: фото еды не отправляем в платный API
+        self.classifier = BarcodeClassifier.load() if BARCODE_CLASSIFIER in ('shadow', 'on') else None
+
+    def _worth_ocr(self, image_buffer):
+        """
+        Стоит ли искать штрихкод на фото через Google Vision OCR (по оценке классификатора)
+        
+        Args:
+            image_buffer (ImageBuffer): Изображение в памяти
+            
+        Returns:
+            tuple: (вызывать ли OCR, пропустил бы классификатор фото)
+        """
+        if self.classifier is None:
+            return True, False
+        start_time = time.time()
+        try:
+            score = self.classifier.score(image_buffer.content)
+        except Exception as e:
+            print(f"Ошибка при оценке фото классификатором штрихкодов: {str(e)}")
+            return True, False
+        metrics_collector.track_timing('barcode_classifier', time.time() - start_time)
+        if score >= self.classifier.threshold:
+            return True, False
+        if BARCODE_CLASSIFIER == 'on':
+            metrics_collector.increment('barcode_classifier_skipped')
+            return False, True
+        # Теневой режим: OCR вызываем, но запоминаем, что классификатор пропустил бы фото
+        metrics_collector.increment('barcode_classifier_would_skip')
+        return True, True
 
     @track_api_call('barcode_detect')
-    def detect_barcode(self, image_path=None, image_content=None):
+    def detect_barcode(self, image_path=None, image_content=None, image_buffer=None):
         """
         Распознавание штрихкода на изображении
         
         Args:
             image_path (str, optional): Путь к файлу изображения
             image_content (bytes, optional): Содержимое изображения в байтах
+            image_buffer (ImageBuffer, optional): Уже загруженное в память изображение
             
         Returns:
             str: Распознанный штрихкод или None, если штрихкод не найден
         """
         try:
-            # Подготовка изображения
-            if image_path and os.path.exists(image_path):
-                with open(image_path, 'rb') as image_file:
-                    content = image_file.read()
-                pil_image = Image.open(image_path)
-            elif image_content:
-                content = image_content
-                pil_image = Image.open(io.BytesIO(image_content))
-            else:
-                raise ValueError("Необходимо предоставить либо путь к изображению, либо его содержимое")
-            
-            # Сначала пробуем использовать pyzbar (быстрее и без API-запросов)
-            decoded_objects = decode(pil_image)
-            if decoded_objects:
-                for obj in decoded_objects:
-                    return obj.data.decode('utf-8')
-            
-            # Если pyzbar не справился, используем Google Vision API
-            if self.vision_client:
-                image = vision.Image(content=content)
+            # Подготовка изображения (файл читается и декодируется не более одного раза)
+            if image_buffer is None:
+                image_buffer = ImageBuffer.from_source(image_path, image_content)
+            
+            # Сначала pyzbar в пуле процессов: все ступени обработки изображения
+            # (быстрее и без API-запросов)
+            start_time = time.time()
+            barcode, timings = barcode_decoder.decode(image_buffer.content)
+            for stage, duration in timings:
+                metrics_collector.track_timing(f'barcode_decode_{stage}', duration)
+            metrics_collector.track_timing('barcode_decode_total', time.time() - start_time)
+            if barcode:
+                metrics_collector.increment(f'barcode_decoded_{timings[-1][0]}')
+                return barcode
+            
+            # Только если локально распознать не удалось, используем Google Vision API
+            # (если фото не похоже на штрихкод, платный запрос не делаем)
+            call_ocr, classifier_skip = self._worth_ocr(image_buffer) if self.vision_client else (False, False)
+            if call_ocr:
+                image = vision.Image(content=image_buffer.content)
                 response = self.vision_client.text_detection(image=image)
                 
                 # Проверка на ошибки
@@ -70,6 +165,9 @@ class BarcodeScanner:
                     for text in texts:
                         # Проверяем, похож ли текст на штрихкод (только цифры, длина 8-13)
                         if text.description.isdigit() and 8 <= len(text.description) <= 13:
+                            if classifier_skip:
+                                # Классификатор ошибся бы: штрихкод был на фото
+                                metrics_collector.increment('barcode_classifier_would_miss')
                             return text.description
             
             return None
@@ -78,7 +176,6 @@ class BarcodeScanner:
             print(f"Ошибка при распознавании штрихкода: {str(e)}")
             return None
 
-    @track_api_call('barcode_product_info')
     def get_product_info(self, barcode):
         """
         Получение информации о продукте по штрихкоду
@@ -90,108 +187,295 @@ class BarcodeScanner:
             dict: Информация о продукте или None, если продукт не найден
         """
         try:
-            # Проверяем, есть ли продукт в локальной базе
-            local_product = self._check_local_database(barcode)
-            if local_product:
-                return local_product
-            
-            # 1. Сначала пробуем Edadeal (больше российских продуктов)
-            try:
-                response = requests.get(f"https://api.edadeal.ru/web/v1/product_details?product_id={barcode}", 
-                                       timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and 'product' in data:
-                        product = data['product']
-                        # Edadeal не всегда предоставляет полные данные о КБЖУ,
-                        # поэтому нужно проверять наличие
-                        nutrition = product.get('nutrition', {})
-                        
-                        nutrition_data = {
-                            'name': product.get('title', 'Неизвестный продукт'),
-                            'calories': nutrition.get('energy', {}).get('value', 0),
-                            'proteins': nutrition.get('proteins', {}).get('value', 0),
-                            'fats': nutrition.get('fats', {}).get('value', 0),
-                            'carbs': nutrition.get('carbohydrates', {}).get('value', 0),
-                            'portion_weight': 100,  # По умолчанию на 100г
-                            'barcode': barcode,
-                            'estimated': False
-                        }
-                        
-                        # Сохраняем продукт в локальную базу
-                        self._save_to_local_database(barcode, nutrition_data)
-                        return nutrition_data
-            except:
-                pass
-            
-            # 2. Если не нашли в Edadeal, пробуем Open Food Facts
-            try:
-                response = requests.get(f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json", 
-                                       timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("status") == 1:
-                        product = data.get("product", {})
-                        nutriments = product.get("nutriments", {})
-                        
-                        # Получаем название на русском, если доступно
-                        product_name = product.get('product_name_ru', product.get('product_name', 'Неизвестный продукт'))
-                        
-                        nutrition_data = {
-                            'name': product_name,
-                            'calories': nutriments.get('energy-kcal_100g', 0),
-                            'proteins': nutriments.get('proteins_100g', 0),
-                            'fats': nutriments.get('fat_100g', 0),
-                            'carbs': nutriments.get('carbohydrates_100g', 0),
-                            'portion_weight': 100,  # По умолчанию на 100г
-                            'barcode': barcode,
-                            'estimated': False
-                        }
-                        
-                        # Сохраняем продукт в локальную базу
-                        self._save_to_local_database(barcode, nutrition_data)
-                        return nutrition_data
-            except:
-                pass
-            
-            # 3. Если не нашли нигде, возвращаем заглушку для ручного ввода
-            return {
-                'name': f'Продукт (штрихкод: {barcode})',
-                'calories': 0,
-                'proteins': 0,
-                'fats': 0,
-                'carbs': 0,
-                'portion_weight': 100,
-                'barcode': barcode,
-                'estimated': True
-            }
+            cache_key = normalize_barcode(barcode) or barcode
+            
+            # Сначала кэш в памяти: найденные продукты и заведомо неизвестные штрихкоды
+            cached_product = product_cache.get(cache_key)
+            if cached_product is not None:
+                return copy.deepcopy(cached_product)
+            if missing_product_cache.get(cache_key) is not None:
+                return self._manual_entry_product(barcode)
+            
+            with _barcode_lookup_lock(cache_key):
+                # Пока ждали, этот штрихкод мог найти другой поток
+                cached_product = product_cache.get(cache_key, track=False)
+                if cached_product is not None:
+                    return copy.deepcopy(cached_product)
+                if missing_product_cache.get(cache_key, track=False) is not None:
+                    return self._manual_entry_product(barcode)
+                
+                # Проверяем, есть ли продукт в локальной базе
+                local_product = self._check_local_database(barcode)
+                if local_product:
+                    product_cache.set(cache_key, copy.deepcopy(local_product))
+                    return local_product
+                
+                # Внешние сервисы недоступны - сразу переходим к ручному вводу
+                if circuit_breakers.get('barcode_product_info').allow_request():
+                    try:
+                        remote_product, conclusive = self._fetch_remote_product(barcode)
+                        if remote_product:
+                            product_cache.set(cache_key, copy.deepcopy(remote_product))
+                            return remote_product
+                        # Продукта нет ни в одном сервисе (если какой-то сервис
+                        # не ответил, результат не кэшируем)
+                        if conclusive:
+                            missing_product_cache.set(cache_key, True)
+                    except Exception as e:
+                        print(f"Ошибка при запросе информации о продукте: {str(e)}")
+                else:
+                    metrics_collector.increment('barcode_product_info_short_circuit')
+            
+            # Если не нашли нигде, возвращаем заглушку для ручного ввода
+            return self._manual_entry_product(barcode)
                 
         except Exception as e:
             print(f"Ошибка при получении информации о продукте: {str(e)}")
             return None
     
-    def _check_local_database(self, barcode):
+    @staticmethod
+    def _manual_entry_product(barcode):
+        """Заглушка для ручного ввода КБЖУ неизвестного продукта"""
+        return {
+            'name': f'Продукт (штрихкод: {barcode})',
+            'calories': 0,
+            'proteins': 0,
+            'fats': 0,
+            'carbs': 0,
+            'portion_weight': 100,
+            'barcode': barcode,
+            'estimated': True
+        }
+    
+    # Сервисы штрихкодов: название -> метод запроса
+    PROVIDER_FETCHERS = {
+        'edadeal': '_fetch_edadeal',
+        'openfoodfacts': '_fetch_openfoodfacts',
+    }
+    
+    @staticmethod
+    def _provider_order():
         """
-        Проверка наличия продукта в локальной базе данных
+        Порядок приоритета сервисов: как в BARCODE_PROVIDERS, но сервисы,
+        отвечающие намного медленнее самого быстрого, опускаются в конец
+        
+        Returns:
+            list: Названия сервисов
+        """
+        providers = [name for name in BARCODE_PROVIDERS if name in BarcodeScanner.PROVIDER_FETCHERS]
+        latencies = {
+            name: metrics_collector.get_response_time_percentile(f'barcode_{name}', 0.95,
+                                                                 BARCODE_DEMOTE_MIN_SAMPLES)
+            for name in providers
+        }
+        known_latencies = [latency for latency in latencies.values() if latency is not None]
+        if len(known_latencies) < 2:
+            return providers
+        
+        fastest = min(known_latencies)
+        def is_demoted(name):
+            return latencies[name] is not None and latencies[name] > fastest * BARCODE_DEMOTE_LATENCY_RATIO
+        
+        # Сортировка устойчива: внутри групп сохраняется заданный приоритет
+        return sorted(providers, key=is_demoted)
+    
+    @staticmethod
+    def _pick_answer(order, outcomes, wait_for_higher=True):
+        """
+        Выбор ответа по приоритету
+        
+        Args:
+            order (list): Сервисы в порядке приоритета
+            outcomes (dict): Завершившиеся сервисы: продукт, None или исключение
+            wait_for_higher (bool): Не выбирать ответ, пока не ответили сервисы выше по приоритету
+            
+        Returns:
+            str: Название выбранного сервиса или None
+        """
+        for name in order:
+            if name not in outcomes:
+                if wait_for_higher:
+                    return None
+                continue
+            if isinstance(outcomes[name], dict):
+                return name
+        return None
+    
+    @track_api_call('barcode_product_info')
+    def _fetch_remote_product(self, barcode):
+        """
+        Поиск продукта во внешних сервисах (Edadeal, Open Food Facts).
+        
+        Сервисы опрашиваются одновременно. Выбирается ответ самого
+        приоритетного сервиса, нашедшего продукт: ответ менее приоритетного
+        принимается, как только более приоритетные ответили "не найдено"
+        или истек общий срок BARCODE_LOOKUP_DEADLINE. Остальные запросы
+        отменяются (уже начатые HTTP-запросы завершаются сами по таймауту).
         
         Args:
             barcode (str): Штрихкод продукта
             
+        Returns:
+            tuple: (информация о продукте или None, ответили ли все сервисы)
+            
+        Raises:
+            Exception: Если ни один сервис не ответил (для предохранителя)
+        """
+        global _provider_lookups
+        
+        order = self._provider_order()
+        deadline = time.time() + BARCODE_LOOKUP_DEADLINE
+        timeout = min(BARCODE_PROVIDER_TIMEOUT, BARCODE_LOOKUP_DEADLINE)
+        futures = {
+            barcode_provider_executor.submit(getattr(self, self.PROVIDER_FETCHERS[name]), barcode, timeout): name
+            for name in order
+        }
+        
+        outcomes = {}
+        pending = set(futures)
+        winner = None
+        while True:
+            winner = self._pick_answer(order, outcomes)
+            if winner is not None or not pending:
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    outcomes[futures[future]] = future.result()
+                except Exception as e:
+                    outcomes[futures[future]] = e
+        
+        # Срок истек: берем лучший из уже полученных ответов
+        if winner is None:
+            winner = self._pick_answer(order, outcomes, wait_for_higher=False)
+        for future in pending:
+            future.cancel()
+        
+        with _provider_stats_lock:
+            _provider_lookups += 1
+            if winner is not None:
+                _provider_wins[winner] += 1
+        
+        if winner is not None:
+            metrics_collector.increment(f'barcode_{winner}_win')
+            product = outcomes[winner]
+            # Сохраняем продукт в локальную базу
+            self._save_to_local_database(barcode, product)
+            return product, True
+        
+        failed = [name for name in order if not (name in outcomes and outcomes[name] is None)]
+        for name in failed:
+            outcome = outcomes.get(name, "нет ответа за отведенное время")
+            print(f"Ошибка при запросе {name} для штрихкода {barcode}: {outcome}")
+        
+        # Продукт не найден - это не сбой; сбой - когда не ответил ни один сервис
+        if len(failed) == len(order):
+            raise RuntimeError(f"Нет ответа от сервисов штрихкодов: {', '.join(failed)}")
+        return None, not failed
+    
+    @track_api_call('barcode_edadeal')
+    def _fetch_edadeal(self, barcode, timeout=BARCODE_PROVIDER_TIMEOUT):
+        """
+        Поиск продукта в Edadeal (больше российских продуктов)
+        
+        Args:
+            barcode (str): Штрихкод продукта
+            timeout (float): Таймаут запроса, сек
+            
         Returns:
             dict: Информация о продукте или None, если продукт не найден
+            
+        Raises:
+            Exception: Если сервис ответил ошибкой
         """
-        database_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-                                    'data', 'barcodes.json')
+        response = http_client.get(f"https://api.edadeal.ru/web/v1/product_details?product_id={barcode}", 
+                                   timeout=timeout)
+        if response.status_code >= 500:
+            raise RuntimeError(f"Edadeal: HTTP {response.status_code}")
+        if response.status_code != 200:
+            return None
         
-        if os.path.exists(database_path):
-            try:
-                with open(database_path, 'r', encoding='utf-8') as f:
-                    products = json.load(f)
-                    return products.get(barcode)
-            except:
-                return None
+        data = response.json()
+        if not data or 'product' not in data:
+            return None
         
-        return None
+        product = data['product']
+        # Edadeal не всегда предоставляет полные данные о КБЖУ,
+        # поэтому нужно проверять наличие
+        nutrition = product.get('nutrition', {})
+        
+        return {
+            'name': product.get('title', 'Неизвестный продукт'),
+            'calories': nutrition.get('energy', {}).get('value', 0),
+            'proteins': nutrition.get('proteins', {}).get('value', 0),
+            'fats': nutrition.get('fats', {}).get('value', 0),
+            'carbs': nutrition.get('carbohydrates', {}).get('value', 0),
+            'portion_weight': 100,  # По умолчанию на 100г
+            'barcode': barcode,
+            'estimated': False
+        }
+    
+    @track_api_call('barcode_openfoodfacts')
+    def _fetch_openfoodfacts(self, barcode, timeout=BARCODE_PROVIDER_TIMEOUT):
+        """
+        Поиск продукта в Open Food Facts
+        
+        Args:
+            barcode (str): Штрихкод продукта
+            timeout (float): Таймаут запроса, сек
+            
+        Returns:
+            dict: Информация о продукте или None, если продукт не найден
+            
+        Raises:
+            Exception: Если сервис ответил ошибкой
+        """
+        response = http_client.get(f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json", 
+                                   timeout=timeout)
+        if response.status_code >= 500:
+            raise RuntimeError(f"Open Food Facts: HTTP {response.status_code}")
+        if response.status_code != 200:
+            return None
+        
+        data = response.json()
+        if data.get("status") != 1:
+            return None
+        
+        product = data.get("product", {})
+        nutriments = product.get("nutriments", {})
+        
+        # Получаем название на русском, если доступно
+        product_name = product.get('product_name_ru', product.get('product_name', 'Неизвестный продукт'))
+        
+        return {
+            'name': product_name,
+            'calories': nutriments.get('energy-kcal_100g', 0),
+            'proteins': nutriments.get('proteins_100g', 0),
+            'fats': nutriments.get('fat_100g', 0),
+            'carbs': nutriments.get('carbohydrates_100g', 0),
+            'portion_weight': 100,  # По умолчанию на 100г
+            'barcode': barcode,
+            'estimated': False
+        }
+    
+    def _check_local_database(self, barcode):
+        """
+        Проверка наличия продукта в локальной базе данных
+        
+        Args:
+            barcode (str): Штрихкод продукта
+            
+        Returns:
+            dict: Информация о продукте или None, если продукт не найден
+        """
+        try:
+            return barcode_store.get(barcode)
+        except Exception as e:
+            print(f"Ошибка при чтении локальной базы штрихкодов: {str(e)}")
+            return None
     
     def _save_to_local_database(self, barcode, product_data):
         """
@@ -202,31 +486,14 @@ class BarcodeScanner:
             product_data (dict): Информация о продукте
         """
         # Очистка штрихкода от лишних символов
-        clean_barcode = ''.join(filter(str.isdigit, barcode))
+        clean_barcode = normalize_barcode(barcode)
         
         # Также очищаем штрихкод внутри product_data
         if 'barcode' in product_data:
             product_data['barcode'] = clean_barcode
         
-        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
-        database_path = os.path.join(data_dir, 'barcodes.json')
-        
-        # Создаем директорию, если она не существует
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-        
-        # Загружаем существующие данные или создаем новый словарь
-        products = {}
-        if os.path.exists(database_path):
-            try:
-                with open(database_path, 'r', encoding='utf-8') as f:
-                    products = json.load(f)
-            except:
-                products = {}
-        
-        # Добавляем новый продукт, используя очищенный штрихкод как ключ
-        products[clean_barcode] = product_data
+        barcode_store.put(clean_barcode, product_data)
         
-        # Сохраняем обновленные данные
-        with open(database_path, 'w', encoding='utf-8') as f:
-            json.dump(products, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        # Продукт появился в базе - обновляем кэш в памяти
+        product_cache.set(clean_barcode, copy.deepcopy(product_data))
+        missing_product_cache.delete(clean_barcode)
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import sqlite3
+import threading
+from monitoring.metrics import metrics_collector
+from utils.bloom_filter import BloomFilter
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (BARCODE_DB_PATH, BARCODE_JSON_PATH, BARCODE_BLOOM_FILTER, BARCODE_BLOOM_PATH,
+                    BARCODE_BLOOM_CAPACITY, BARCODE_BLOOM_ERROR_RATE)
+
+# Как часто проверять, не изменил ли базу другой процесс (например, загрузка выгрузки), сек
+BLOOM_STALE_CHECK_INTERVAL = 1.0
+# Через сколько повторить построение фильтра после ошибки, сек
+BLOOM_RETRY_INTERVAL = 60.0
+
+def normalize_barcode(barcode):
+    """Штрихкод без лишних символов (только цифры)"""
+    return ''.join(filter(str.isdigit, str(barcode)))
+
+class BarcodeStore:
+    """
+    Локальная база продуктов по штрихкоду в SQLite.
+
+    Поиск - по первичному ключу, без чтения всей базы; каждая запись - отдельная
+    транзакция, поэтому одновременная запись из нескольких потоков и процессов
+    безопасна (SQLite в режиме WAL, читатели не ждут писателя). Продукт хранится
+    целиком в JSON, как раньше в barcodes.json.
+
+    Перед запросом к базе штрихкод проверяется фильтром Блума по всем
+    известным штрихкодам: "точно нет" отвечается без запроса. Фильтр
+    строится в фоне при запуске (или загружается с диска, если число
+    записей и параметры фильтра не изменились), пополняется при каждой записи
+    и перестраивается, если базу изменил другой процесс; после ошибки
+    построение повторяется. Пока фильтр не готов, запросы идут в базу.
+    """
+
+    def __init__(self, db_path=BARCODE_DB_PATH, json_path=BARCODE_JSON_PATH,
+                 bloom_path=BARCODE_BLOOM_PATH if BARCODE_BLOOM_FILTER else None,
+                 bloom_capacity=BARCODE_BLOOM_CAPACITY, bloom_error_rate=BARCODE_BLOOM_ERROR_RATE):
+        """
+        Args:
+            db_path (str): Путь к файлу базы SQLite
+            json_path (str, optional): Старая база barcodes.json для однократного переноса
+            bloom_path (str, optional): Файл фильтра Блума (None - без фильтра)
+            bloom_capacity (int): Минимальная емкость фильтра (штрихкодов)
+            bloom_error_rate (float): Доля ложных срабатываний фильтра при полной емкости
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+
+        self.bloom_path = bloom_path
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom = None
+        self._bloom_version = None     # PRAGMA data_version на момент построения фильтра
+        self._bloom_pending = None     # штрихкоды, записанные во время построения
+        self._bloom_building = False
+        self._bloom_stale = False
+        self._bloom_checked_at = 0
+        self._bloom_retry_at = 0
+        self._bloom_negatives = 0
+        self._bloom_false_positives = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # timeout - ожидание блокировки, если в базу пишет другой процесс
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS products ('
+                'barcode TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.commit()
+
+        if json_path:
+            self.migrate_from_json(json_path)
+
+        if bloom_path:
+            self._start_bloom_build()
+            metrics_collector.register_gauge_provider(self.bloom_stats)
+            atexit.register(self.save_bloom)
+
+    def get(self, barcode):
+        """
+        Поиск продукта по штрихкоду
+
+        Args:
+            barcode (str): Штрихкод
+
+        Returns:
+            dict: Информация о продукте или None
+        """
+        barcode = normalize_barcode(barcode)
+        maybe_present = self._might_contain(barcode)
+        if maybe_present is False:
+            return None
+
+        with self.lock:
+            row = self._conn.execute(
+                'SELECT data FROM products WHERE barcode = ?', (barcode,)
+            ).fetchone()
+            if row is None and maybe_present is not None:
+                self._bloom_false_positives += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def might_contain(self, barcode):
+        """
+        Проверка по фильтру Блума
+
+        Args:
+            barcode (str): Штрихкод
+
+        Returns:
+            bool: False - штрихкода точно нет в базе, True - возможно есть,
+                  None - фильтр не готов (нужен запрос к базе)
+        """
+        return self._might_contain(normalize_barcode(barcode))
+
+    def _might_contain(self, barcode):
+        bloom = self.bloom
+        if self._is_bloom_stale() or bloom is None:
+            return None
+        if barcode in bloom:
+            return True
+        # Счетчик без блокировки: неточность на гонках для метрики не важна
+        self._bloom_negatives += 1
+        return False
+
+    def __contains__(self, barcode):
+        with self.lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM products WHERE barcode = ?', (normalize_barcode(barcode),)
+            ).fetchone()
+        return row is not None
+
+    def put(self, barcode, product_data):
+        """
+        Сохранение продукта (существующая запись заменяется)
+
+        Args:
+            barcode (str): Штрихкод
+            product_data (dict): Информация о продукте
+        """
+        self.put_many({barcode: product_data})
+
+    def put_many(self, products, replace=True):
+        """
+        Сохранение нескольких продуктов одной транзакцией
+
+        Args:
+            products (dict): Штрихкод -> информация о продукте
+            replace (bool): Заменять существующие записи (False - оставлять их)
+        """
+        now = time.time()
+        rows = [(normalize_barcode(barcode), json.dumps(product_data, ensure_ascii=False), now)
+                for barcode, product_data in products.items()]
+        statement = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        with self.lock:
+            with self._conn:
+                self._conn.executemany(
+                    f'{statement} INTO products (barcode, data, updated_at) VALUES (?, ?, ?)', rows
+                )
+            self._add_to_bloom(row[0] for row in rows)
+
+    def upsert_many(self, rows):
+        """
+        Сохранение продуктов с отметкой времени: существующая запись
+        заменяется, только если новая свежее (для загрузки выгрузок и их
+        обновлений; повторная загрузка того же файла ничего не меняет)
+
+        Args:
+            rows (iterable): Кортежи (штрихкод, информация о продукте, время изменения)
+
+        Returns:
+            int: Количество добавленных или обновленных записей
+        """
+        rows = [(normalize_barcode(barcode), json.dumps(product_data, ensure_ascii=False), updated_at)
+                for barcode, product_data, updated_at in rows]
+        with self.lock:
+            changes_before = self._conn.total_changes
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO products (barcode, data, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(barcode) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at '
+                    'WHERE excluded.updated_at > products.updated_at', rows
+                )
+            self._add_to_bloom(row[0] for row in rows)
+            return self._conn.total_changes - changes_before
+
+    def __len__(self):
+        with self.lock:
+            return self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def _add_to_bloom(self, barcodes):
+        """Пополнение фильтра записанными штрихкодами (вызывается под self.lock)"""
+        barcodes = list(barcodes)
+        if self.bloom is not None:
+            for barcode in barcodes:
+                self.bloom.add(barcode)
+        # Во время перестроения запоминаем и для нового фильтра
+        if self._bloom_pending is not None:
+            self._bloom_pending.extend(barcodes)
+
+    def _data_version(self):
+        """Счетчик изменений базы другими соединениями (вызывается под self.lock)"""
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _is_bloom_stale(self):
+        """Изменил ли базу другой процесс после построения фильтра (тогда фильтр перестраивается)"""
+        now = time.monotonic()
+        if self._bloom_stale:
+            # Прошлое построение не удалось - повторяем не чаще BLOOM_RETRY_INTERVAL
+            if not self._bloom_building and now >= self._bloom_retry_at:
+                self._start_bloom_build()
+            return True
+        if self._bloom_version is None or now - self._bloom_checked_at < BLOOM_STALE_CHECK_INTERVAL:
+            return False
+        with self.lock:
+            self._bloom_checked_at = now
+            if self._data_version() != self._bloom_version:
+                self._bloom_stale = True
+        if self._bloom_stale:
+            self._start_bloom_build()
+        return self._bloom_stale
+
+    def _start_bloom_build(self):
+        with self.lock:
+            if self._bloom_building:
+                return
+            self._bloom_building = True
+            self._bloom_pending = []
+        threading.Thread(target=self._build_bloom, name='barcode_bloom', daemon=True).start()
+
+    def _build_bloom(self):
+        """Построение фильтра по всем штрихкодам базы (или загрузка с диска)"""
+        try:
+            started = time.time()
+            with self.lock:
+                version = self._data_version()
+                count = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+            # Сохраненный фильтр подходит, если с тех пор число записей не изменилось,
+            # а построен он с теми же настройками (BARCODE_BLOOM_ERROR_RATE, емкость)
+            bloom, saved_count = BloomFilter.load(self.bloom_path)
+            if (bloom is None or saved_count != count or count > bloom.capacity
+                    or bloom.capacity < self.bloom_capacity
+                    or not math.isclose(bloom.error_rate, self.bloom_error_rate)):
+                bloom = BloomFilter(max(self.bloom_capacity, 2 * count), self.bloom_error_rate)
+                # Отдельное соединение: чтение не мешает поиску и записи
+                reader = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    for (barcode,) in reader.execute('SELECT barcode FROM products'):
+                        bloom.add(barcode)
+                finally:
+                    reader.close()
+                bloom.save(self.bloom_path, tag=count)
+
+            with self.lock:
+                for barcode in self._bloom_pending or ():
+                    bloom.add(barcode)
+                self.bloom = bloom
+                self._bloom_version = version
+                self._bloom_pending = None
+                self._bloom_stale = False
+            print(f"Фильтр штрихкодов: {count} шт., {bloom.memory_bytes // 1024} КБ, "
+                  f"ожидаемая доля ложных срабатываний {bloom.false_positive_rate():.2%} "
+                  f"({time.time() - started:.1f} с)")
+        except Exception as e:
+            print(f"Ошибка при построении фильтра штрихкодов: {str(e)}")
+            with self.lock:
+                # Фильтр остается неактуальным (запросы идут в базу), пока не
+                # удастся повторное построение; записи больше не копим
+                self._bloom_pending = None
+                self._bloom_stale = True
+                self._bloom_retry_at = time.monotonic() + BLOOM_RETRY_INTERVAL
+        finally:
+            with self.lock:
+                self._bloom_building = False
+
+    def save_bloom(self):
+        """Сохранение фильтра на диск (при завершении работы)"""
+        if self.bloom is None or self._is_bloom_stale():
+            return
+        with self.lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+            self.bloom.save(self.bloom_path, tag=count)
+
+    def bloom_stats(self):
+        """Показатели фильтра для /metrics"""
+        bloom = self.bloom
+        if bloom is None:
+            return {'barcode_bloom_ready': False}
+        with self.lock:
+            checked = self._bloom_negatives + self._bloom_false_positives
+            observed_rate = self._bloom_false_positives / checked if checked else 0
+        return {
+            'barcode_bloom_ready': not self._bloom_stale,
+            'barcode_bloom_items': bloom.count,
+            'barcode_bloom_memory_kb': bloom.memory_bytes // 1024,
+            'barcode_bloom_bytes_per_million': round(bloom.bit_count / 8 / bloom.capacity * 1000000),
+            'barcode_bloom_expected_fpr': round(bloom.false_positive_rate(), 5),
+            'barcode_bloom_observed_fpr': round(observed_rate, 5),
+        }
+
+    def migrate_from_json(self, json_path):
+        """
+        Однократный перенос продуктов из barcodes.json. Записи, уже
+        сохраненные в SQLite, не перезаписываются; факт переноса
+        запоминается в таблице meta, сам файл не изменяется.
+
+        Args:
+            json_path (str): Путь к barcodes.json
+
+        Returns:
+            int: Количество перенесенных продуктов
+        """
+        if not os.path.exists(json_path):
+            return 0
+
+        with self.lock:
+            migrated = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'json_migrated'"
+            ).fetchone()
+        if migrated is not None:
+            return 0
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                products = json.load(f)
+        except Exception as e:
+            print(f"Ошибка при чтении {json_path}: {str(e)}")
+            return 0
+
+        rows = [(normalize_barcode(barcode), json.dumps(product_data, ensure_ascii=False), time.time())
+                for barcode, product_data in products.items()]
+        with self.lock:
+            # Перенос и отметка о нем - одна транзакция: второй процесс,
+            # запущенный одновременно, увидит отметку и пропустит перенос
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                    return 0
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO products (barcode, data, updated_at) VALUES (?, ?, ?)', rows
+                )
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_path,)
+                )
+        print(f"Перенесено {len(rows)} продуктов из {json_path} в {self.db_path}")
+        return len(rows)
+
+# Глобальная локальная база штрихкодов
+barcode_store = BarcodeStore()
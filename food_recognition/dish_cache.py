@@ -0,0 +1,230 @@
+import os
+import re
+import sys
+import copy
+from typing import Dict, Any, List, Tuple
+from utils.cache import LRUCache, SQLiteCache
+from monitoring.metrics import metrics_collector
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DISH_CACHE_SIZE, DISH_CACHE_TTL, DISH_CACHE_DB, DISH_CACHE_ESTIMATED_TTL
+from food_recognition.nutrition_calc import NutritionCalculator
+
+# Служебные слова, не влияющие на выбор блюда
+STOPWORDS = {
+    'и', 'в', 'во', 'с', 'со', 'на', 'из', 'по', 'для', 'без', 'к', 'ко', 'а',
+    'или', 'под', 'при', 'от', 'до', 'у', 'о', 'об',
+    'with', 'and', 'the', 'a', 'an', 'of', 'in', 'on', 'for',
+}
+
+# Транслитерация латиницы в кириллицу (сначала многобуквенные сочетания)
+TRANSLIT_TABLE = [
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'),
+    ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'), ('yo', 'е'), ('ye', 'е'),
+    ('a', 'а'), ('b', 'б'), ('v', 'в'), ('g', 'г'), ('d', 'д'), ('e', 'е'), ('z', 'з'),
+    ('i', 'и'), ('y', 'ы'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'),
+    ('p', 'п'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('f', 'ф'), ('h', 'х'),
+    ('c', 'к'), ('w', 'в'), ('x', 'кс'), ('q', 'к'), ('j', 'й'),
+]
+TRANSLIT_PATTERN = re.compile('|'.join(latin for latin, _ in TRANSLIT_TABLE))
+TRANSLIT_MAP = dict(TRANSLIT_TABLE)
+
+# Окончания для упрощенного стемминга (от длинных к коротким)
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов', 'ев',
+    'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю',
+    'а', 'я', 'ы', 'и', 'е', 'о', 'у', 'ю', 'й',
+], key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+# Шаги нормализации, не меняющие смысла названия
+EXACT_STEPS = ('exact', 'casefold')
+
+def casefold_text(text: str) -> str:
+    """Нижний регистр, ё -> е, без знаков препинания и лишних пробелов"""
+    text = text.casefold().replace('ё', 'е')
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+def transliterate(text: str) -> str:
+    """Латиница -> кириллица (borsch -> борщ)"""
+    return TRANSLIT_PATTERN.sub(lambda match: TRANSLIT_MAP[match.group(0)], text)
+
+def stem_word(word: str) -> str:
+    """Отсечение окончания и мягкого/твердого знака (пельмени, pelmeni -> пелмен)"""
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            word = word[:-len(ending)]
+            break
+    return word.replace('ь', '').replace('ъ', '')
+
+def normalization_keys(food_name: str) -> List[Tuple[str, str]]:
+    """
+    Ключи кэша от самого точного к самому общему
+
+    Args:
+        food_name (str): Название блюда, введенное пользователем
+
+    Returns:
+        list: Пары (шаг нормализации, ключ); шаги, не изменившие текст, пропускаются
+    """
+    steps = []
+    text = food_name.strip()
+    steps.append(('exact', text))
+
+    text = casefold_text(text)
+    steps.append(('casefold', text))
+
+    # Если все слова служебные, оставляем текст как есть
+    words = [word for word in text.split() if word not in STOPWORDS] or text.split()
+    text = ' '.join(words)
+    steps.append(('stopwords', text))
+
+    text = transliterate(text)
+    steps.append(('translit', text))
+
+    # Порядок слов не важен: "со сметаной борщ" и "борщ со сметаной"
+    text = ' '.join(sorted(stem_word(word) for word in text.split()))
+    steps.append(('stem', text))
+
+    keys = []
+    for step, key in steps:
+        if key and (not keys or keys[-1][1] != key):
+            keys.append((step, key))
+    return keys
+
+class DishLookupCache:
+    """
+    Кэш поиска КБЖУ по названию блюда, введенному пользователем.
+
+    Название проверяется по ключам с возрастающей степенью нормализации
+    (регистр, служебные слова, транслитерация, стемминг). Верхний уровень -
+    LRU в памяти, нижний - SQLite. В метриках учитывается шаг, на котором
+    нашелся результат. Оба уровня очищаются, когда меняются данные о
+    пищевой ценности (NutritionCalculator.data_version).
+    """
+
+    def __init__(self, resolver=NutritionCalculator.lookup_nutrition,
+                 max_size=DISH_CACHE_SIZE, ttl=DISH_CACHE_TTL, db_path=DISH_CACHE_DB,
+                 estimated_ttl=DISH_CACHE_ESTIMATED_TTL, data_version=NutritionCalculator.data_version):
+        """
+        Args:
+            resolver (callable): Поиск КБЖУ по названию при промахе кэша
+            max_size (int): Максимальное количество ключей в памяти
+            ttl (float): Время жизни записи в секундах
+            db_path (str, optional): Путь к SQLite-файлу (None - только память)
+            estimated_ttl (float): Время жизни оценочного результата (блюда нет в базе)
+            data_version (callable): Версия данных, на которых получены результаты
+        """
+        self.resolver = resolver
+        self.estimated_ttl = estimated_ttl
+        self.data_version = data_version
+        self.memory = LRUCache(max_size=max_size, ttl=ttl, name='dish_cache_memory')
+        self.disk = None
+        self.meta = None
+        if db_path:
+            self.disk = SQLiteCache(db_path, table='dish_lookup', ttl=ttl, name='dish_cache_disk')
+            self.meta = SQLiteCache(db_path, table='dish_lookup_meta', name='dish_cache_meta')
+        self._version = None
+        self._check_data_version()
+        metrics_collector.register_gauge_provider(lambda: {'dish_cache_memory_size': len(self.memory)})
+
+    def _check_data_version(self):
+        """Очистка кэша, если данные о пищевой ценности изменились"""
+        version = self.data_version()
+        if version == self._version:
+            return
+        if self._version is not None:
+            self.memory.clear()
+        if self.disk is not None and self.meta.get('data_version') != version:
+            removed = self.disk.clear()
+            self.meta.set('data_version', version)
+            if removed:
+                print(f"Данные о пищевой ценности изменились, кэш блюд очищен ({removed} записей)")
+        self._version = version
+
+    def lookup(self, food_name: str) -> Dict[str, Any]:
+        """
+        Поиск КБЖУ по названию блюда
+
+        Args:
+            food_name (str): Название блюда
+
+        Returns:
+            dict: Информация о пищевой ценности (name - введенное название)
+        """
+        self._check_data_version()
+        keys = normalization_keys(food_name)
+        if not keys:
+            return self.resolver(food_name)
+
+        result, hit_index = self._find(keys)
+        if result is None:
+            metrics_collector.increment('dish_cache_miss')
+            result = self.resolver(food_name)
+            translit_key = dict(keys).get('translit')
+            if result.get('estimated') and translit_key:
+                # Название латиницей: пробуем кириллическое написание (plov -> плов)
+                translit_result = self.resolver(translit_key)
+                if not translit_result.get('estimated'):
+                    result = translit_result
+            self._store(keys, result)
+        else:
+            step = keys[hit_index][0]
+            metrics_collector.increment(f'dish_cache_hit_{step}')
+            # Более точные ключи тоже запоминаем, чтобы следующий такой же запрос нашелся сразу
+            if hit_index > 0:
+                self._remember(keys[:hit_index], result)
+
+        result = copy.deepcopy(result)
+        result['name'] = food_name
+        return result
+
+    def _find(self, keys):
+        """Поиск по ключам сначала в памяти, затем на диске"""
+        for index, (_, key) in enumerate(keys):
+            result = self.memory.get(key, track=False)
+            if result is not None:
+                return result, index
+
+        if self.disk is not None:
+            for index, (_, key) in enumerate(keys):
+                result = self.disk.get(key)
+                if result is not None:
+                    self._remember([keys[index]], result)
+                    return result, index
+
+        return None, None
+
+    def _storage_rule(self, keys, result):
+        """
+        Ключи и время жизни для результата
+
+        Returns:
+            tuple: (ключи, под которыми можно хранить результат, ttl или None - по умолчанию)
+        """
+        if not result.get('estimated'):
+            return keys, None
+        # Оценочный результат - только под точными ключами: по более общему
+        # ключу другое написание могло бы найтись в базе
+        return [(step, key) for step, key in keys if step in EXACT_STEPS], self.estimated_ttl
+
+    def _remember(self, keys, result):
+        """Перенос найденного результата в память (по тем же правилам, что и _store)"""
+        keys, ttl = self._storage_rule(keys, result)
+        for _, key in keys:
+            self.memory.set(key, result, ttl=ttl)
+
+    def _store(self, keys, result):
+        """Сохранение результата под всеми ключами нормализации"""
+        result = copy.deepcopy(result)
+        keys, ttl = self._storage_rule(keys, result)
+        for _, key in keys:
+            self.memory.set(key, result, ttl=ttl)
+        if self.disk is not None:
+            self.disk.set_many({key: result for _, key in keys}, ttl=ttl)
+
+# Глобальный кэш поиска блюд по названию
+dish_cache = DishLookupCache()
@@ -0,0 +1,474 @@
+"""
+Компактная база пищевой ценности в бинарном формате с загрузкой через mmap.
+
+Сборка из CSV/JSON:
+    python -m food_recognition.food_db build foods.csv -o data/food_db.bin --with-builtin
+Проверка:
+    python -m food_recognition.food_db info data/food_db.bin
+    python -m food_recognition.food_db lookup data/food_db.bin "борщ"
+
+Формат (little-endian, секции выровнены по 8 байт):
+    заголовок:   magic b'NFDB', версия u32, количество строк u32, количество секций u32
+    оглавление:  для каждой секции - тег (4 байта), смещение u64, размер u64
+    'STRS':      названия в UTF-8 подряд
+    'KIDX':      для каждой строки (u32 смещение, u32 длина) названия; строки
+                 отсортированы по байтам названия, поэтому индекс - двоичный поиск
+    'VALS':      4 столбца float32 по количеству строк: калории, белки, жиры, углеводы на 100 г
+    'TGIX':      индекс триграмм для нечеткого поиска: (u64 триграмма, u32 начало, u32 длина
+                 списка в TGPL), отсортирован по триграмме
+    'TGPL':      списки номеров строк (u32) для каждой триграммы
+
+Файл не разбирается при загрузке: страницы подгружаются по мере обращения
+и разделяются между процессами, открывшими один и тот же файл.
+"""
+import os
+import io
+import csv
+import sys
+import json
+import mmap
+import bisect
+import struct
+import argparse
+from array import array
+from food_recognition.fuzzy_match import trigram_keys
+
+MAGIC = b'NFDB'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+SECTION = struct.Struct('<4sQQ')
+KEY_ENTRY = struct.Struct('<II')
+FLOAT = struct.Struct('<f')
+TRIGRAM_ENTRY = struct.Struct('<QII')
+COLUMNS = ('calories', 'proteins', 'fats', 'carbs')
+
+# Возможные названия столбцов в исходных CSV/JSON
+COLUMN_ALIASES = {
+    'name': ('name', 'title', 'product', 'food', 'название'),
+    'calories': ('calories', 'kcal', 'energy_kcal', 'energy-kcal_100g', 'калории'),
+    'proteins': ('proteins', 'protein', 'proteins_100g', 'белки'),
+    'fats': ('fats', 'fat', 'fat_100g', 'жиры'),
+    'carbs': ('carbs', 'carbohydrates', 'carbohydrates_100g', 'углеводы'),
+}
+
+def normalize_key(name):
+    """Ключ базы: нижний регистр без лишних пробелов"""
+    return ' '.join(str(name).lower().split())
+
+def word_ngrams(query):
+    """
+    Словосочетания запроса от самых длинных к коротким
+    ("борщ со сметаной" -> "борщ со сметаной", "борщ со", "со сметаной", "борщ", ...)
+    """
+    words = normalize_key(query).split()
+    for size in range(len(words), 0, -1):
+        for start in range(len(words) - size + 1):
+            yield ' '.join(words[start:start + size])
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+def write_database(path, foods):
+    """
+    Запись базы в бинарный файл (атомарно, через временный файл)
+
+    Args:
+        path (str): Путь к файлу базы
+        foods (dict): Название -> [калории, белки, жиры, углеводы] на 100 г
+
+    Returns:
+        int: Количество записанных строк
+    """
+    # После нормализации могли появиться дубликаты - остается последний
+    unique = {}
+    for name, values in foods.items():
+        key = normalize_key(name)
+        if key:
+            unique[key] = values
+    # Сортировка строк по кодам символов совпадает с сортировкой по байтам UTF-8
+    keys = sorted(unique)
+
+    strings = io.BytesIO()
+    key_index = io.BytesIO()
+    for key in keys:
+        encoded = key.encode('utf-8')
+        key_index.write(KEY_ENTRY.pack(strings.tell(), len(encoded)))
+        strings.write(encoded)
+
+    values = io.BytesIO()
+    for column in range(len(COLUMNS)):
+        for key in keys:
+            values.write(FLOAT.pack(float(unique[key][column] or 0)))
+
+    # Инвертированный индекс триграмм для нечеткого поиска
+    postings = {}
+    for row, key in enumerate(keys):
+        for trigram in trigram_keys(key):
+            postings.setdefault(trigram, array('I')).append(row)
+    trigram_index = io.BytesIO()
+    trigram_postings = array('I')
+    for trigram in sorted(postings):
+        trigram_index.write(TRIGRAM_ENTRY.pack(trigram, len(trigram_postings), len(postings[trigram])))
+        trigram_postings.extend(postings[trigram])
+    if sys.byteorder != 'little':
+        trigram_postings.byteswap()
+
+    sections = [
+        (b'STRS', strings.getvalue()),
+        (b'KIDX', key_index.getvalue()),
+        (b'VALS', values.getvalue()),
+        (b'TGIX', trigram_index.getvalue()),
+        (b'TGPL', trigram_postings.tobytes()),
+    ]
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table = []
+    for tag, data in sections:
+        table.append((tag, offset, len(data)))
+        offset = _align(offset + len(data))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), len(sections)))
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        for (tag, section_offset, _), (_, data) in zip(table, sections):
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(data)
+    os.replace(temp_path, path)
+    return len(keys)
+
+class FoodDatabase:
+    """
+    База пищевой ценности, отображенная в память (только чтение).
+
+    Поиск по ключу - двоичный поиск по индексу отсортированных названий;
+    частичный поиск - по словосочетаниям запроса и по префиксу.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Путь к файлу базы
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.row_count, section_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"Неподдерживаемый формат базы продуктов: {path}")
+
+        self.sections = {}
+        for i in range(section_count):
+            tag, offset, size = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            self.sections[tag] = (offset, size)
+
+        self._strings_offset = self.sections[b'STRS'][0]
+        self._index_offset = self.sections[b'KIDX'][0]
+        self._values_offset = self.sections[b'VALS'][0]
+
+        # Индекс триграмм есть только в базах, собранных с нечетким поиском
+        self._trigram_count = 0
+        self._postings = None
+        if b'TGIX' in self.sections and b'TGPL' in self.sections:
+            self._trigram_offset, trigram_size = self.sections[b'TGIX']
+            self._trigram_count = trigram_size // TRIGRAM_ENTRY.size
+            postings_offset, postings_size = self.sections[b'TGPL']
+            trigram_view = memoryview(self._mm)[self._trigram_offset:self._trigram_offset + trigram_size]
+            postings_view = memoryview(self._mm)[postings_offset:postings_offset + postings_size]
+            if sys.byteorder == 'little':
+                # Индекс и списки читаются прямо из отображенного файла
+                trigram_entries = trigram_view.cast('Q')
+                self._postings = postings_view.cast('I')
+            else:
+                trigram_entries = array('Q', trigram_view.tobytes())
+                trigram_entries.byteswap()
+                self._postings = array('I', postings_view.tobytes())
+                self._postings.byteswap()
+                trigram_view.release()
+                postings_view.release()
+            # Запись TGIX - два u64: триграмма и (начало | длина << 32); через срезы
+            # с шагом двоичный поиск идет в bisect, без распаковки каждой записи
+            self._trigram_keys = memoryview(trigram_entries)[::2]
+            self._trigram_spans = memoryview(trigram_entries)[1::2]
+
+    @classmethod
+    def open_if_exists(cls, path):
+        """
+        Открытие базы, если файл существует
+
+        Returns:
+            FoodDatabase: База или None (файла нет или он поврежден)
+        """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            print(f"Ошибка при открытии базы продуктов {path}: {str(e)}")
+            return None
+
+    def __len__(self):
+        return self.row_count
+
+    def key_bytes(self, row):
+        """Название строки row в UTF-8"""
+        offset, length = KEY_ENTRY.unpack_from(self._mm, self._index_offset + row * KEY_ENTRY.size)
+        start = self._strings_offset + offset
+        return self._mm[start:start + length]
+
+    def key(self, row):
+        """Название строки row"""
+        return self.key_bytes(row).decode('utf-8')
+
+    def values(self, row):
+        """
+        Пищевая ценность строки row
+
+        Returns:
+            list: [калории, белки, жиры, углеводы] на 100 г
+        """
+        result = []
+        for column in range(len(COLUMNS)):
+            offset = self._values_offset + (column * self.row_count + row) * FLOAT.size
+            result.append(round(FLOAT.unpack_from(self._mm, offset)[0], 2))
+        return result
+
+    def column_buffer(self, column):
+        """
+        Столбец значений без копирования (для numpy.frombuffer с dtype '<f4')
+
+        Args:
+            column (int): Номер столбца (см. COLUMNS)
+
+        Returns:
+            memoryview: row_count значений float32
+        """
+        start = self._values_offset + column * self.row_count * FLOAT.size
+        return memoryview(self._mm)[start:start + self.row_count * FLOAT.size]
+
+    def name(self, row):
+        """Название строки row (для нечеткого поиска)"""
+        return self.key(row)
+
+    def postings(self, trigram):
+        """
+        Строки, в названии которых есть триграмма
+
+        Args:
+            trigram (int): Триграмма (см. fuzzy_match.pack_trigram)
+
+        Returns:
+            Последовательность номеров строк
+        """
+        if self._postings is None:
+            return ()
+        position = bisect.bisect_left(self._trigram_keys, trigram)
+        if position == self._trigram_count or self._trigram_keys[position] != trigram:
+            return ()
+        span = self._trigram_spans[position]
+        start, count = span & 0xFFFFFFFF, span >> 32
+        return self._postings[start:start + count]
+
+    def _lower_bound(self, key_bytes):
+        """Первая строка, название которой не меньше key_bytes"""
+        low, high = 0, self.row_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_bytes(middle) < key_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_row(self, key):
+        """
+        Строка с точно совпадающим названием
+
+        Args:
+            key (str): Нормализованное название
+
+        Returns:
+            int: Номер строки или None
+        """
+        key_bytes = normalize_key(key).encode('utf-8')
+        row = self._lower_bound(key_bytes)
+        if row < self.row_count and self.key_bytes(row) == key_bytes:
+            return row
+        return None
+
+    def find_prefix_rows(self, prefix, limit=100):
+        """
+        Строки, названия которых начинаются с prefix (в порядке сортировки)
+
+        Args:
+            prefix (str): Начало названия
+            limit (int): Максимум строк
+
+        Returns:
+            list: Номера строк
+        """
+        prefix_bytes = normalize_key(prefix).encode('utf-8')
+        if not prefix_bytes:
+            return []
+        rows = []
+        row = self._lower_bound(prefix_bytes)
+        while row < self.row_count and len(rows) < limit and self.key_bytes(row).startswith(prefix_bytes):
+            rows.append(row)
+            row += 1
+        return rows
+
+    def find_partial_row(self, query, min_prefix_length=3):
+        """
+        Частичный поиск названия
+
+        Сначала ищутся словосочетания запроса, от самых длинных к коротким
+        ("борщ со сметаной" -> "борщ со сметаной", "борщ со", "со сметаной",
+        "борщ", ...), затем самое короткое название, начинающееся с запроса.
+
+        Args:
+            query (str): Нормализованное название
+            min_prefix_length (int): Минимальная длина запроса для поиска по префиксу
+
+        Returns:
+            int: Номер строки или None
+        """
+        for phrase in word_ngrams(query):
+            row = self.find_row(phrase)
+            if row is not None:
+                return row
+        return self.find_shortest_prefix_row(query, min_prefix_length)
+
+    def find_shortest_prefix_row(self, query, min_prefix_length=3):
+        """
+        Самое короткое название, начинающееся с запроса
+
+        Args:
+            query (str): Нормализованное название
+            min_prefix_length (int): Минимальная длина запроса
+
+        Returns:
+            int: Номер строки или None
+        """
+        if len(query) < min_prefix_length:
+            return None
+        rows = self.find_prefix_rows(query)
+        if not rows:
+            return None
+        return min(rows, key=lambda row: (len(self.key_bytes(row)), row))
+
+    def items(self):
+        """Все строки: (название, [калории, белки, жиры, углеводы])"""
+        for row in range(self.row_count):
+            yield self.key(row), self.values(row)
+
+    @property
+    def has_trigram_index(self):
+        """Есть ли в базе индекс триграмм для нечеткого поиска"""
+        return self._postings is not None
+
+    def close(self):
+        if self._postings is not None:
+            self._trigram_keys.release()
+            self._trigram_spans.release()
+        if isinstance(self._postings, memoryview):
+            self._postings.release()
+        self._mm.close()
+
+def _pick(record, column):
+    """Значение столбца по одному из допустимых названий"""
+    for alias in COLUMN_ALIASES[column]:
+        if alias in record and record[alias] not in (None, ''):
+            return record[alias]
+    return None
+
+def _to_float(value):
+    try:
+        return float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        return 0.0
+
+def load_source(path):
+    """
+    Чтение исходной таблицы продуктов
+
+    Поддерживаются CSV с заголовком (name, calories, proteins, fats, carbs или
+    синонимы из COLUMN_ALIASES), JSON-словарь {название: [к, б, ж, у]} как
+    NUTRITION_DB и JSON-список объектов со столбцами как в CSV.
+
+    Args:
+        path (str): Путь к файлу
+
+    Returns:
+        dict: Название -> [калории, белки, жиры, углеводы]
+    """
+    foods = {}
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            for name, values in data.items():
+                foods[name] = [_to_float(value) for value in list(values)[:4]]
+            return foods
+        records = data
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            records = list(csv.DictReader(f))
+
+    for record in records:
+        record = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+        name = _pick(record, 'name')
+        if name:
+            foods[name] = [_to_float(_pick(record, column)) for column in COLUMNS]
+    return foods
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сборка и проверка бинарной базы продуктов")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Собрать базу из CSV/JSON")
+    build_parser.add_argument('sources', nargs='+', help="Исходные файлы CSV или JSON")
+    build_parser.add_argument('-o', '--output', default='data/food_db.bin', help="Файл базы")
+    build_parser.add_argument('--with-builtin', action='store_true',
+                              help="Добавить встроенный словарь NutritionCalculator.NUTRITION_DB")
+
+    info_parser = subparsers.add_parser('info', help="Показать сведения о базе")
+    info_parser.add_argument('path')
+
+    lookup_parser = subparsers.add_parser('lookup', help="Найти продукт в базе")
+    lookup_parser.add_argument('path')
+    lookup_parser.add_argument('name')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        foods = {}
+        if args.with_builtin:
+            sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            from food_recognition.nutrition_calc import NutritionCalculator
+            foods.update(NutritionCalculator.NUTRITION_DB)
+        for source in args.sources:
+            foods.update(load_source(source))
+        count = write_database(args.output, foods)
+        print(f"Записано {count} продуктов в {args.output} ({os.path.getsize(args.output)} байт)")
+    elif args.command == 'info':
+        database = FoodDatabase(args.path)
+        print(f"Продуктов: {len(database)}")
+        for tag, (offset, size) in database.sections.items():
+            print(f"Секция {tag.decode()}: смещение {offset}, размер {size} байт")
+    elif args.command == 'lookup':
+        database = FoodDatabase(args.path)
+        row = database.find_row(args.name)
+        if row is None:
+            row = database.find_partial_row(args.name)
+        if row is None:
+            print("Не найдено")
+        else:
+            print(database.key(row), dict(zip(COLUMNS, database.values(row))))
+
+if __name__ == '__main__':
+    main()
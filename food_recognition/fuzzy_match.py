@@ -0,0 +1,206 @@
+from array import array
+from collections import Counter
+import numpy as np
+
+# Кандидатов после отбора по триграммам, которые сравниваются посимвольно
+MAX_CANDIDATES = 10
+# Сколько номеров из списков триграмм просматривается на запрос: списки берутся
+# от редких к частым, частые триграммы почти не отличают названия друг от друга
+MAX_SCANNED_POSTINGS = 4000
+# Столько самых редких триграмм запроса просматриваются всегда
+MIN_TRIGRAMS = 3
+
+def fold_text(text):
+    """Приведение к виду для сравнения: нижний регистр, е вместо ё, без ь/ъ и лишних пробелов"""
+    text = text.lower().replace('ё', 'е').replace('ь', '').replace('ъ', '')
+    return ' '.join(text.split())
+
+def pack_trigram(trigram):
+    """Триграмма как целое число (по 21 бит на символ) - для хранения в бинарной базе"""
+    return (ord(trigram[0]) << 42) | (ord(trigram[1]) << 21) | ord(trigram[2])
+
+def trigram_keys(text):
+    """
+    Множество триграмм названия (с отступами, чтобы начало и конец слова
+    давали отдельные триграммы)
+
+    Args:
+        text (str): Название
+
+    Returns:
+        set: Триграммы в виде целых чисел
+    """
+    padded = f'  {fold_text(text)} '
+    return {pack_trigram(padded[i:i + 3]) for i in range(len(padded) - 2)}
+
+def bag_distance(first_counts, second):
+    """
+    Нижняя граница расстояния редактирования по составу символов (без учета
+    порядка): каждая правка меняет состав не больше чем на символ с каждой стороны
+
+    Args:
+        first_counts (Counter): Символы первой строки
+        second (str): Вторая строка
+
+    Returns:
+        int: Нижняя граница расстояния
+    """
+    second_counts = Counter(second)
+    return max(sum((first_counts - second_counts).values()), sum((second_counts - first_counts).values()))
+
+def damerau_levenshtein(first, second, max_distance=None):
+    """
+    Расстояние Дамерау-Левенштейна (вариант с ограниченной транспозицией):
+    вставка, удаление, замена и перестановка соседних символов
+
+    Args:
+        first (str): Первая строка
+        second (str): Вторая строка
+        max_distance (int, optional): Если расстояние точно больше - вернуть max_distance + 1
+
+    Returns:
+        int: Расстояние
+    """
+    # Общие начало и конец не влияют на расстояние: при одной опечатке
+    # сравнивать остается несколько символов
+    start = 0
+    limit = min(len(first), len(second))
+    while start < limit and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < limit - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+
+    if not first or not second:
+        distance = max(len(first), len(second))
+        return distance if max_distance is None else min(distance, max_distance + 1)
+    if max_distance is None:
+        max_distance = max(len(first), len(second))
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    # Считаем только полосу |i - j| <= max_distance: остальные клетки заведомо больше
+    too_far = max_distance + 1
+    previous_previous = None
+    previous = [j if j <= max_distance else too_far for j in range(len(second) + 1)]
+    for i in range(1, len(first) + 1):
+        low = max(1, i - max_distance)
+        high = min(len(second), i + max_distance)
+        current = [too_far] * (len(second) + 1)
+        if i <= max_distance:
+            current[0] = i
+        first_char = first[i - 1]
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = 0 if first_char == second[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and j > 1 and first_char == second[j - 2]
+                    and first[i - 2] == second[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        previous_previous, previous = previous, current
+    return min(previous[-1], too_far)
+
+class TrigramIndex:
+    """Инвертированный индекс триграмм в памяти (для небольших словарей)"""
+
+    def __init__(self, names):
+        """
+        Args:
+            names (list): Названия; результатом поиска являются их индексы
+        """
+        self.names = list(names)
+        self._postings = {}
+        for name_id, name in enumerate(self.names):
+            for key in trigram_keys(name):
+                self._postings.setdefault(key, array('I')).append(name_id)
+
+    def postings(self, key):
+        """Индексы названий, содержащих триграмму"""
+        return self._postings.get(key, ())
+
+    def name(self, name_id):
+        return self.names[name_id]
+
+def find_best_match(query, index, min_confidence=0.7, max_candidates=MAX_CANDIDATES):
+    """
+    Поиск наиболее похожего названия с учетом опечаток
+
+    Кандидаты отбираются по числу общих триграмм (не больше max_candidates,
+    просматриваются списки самых редких триграмм), затем сравниваются расстоянием
+    Дамерау-Левенштейна. Уверенность - 1 - расстояние / длина большей строки.
+
+    Args:
+        query (str): Название из запроса
+        index: Индекс с методами postings(ключ триграммы) и name(индекс)
+        min_confidence (float): Минимальная уверенность
+        max_candidates (int): Количество кандидатов для точного сравнения
+
+    Returns:
+        tuple: (индекс названия, уверенность) или (None, 0)
+    """
+    folded_query = fold_text(query)
+    if len(folded_query) < 2:
+        return None, 0
+
+    posting_lists = [postings for postings in (index.postings(key) for key in trigram_keys(folded_query))
+                     if len(postings)]
+    if not posting_lists:
+        return None, 0
+    posting_lists.sort(key=len)
+
+    selected = []
+    scanned = 0
+    for number, postings in enumerate(posting_lists):
+        if number >= MIN_TRIGRAMS and scanned + len(postings) > MAX_SCANNED_POSTINGS:
+            break
+        # Списки - array('I') или срез отображенного файла: numpy читает их без копирования
+        selected.append(np.frombuffer(postings, dtype=np.uint32))
+        scanned += len(postings)
+    # Число общих триграмм для каждого названия - подсчетом в numpy, а не в словаре
+    name_ids, overlap = np.unique(np.concatenate(selected), return_counts=True)
+    if len(name_ids) > max_candidates:
+        # Порог - число общих триграмм у max_candidates-го по счету кандидата
+        threshold = np.partition(overlap, -max_candidates)[-max_candidates]
+        keep = overlap >= threshold
+        name_ids, overlap = name_ids[keep], overlap[keep]
+    order = np.argsort(-overlap, kind='stable')[:max_candidates]
+    candidates = [(int(name_ids[i]), int(overlap[i])) for i in order]
+
+    # Сначала кандидаты, близкие по длине: при опечатке длина меняется не больше
+    # чем на символ, и найденный первым близкий кандидат сразу сужает допустимое
+    # расстояние для остальных (их сравнение обрывается на первых символах)
+    candidates = [(fold_text(index.name(name_id)), name_id, shared) for name_id, shared in candidates]
+    candidates.sort(key=lambda item: (abs(len(item[0]) - len(folded_query)), -item[2]))
+
+    query_counts = Counter(folded_query)
+    best_id, best_rank = None, None
+    for folded_name, name_id, shared in candidates:
+        longest = max(len(folded_query), len(folded_name))
+        # Допустимое расстояние - чтобы уверенность была не ниже порога и не ниже
+        # лучшего найденного кандидата (тогда далекие кандидаты отсекаются быстро)
+        required_confidence = min_confidence if best_rank is None else max(min_confidence, best_rank[0])
+        max_distance = int(longest * (1 - required_confidence) + 1e-9)
+        # Разница длин и состав символов - нижние границы расстояния:
+        # заведомо далекие кандидаты посимвольно не сравниваем
+        if abs(len(folded_query) - len(folded_name)) > max_distance:
+            continue
+        if bag_distance(query_counts, folded_name) > max_distance:
+            continue
+        distance = damerau_levenshtein(folded_query, folded_name, max_distance)
+        if distance > max_distance:
+            continue
+        confidence = 1 - distance / longest
+        rank = (confidence, shared, -len(folded_name))
+        if best_rank is None or rank > best_rank:
+            best_id, best_rank = name_id, rank
+
+    if best_id is None or best_rank[0] < min_confidence:
+        return None, 0
+    return best_id, round(best_rank[0], 3)
@@ -0,0 +1,79 @@
+import io
+import os
+import hashlib
+import threading
+from PIL import Image
+from food_recognition.perceptual_hash import dhash
+
+class ImageBuffer:
+    """
+    Изображение в памяти: исходные байты и один раз декодированное PIL-изображение.
+
+    Один и тот же буфер передается в распознавание штрихкода, в Vision API и в
+    резервные методы, поэтому файл не читается и не декодируется повторно.
+    """
+
+    def __init__(self, content):
+        """
+        Args:
+            content (bytes): Содержимое изображения (JPEG/PNG и т.п.)
+        """
+        self.content = bytes(content)
+        self._content_hash = None
+        self._perceptual_hash = None
+        self._pil_image = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_source(cls, image_path=None, image_content=None):
+        """
+        Создание буфера из пути к файлу или из байтов
+
+        Args:
+            image_path (str, optional): Путь к файлу изображения
+            image_content (bytes | ImageBuffer, optional): Содержимое изображения
+
+        Returns:
+            ImageBuffer: Буфер с изображением
+        """
+        if isinstance(image_content, ImageBuffer):
+            return image_content
+        if image_content:
+            return cls(image_content)
+        if image_path and os.path.exists(image_path):
+            with open(image_path, 'rb') as image_file:
+                return cls(image_file.read())
+        raise ValueError("Необходимо предоставить либо путь к изображению, либо его содержимое")
+
+    @property
+    def view(self):
+        """memoryview на содержимое без копирования"""
+        return memoryview(self.content)
+
+    @property
+    def content_hash(self):
+        """SHA-256 содержимого (hex), вычисляется один раз"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.content).hexdigest()
+        return self._content_hash
+
+    @property
+    def perceptual_hash(self):
+        """Перцептивный хэш (dHash) изображения, вычисляется один раз"""
+        if self._perceptual_hash is None:
+            self._perceptual_hash = dhash(self.pil_image)
+        return self._perceptual_hash
+
+    @property
+    def pil_image(self):
+        """PIL-изображение, декодированное при первом обращении"""
+        if self._pil_image is None:
+            with self._lock:
+                if self._pil_image is None:
+                    image = Image.open(io.BytesIO(self.content))
+                    image.load()
+                    self._pil_image = image
+        return self._pil_image
+
+    def __len__(self):
+        return len(self.content)
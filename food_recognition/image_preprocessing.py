@@ -0,0 +1,34 @@
+import io
+from PIL import Image, ImageOps
+
+def prepare_for_vision(image_buffer, max_long_edge=1024, jpeg_quality=85):
+    """
+    Подготовка изображения к отправке в модель: поворот по EXIF, уменьшение
+    до max_long_edge по длинной стороне и пережатие в JPEG без метаданных
+
+    Args:
+        image_buffer (ImageBuffer): Изображение в памяти
+        max_long_edge (int): Максимальный размер длинной стороны в пикселях
+        jpeg_quality (int): Качество JPEG (1-95)
+
+    Returns:
+        tuple: (байты JPEG, (ширина, высота)); при ошибке - исходные байты и None
+    """
+    try:
+        # exif_transpose возвращает новое изображение, исходное в буфере не меняется
+        image = ImageOps.exif_transpose(image_buffer.pil_image)
+        if image is image_buffer.pil_image:
+            image = image.copy()
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        if max(image.size) > max_long_edge:
+            image.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS, reducing_gap=3.0)
+
+        output = io.BytesIO()
+        # EXIF и прочие метаданные не передаются - save их не записывает
+        image.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+        return output.getvalue(), image.size
+    except Exception as e:
+        print(f"Ошибка при подготовке изображения: {str(e)}")
+        return image_buffer.content, None
@@ -3,9 +3,15 @@ import json
 import os
 import sys
 import re
+import hashlib
+import numpy as np
 
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import FOOD_DB_PATH, FUZZY_MATCH_MIN_CONFIDENCE
+from food_recognition.text_index import AhoCorasickIndex, SuffixIndex
+from food_recognition.food_db import FoodDatabase, word_ngrams
+from food_recognition.fuzzy_match import TrigramIndex, find_best_match
 
 class NutritionCalculator:
     """Класс для расчета КБЖУ на основе распознанных продуктов питания"""
@@ -212,6 +218,76 @@ class NutritionCalculator:
         'яблоки': 'яблоко',
     }
     
+    # Минимальная длина запроса для поиска ключей, содержащих запрос
+    # (иначе "чай" нашелся бы в любом ключе с этими буквами, а "" - в любом ключе)
+    MIN_PARTIAL_QUERY_LENGTH = 3
+    
+    # Индексы строятся один раз при загрузке модуля (см. build_indexes)
+    _db_keys = []
+    _db_index = None        # ключи базы, входящие в запрос
+    _db_suffix_index = None  # ключи базы, содержащие запрос
+    _synonym_keys = []
+    _synonym_values = []
+    _synonym_index = None
+    _fuzzy_index = None      # триграммы ключей для поиска с опечатками
+    
+    # Внешняя база продуктов в бинарном формате (см. food_recognition.food_db)
+    _food_db = None
+    _data_version = None     # см. data_version
+    
+    @classmethod
+    def load_food_database(cls, path=FOOD_DB_PATH):
+        """
+        Подключение внешней базы продуктов (файл отображается в память, не читается целиком)
+        
+        Args:
+            path (str): Путь к файлу базы
+            
+        Returns:
+            bool: True, если база подключена
+        """
+        food_db = FoodDatabase.open_if_exists(path)
+        if food_db is not None:
+            cls._food_db = food_db
+            cls._data_version = None
+        return food_db is not None
+    
+    @classmethod
+    def data_version(cls):
+        """
+        Версия данных о пищевой ценности: хэш NUTRITION_DB, FOOD_SYNONYMS и
+        файла внешней базы (размер и время изменения). Меняется при любом
+        исправлении данных - по ней сбрасываются кэши результатов поиска.
+        
+        Returns:
+            str: Версия данных
+        """
+        if cls._data_version is None:
+            digest = hashlib.sha1()
+            digest.update(json.dumps([cls.NUTRITION_DB, cls.FOOD_SYNONYMS], sort_keys=True,
+                                     ensure_ascii=False).encode('utf-8'))
+            if cls._food_db is not None:
+                stat = os.stat(cls._food_db.path)
+                digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+            cls._data_version = digest.hexdigest()
+        return cls._data_version
+    
+    @classmethod
+    def build_indexes(cls):
+        """
+        Построение индексов для частичного поиска по NUTRITION_DB и FOOD_SYNONYMS.
+        Вызывается при загрузке модуля и после изменения словарей.
+        """
+        cls._data_version = None
+        cls._db_keys = list(cls.NUTRITION_DB)
+        cls._db_index = AhoCorasickIndex(cls._db_keys)
+        cls._db_suffix_index = SuffixIndex(cls._db_keys)
+        cls._fuzzy_index = TrigramIndex(cls._db_keys)
+        
+        cls._synonym_keys = [synonym.lower() for synonym in cls.FOOD_SYNONYMS]
+        cls._synonym_values = list(cls.FOOD_SYNONYMS.values())
+        cls._synonym_index = AhoCorasickIndex(cls._synonym_keys)
+    
     @staticmethod
     def normalize_food_name(food_name):
         """
@@ -225,10 +301,10 @@ class NutritionCalculator:
         """
         food_name_lower = food_name.lower()
         
-        # Проверка синонимов
-        for synonym, standard in NutritionCalculator.FOOD_SYNONYMS.items():
-            if synonym.lower() in food_name_lower:
-                return standard
+        # Проверка синонимов (самый длинный синоним, входящий в название)
+        synonym_id = NutritionCalculator._synonym_index.best_match(food_name_lower)
+        if synonym_id is not None:
+            return NutritionCalculator._synonym_values[synonym_id]
         
         # Удаление стоп-слов и лишних символов
         food_name_clean = re.sub(r'[^\w\s]', '', food_name_lower)
@@ -236,6 +312,95 @@ class NutritionCalculator:
         
         return food_name_clean
     
+    @staticmethod
+    def find_food_key(food_name_norm):
+        """
+        Поиск ключа NUTRITION_DB для нормализованного названия
+        
+        Args:
+            food_name_norm (str): Нормализованное название продукта
+            
+        Returns:
+            str: Ключ базы или None
+        """
+        # Поиск по полному совпадению
+        if food_name_norm in NutritionCalculator.NUTRITION_DB:
+            return food_name_norm
+        
+        # Ключ базы входит в название ("борщ со сметаной" -> "борщ"), самый длинный
+        key_id = NutritionCalculator._db_index.best_match(food_name_norm)
+        
+        # Название входит в ключ базы ("карбонара" -> "паста карбонара"), самый короткий
+        if key_id is None and len(food_name_norm) >= NutritionCalculator.MIN_PARTIAL_QUERY_LENGTH:
+            key_id = NutritionCalculator._db_suffix_index.best_match(food_name_norm)
+        
+        return NutritionCalculator._db_keys[key_id] if key_id is not None else None
+    
+    @staticmethod
+    def find_food_values(food_name_norm):
+        """
+        Поиск пищевой ценности во встроенном словаре и во внешней базе
+        
+        Args:
+            food_name_norm (str): Нормализованное название продукта
+            
+        Returns:
+            list: [калории, белки, жиры, углеводы] на 100 г или None
+        """
+        food_db = NutritionCalculator._food_db
+        nutrition_db = NutritionCalculator.NUTRITION_DB
+        
+        if food_db is None:
+            key = NutritionCalculator.find_food_key(food_name_norm)
+            return nutrition_db[key] if key is not None else None
+        
+        # Сначала целые словосочетания запроса в обоих источниках, от длинных к коротким
+        # ("домашние сырники со сметаной" -> "сырники со сметаной")
+        for phrase in word_ngrams(food_name_norm):
+            if phrase in nutrition_db:
+                return nutrition_db[phrase]
+            row = food_db.find_row(phrase)
+            if row is not None:
+                return food_db.values(row)
+        
+        # Затем части слов во встроенном словаре и начало названия во внешней базе
+        key = NutritionCalculator.find_food_key(food_name_norm)
+        if key is not None:
+            return nutrition_db[key]
+        row = food_db.find_shortest_prefix_row(food_name_norm, NutritionCalculator.MIN_PARTIAL_QUERY_LENGTH)
+        if row is not None:
+            return food_db.values(row)
+        
+        return None
+    
+    @staticmethod
+    def find_fuzzy_values(food_name_norm, min_confidence=FUZZY_MATCH_MIN_CONFIDENCE):
+        """
+        Поиск с учетом опечаток ("боршь" -> "борщ") во встроенном словаре и во внешней базе
+        
+        Args:
+            food_name_norm (str): Нормализованное название продукта
+            min_confidence (float): Минимальная уверенность совпадения
+            
+        Returns:
+            tuple: (значения, найденное название, уверенность) или None
+        """
+        key_id, confidence = find_best_match(food_name_norm, NutritionCalculator._fuzzy_index, min_confidence)
+        best = None
+        if key_id is not None:
+            key = NutritionCalculator._db_keys[key_id]
+            best = (NutritionCalculator.NUTRITION_DB[key], key, confidence)
+        
+        # Внешняя база - если собрана с индексом триграмм; при равной уверенности
+        # предпочитаем встроенный словарь
+        food_db = NutritionCalculator._food_db
+        if food_db is not None and food_db.has_trigram_index:
+            row, db_confidence = find_best_match(food_name_norm, food_db, min_confidence)
+            if row is not None and (best is None or db_confidence > best[2]):
+                best = (food_db.values(row), food_db.key(row), db_confidence)
+        
+        return best
+    
     @staticmethod
     def lookup_nutrition(food_name):
         """
@@ -250,9 +415,10 @@ class NutritionCalculator:
         # Нормализация названия продукта
         food_name_norm = NutritionCalculator.normalize_food_name(food_name)
         
-        # Поиск по полному совпадению
-        if food_name_norm in NutritionCalculator.NUTRITION_DB:
-            values = NutritionCalculator.NUTRITION_DB[food_name_norm]
+        # Поиск по полному и частичному совпадению. Блюда из DISH_COMPONENTS
+        # ищутся так же: учитываются только те, что есть в NUTRITION_DB
+        values = NutritionCalculator.find_food_values(food_name_norm)
+        if values is not None:
             return {
                 'name': food_name,
                 'calories': values[0],
@@ -261,30 +427,19 @@ class NutritionCalculator:
                 'carbs': values[3]
             }
         
-        # Поиск по частичному совпадению
-        for key in NutritionCalculator.NUTRITION_DB:
-            if key in food_name_norm or food_name_norm in key:
-                values = NutritionCalculator.NUTRITION_DB[key]
-                return {
-                    'name': food_name,
-                    'calories': values[0],
-                    'proteins': values[1],
-                    'fats': values[2],
-                    'carbs': values[3]
-                }
-        
-        # Проверка компонентов блюда
-        for dish, components in NutritionCalculator.DISH_COMPONENTS.items():
-            if dish in food_name_norm or food_name_norm in dish:
-                if dish in NutritionCalculator.NUTRITION_DB:
-                    values = NutritionCalculator.NUTRITION_DB[dish]
-                    return {
-                        'name': food_name,
-                        'calories': values[0],
-                        'proteins': values[1],
-                        'fats': values[2],
-                        'carbs': values[3]
-                    }
+        # Название с опечаткой: берем самое похожее, если уверенность достаточна
+        fuzzy_match = NutritionCalculator.find_fuzzy_values(food_name_norm)
+        if fuzzy_match is not None:
+            values, matched_name, confidence = fuzzy_match
+            return {
+                'name': food_name,
+                'calories': values[0],
+                'proteins': values[1],
+                'fats': values[2],
+                'carbs': values[3],
+                'matched_name': matched_name,  # Название, найденное вместо введенного
+                'match_confidence': confidence
+            }
         
         # Если продукт не найден, возвращаем оценочные значения
         # Среднее значение КБЖУ для смешанного блюда
@@ -376,4 +531,108 @@ class NutritionCalculator:
             'carbs': round(total_carbs, 1),
             'estimated': estimated,
             'detected_items': [item['name'] for item in top_foods]  # Добавляем список распознанных продуктов
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def resolve_food_rows(food_names):
+        """
+        Поиск пищевой ценности для набора названий: каждое уникальное название
+        ищется один раз
+        
+        Args:
+            food_names (iterable): Названия продуктов (возможны повторы)
+            
+        Returns:
+            tuple: (словарь название -> номер строки, матрица значений float64
+                   размером (строк + 1, 4), массив признаков оценочных значений);
+                   последняя строка матрицы - нулевая, для заполнения пропусков
+        """
+        rows = {}
+        values = []
+        estimated = []
+        for food_name in food_names:
+            if food_name in rows:
+                continue
+            nutrition = NutritionCalculator.lookup_nutrition(food_name)
+            rows[food_name] = len(values)
+            values.append([nutrition['calories'], nutrition['proteins'], nutrition['fats'], nutrition['carbs']])
+            estimated.append(nutrition.get('estimated', False))
+        
+        values.append([0, 0, 0, 0])
+        estimated.append(False)
+        return rows, np.array(values, dtype=np.float64), np.array(estimated, dtype=bool)
+    
+    @staticmethod
+    def calculate_nutrition_batch(detections_list, top_count=3):
+        """
+        Расчет пищевой ценности для многих списков распознанных продуктов сразу
+        (пересчет истории, пакетная обработка). Результат совпадает с
+        calculate_nutrition для каждого списка, но названия ищутся один раз
+        на весь пакет, а взвешенные суммы считаются матричными операциями.
+        
+        Args:
+            detections_list (list): Списки распознанных продуктов с вероятностями
+            top_count (int): Сколько продуктов учитывать при взвешенном расчете
+            
+        Returns:
+            dict: Столбцы результата: name (список), calories, proteins, fats,
+                  carbs (np.ndarray float64), estimated (np.ndarray bool)
+        """
+        count = len(detections_list)
+        # Как в calculate_nutrition: сортировка по уверенности, основное блюдо - первое
+        top_items = [sorted(items, key=lambda x: x.get('confidence', 0), reverse=True)[:top_count]
+                     for items in detections_list]
+        
+        rows, values, estimated_rows = NutritionCalculator.resolve_food_rows(
+            item['name'] for items in top_items for item in items)
+        padding_row = len(values) - 1
+        
+        # Матрицы (списков x продуктов): номера строк и уверенности; пропуски -
+        # нулевая строка с нулевым весом
+        row_matrix = np.full((count, top_count), padding_row, dtype=np.intp)
+        confidence_matrix = np.zeros((count, top_count), dtype=np.float64)
+        weight_matrix = np.zeros((count, top_count), dtype=np.float64)
+        for i, items in enumerate(top_items):
+            for j, item in enumerate(items):
+                row_matrix[i, j] = rows[item['name']]
+                confidence_matrix[i, j] = item.get('confidence', 0)
+                weight_matrix[i, j] = item.get('confidence', 0.33)  # По умолчанию равное распределение
+        
+        # Нормализация уверенности (нулевая сумма - деление на 1)
+        total_confidence = confidence_matrix.sum(axis=1)
+        total_confidence[total_confidence == 0] = 1
+        weight_matrix /= total_confidence[:, None]
+        
+        # Взвешенное суммирование по столбцам матрицы - в том же порядке, что
+        # и в calculate_nutrition, чтобы совпадало округление
+        weighted = np.zeros((count, 4), dtype=np.float64)
+        for j in range(top_count):
+            weighted += values[row_matrix[:, j]] * weight_matrix[:, j, None]
+        
+        # Основное блюдо найдено в базе - берутся его значения без взвешивания
+        main_rows = row_matrix[:, 0]
+        main_known = ~estimated_rows[main_rows] & (main_rows != padding_row)
+        result_values = values[main_rows]
+        
+        # Округление встроенным round: np.round умножает на 10 и иногда
+        # округляет половины иначе, чем calculate_nutrition
+        weighted_rows = np.flatnonzero(~main_known)
+        rounded = [[round(value, 1) for value in row] for row in weighted[weighted_rows].tolist()]
+        result_values[weighted_rows] = np.array(rounded, dtype=np.float64).reshape(-1, 4)
+        
+        has_items = np.array([bool(items) for items in top_items], dtype=bool)
+        estimated = np.where(main_known, False, estimated_rows[row_matrix].any(axis=1))
+        estimated[~has_items] = True
+        
+        return {
+            'name': [items[0]['name'] if items else 'Неизвестное блюдо' for items in top_items],
+            'calories': result_values[:, 0],
+            'proteins': result_values[:, 1],
+            'fats': result_values[:, 2],
+            'carbs': result_values[:, 3],
+            'estimated': estimated
+        }
+
+# Индексы для частичного поиска строятся один раз при загрузке
+NutritionCalculator.build_indexes()
+NutritionCalculator.load_food_database()
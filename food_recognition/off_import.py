@@ -0,0 +1,191 @@
+"""
+Загрузка выгрузки Open Food Facts в локальную базу штрихкодов
+
+Поддерживаются JSONL (openfoodfacts-products.jsonl.gz) и CSV с табуляцией
+(en.openfoodfacts.org.products.csv.gz), сжатые gzip/bz2 или без сжатия.
+Файл читается построчно, из каждого продукта берутся только поля, которые
+использует BarcodeScanner (название и КБЖУ на 100 г), и записываются
+порциями. Память не зависит от размера выгрузки.
+
+Запись заменяет существующую, только если продукт в выгрузке изменен
+позже (last_modified_t), поэтому файлы обновлений (delta) можно загружать
+поверх полной выгрузки и повторно.
+
+Запуск из корня проекта:
+    python -m food_recognition.off_import openfoodfacts-products.jsonl.gz
+    python -m food_recognition.off_import delta/*.json.gz --batch-size 10000
+"""
+import io
+import os
+import sys
+import bz2
+import csv
+import gzip
+import json
+import time
+import argparse
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import BARCODE_DB_PATH
+from food_recognition.barcode_store import BarcodeStore
+
+# Поля КБЖУ на 100 г в Open Food Facts
+NUTRIMENT_FIELDS = {
+    'proteins': 'proteins_100g',
+    'fats': 'fat_100g',
+    'carbs': 'carbohydrates_100g',
+}
+KJ_PER_KCAL = 4.184
+
+def open_dump(path):
+    """Текстовый поток выгрузки (с распаковкой по расширению)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', errors='replace')
+    return io.open(path, 'r', encoding='utf-8', errors='replace')
+
+def dump_format(path):
+    """'csv' или 'jsonl' по имени файла"""
+    name = path.lower()
+    for suffix in ('.gz', '.bz2'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return 'csv' if name.endswith(('.csv', '.tsv')) else 'jsonl'
+
+def iter_jsonl(stream):
+    """Продукты из JSONL (по одному JSON-объекту в строке)"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue
+        nutriments = product.get('nutriments') or {}
+        yield {
+            'code': product.get('code') or product.get('_id'),
+            'product_name_ru': product.get('product_name_ru'),
+            'product_name': product.get('product_name'),
+            'energy-kcal_100g': nutriments.get('energy-kcal_100g'),
+            'energy_100g': nutriments.get('energy_100g'),
+            'proteins_100g': nutriments.get('proteins_100g'),
+            'fat_100g': nutriments.get('fat_100g'),
+            'carbohydrates_100g': nutriments.get('carbohydrates_100g'),
+            'last_modified_t': product.get('last_modified_t'),
+        }
+
+def iter_csv(stream):
+    """Продукты из CSV Open Food Facts (разделитель - табуляция)"""
+    # В выгрузке встречаются очень длинные поля (ингредиенты, теги)
+    csv.field_size_limit(2 ** 31 - 1)
+    yield from csv.DictReader(stream, delimiter='\t', quoting=csv.QUOTE_NONE)
+
+def _number(value):
+    """Число из поля выгрузки или None"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_product(record):
+    """
+    Продукт в формате BarcodeScanner
+
+    Args:
+        record (dict): Поля продукта из выгрузки
+
+    Returns:
+        tuple: (штрихкод, информация о продукте, время изменения) или None,
+               если нет штрихкода, названия или КБЖУ
+    """
+    barcode = ''.join(filter(str.isdigit, str(record.get('code') or '')))
+    name = (record.get('product_name_ru') or record.get('product_name') or '').strip()
+    if not barcode or not name:
+        return None
+
+    calories = _number(record.get('energy-kcal_100g'))
+    if calories is None:
+        energy_kj = _number(record.get('energy_100g'))
+        calories = round(energy_kj / KJ_PER_KCAL, 1) if energy_kj is not None else None
+    macros = {field: _number(record.get(column)) for field, column in NUTRIMENT_FIELDS.items()}
+    if calories is None and all(value is None for value in macros.values()):
+        return None
+
+    product = {
+        'name': name,
+        'calories': calories or 0,
+        'proteins': macros['proteins'] or 0,
+        'fats': macros['fats'] or 0,
+        'carbs': macros['carbs'] or 0,
+        'portion_weight': 100,  # Значения на 100г
+        'barcode': barcode,
+        'estimated': False
+    }
+    updated_at = _number(record.get('last_modified_t')) or 0
+    return barcode, product, updated_at
+
+def import_dump(path, store, batch_size=5000, progress_every=100000):
+    """
+    Загрузка одного файла выгрузки
+
+    Args:
+        path (str): Путь к файлу
+        store (BarcodeStore): Локальная база штрихкодов
+        batch_size (int): Продуктов в одной транзакции
+        progress_every (int): Печатать ход загрузки через столько строк
+
+    Returns:
+        dict: read - прочитано, skipped - пропущено (нет названия или КБЖУ),
+              written - добавлено или обновлено
+    """
+    stats = {'read': 0, 'skipped': 0, 'written': 0}
+    started = time.time()
+    batch = []
+
+    with open_dump(path) as stream:
+        records = iter_csv(stream) if dump_format(path) == 'csv' else iter_jsonl(stream)
+        for record in records:
+            stats['read'] += 1
+            row = to_product(record)
+            if row is None:
+                stats['skipped'] += 1
+            else:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    stats['written'] += store.upsert_many(batch)
+                    batch = []
+
+            if progress_every and stats['read'] % progress_every == 0:
+                elapsed = time.time() - started
+                print(f"{path}: прочитано {stats['read']}, записано {stats['written']}, "
+                      f"пропущено {stats['skipped']} ({stats['read'] / max(elapsed, 1e-6):.0f} строк/с)")
+
+    if batch:
+        stats['written'] += store.upsert_many(batch)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка выгрузки Open Food Facts в локальную базу штрихкодов")
+    parser.add_argument('dumps', nargs='+', help="Файлы JSONL или CSV (можно .gz/.bz2), по порядку")
+    parser.add_argument('--db', default=BARCODE_DB_PATH, help="База штрихкодов SQLite")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Продуктов в одной транзакции")
+    parser.add_argument('--progress-every', type=int, default=100000, help="Печатать ход через столько строк")
+    args = parser.parse_args(argv)
+
+    # Без фильтра Блума: фильтр бота (data/barcodes.bloom) загрузчик не трогает,
+    # бот сам перестроит его, увидев изменение базы
+    store = BarcodeStore(args.db, json_path=None, bloom_path=None)
+    for path in args.dumps:
+        started = time.time()
+        stats = import_dump(path, store, args.batch_size, args.progress_every)
+        print(f"{path}: прочитано {stats['read']}, записано {stats['written']}, "
+              f"пропущено {stats['skipped']} за {time.time() - started:.1f} с")
+    print(f"Продуктов в базе: {len(store)}")
+
+if __name__ == '__main__':
+    main()
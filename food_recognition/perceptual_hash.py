@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+HASH_BITS = 64
+
+def dhash(pil_image, hash_size=8):
+    """
+    Разностный перцептивный хэш (dHash) изображения.
+
+    Изображение уменьшается до (hash_size + 1) x hash_size в оттенках серого,
+    каждый бит - сравнение яркости соседних пикселей в строке. Пережатие,
+    небольшое изменение масштаба и кадрирования меняют лишь несколько бит.
+
+    Args:
+        pil_image (PIL.Image.Image): Изображение
+        hash_size (int): Размер хэша по стороне (8 -> 64 бита)
+
+    Returns:
+        int: Хэш изображения
+    """
+    if pil_image.mode not in ('RGB', 'L'):
+        pil_image = pil_image.convert('RGB')
+    # Сначала уменьшаем, потом переводим в оттенки серого - так дешевле на больших фото
+    small = pil_image.resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0).convert('L')
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(first, second):
+    """
+    Расстояние Хэмминга между двумя хэшами
+
+    Args:
+        first (int): Первый хэш
+        second (int): Второй хэш
+
+    Returns:
+        int: Количество различающихся бит
+    """
+    return bin(first ^ second).count('1')
+
+class NearDuplicateIndex:
+    """
+    Индекс перцептивных хэшей для поиска почти одинаковых изображений.
+
+    Multi-index hashing: 64-битный хэш делится на max_distance + 1 частей, и
+    для каждой части хранится отдельная хэш-таблица. По принципу Дирихле хэш
+    на расстоянии не больше max_distance совпадает с искомым хотя бы в одной
+    части целиком, поэтому поиск проверяет только кандидатов из нескольких
+    корзин, а не весь индекс. При переполнении вытесняются самые старые записи.
+    """
+
+    def __init__(self, max_distance=4, max_entries=200000):
+        """
+        Инициализация индекса
+
+        Args:
+            max_distance (int): Максимальное расстояние Хэмминга для "почти дубликата"
+            max_entries (int): Максимальное количество хэшей в индексе
+        """
+        self.max_distance = max(0, max_distance)
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+
+        # Границы частей хэша: (сдвиг, маска)
+        chunks = self.max_distance + 1
+        self._chunks = []
+        start = 0
+        for i in range(chunks):
+            width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+            self._chunks.append((start, (1 << width) - 1))
+            start += width
+
+        self._tables = [{} for _ in self._chunks]
+        self._entries = OrderedDict()  # хэш -> значение
+
+    def add(self, image_hash, value):
+        """
+        Добавление хэша в индекс
+
+        Args:
+            image_hash (int): Перцептивный хэш изображения
+            value: Связанное значение (например, хэш содержимого для кэша результатов)
+        """
+        with self.lock:
+            if image_hash in self._entries:
+                self._entries[image_hash] = value
+                self._entries.move_to_end(image_hash)
+                return
+
+            self._entries[image_hash] = value
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((image_hash >> shift) & mask, set()).add(image_hash)
+
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._remove_from_tables(oldest)
+
+    def remove(self, image_hash):
+        """Удаление хэша из индекса"""
+        with self.lock:
+            if self._entries.pop(image_hash, None) is not None:
+                self._remove_from_tables(image_hash)
+
+    def find(self, image_hash):
+        """
+        Поиск ближайшего хэша в пределах max_distance
+
+        Args:
+            image_hash (int): Перцептивный хэш изображения
+
+        Returns:
+            tuple: (значение, расстояние) или (None, None), если ничего не найдено
+        """
+        with self.lock:
+            if image_hash in self._entries:
+                return self._entries[image_hash], 0
+
+            best_hash, best_distance = None, self.max_distance + 1
+            checked = set()
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                for candidate in table.get((image_hash >> shift) & mask, ()):
+                    if candidate in checked:
+                        continue
+                    checked.add(candidate)
+                    distance = hamming_distance(image_hash, candidate)
+                    if distance < best_distance:
+                        best_hash, best_distance = candidate, distance
+
+            if best_hash is None:
+                return None, None
+            return self._entries[best_hash], best_distance
+
+    def _remove_from_tables(self, image_hash):
+        """Удаление хэша из таблиц частей (вызывается под блокировкой)"""
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (image_hash >> shift) & mask
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(image_hash)
+                if not bucket:
+                    del table[key]
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import threading
+import logging
+from monitoring.metrics import metrics_collector
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import GOOGLE_APPLICATION_CREDENTIALS, AITUNNEL_ASYNC_CLIENT
+
+logger = logging.getLogger(__name__)
+
+class ProviderRegistry:
+    """
+    Реестр клиентов внешних сервисов.
+
+    Каждый клиент создается один раз при первом обращении и дальше
+    используется всеми потоками (клиенты Google Vision, OpenAI и сессия
+    requests потокобезопасны). Настройка gRPC-канала и TLS происходит один
+    раз, а не при каждом вызове.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """
+        Регистрация фабрики клиента
+
+        Args:
+            name (str): Название провайдера
+            factory (callable): Функция без аргументов, создающая клиент
+        """
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name):
+        """
+        Получение общего клиента (создается при первом обращении)
+
+        Args:
+            name (str): Название провайдера
+
+        Returns:
+            Клиент провайдера
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        # RLock: фабрика одного провайдера может запрашивать другой
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start_time = time.time()
+                instance = self._factories[name]()
+                self._instances[name] = instance
+                metrics_collector.track_timing(f'provider_init_{name}', time.time() - start_time)
+            return instance
+
+    def warm_up(self, names=None, background=True):
+        """
+        Создание клиентов заранее, чтобы первый запрос не ждал инициализации
+
+        Args:
+            names (list, optional): Названия провайдеров (по умолчанию все)
+            background (bool): Выполнять в фоновом потоке
+        """
+        names = list(names or self._factories)
+
+        def warm():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logger.error(f"Ошибка при инициализации провайдера {name}: {str(e)}")
+
+        if background:
+            threading.Thread(target=warm, name='providers-warm-up', daemon=True).start()
+        else:
+            warm()
+
+def _create_google_vision_client():
+    from google.cloud import vision
+    if GOOGLE_APPLICATION_CREDENTIALS:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
+    return vision.ImageAnnotatorClient()
+
+def _create_food_recognition():
+    from food_recognition.vision_api import FoodRecognition
+    return FoodRecognition(client=providers.get('google_vision'))
+
+def _create_aitunnel_vision():
+    if AITUNNEL_ASYNC_CLIENT:
+        from food_recognition.aitunnel_async_api import AsyncAITunnelVisionFoodRecognition
+        return AsyncAITunnelVisionFoodRecognition()
+    from food_recognition.aitunnel_vision_api import AITunnelVisionFoodRecognition
+    return AITunnelVisionFoodRecognition()
+
+def _create_barcode_scanner():
+    from food_recognition.barcode_scanner import BarcodeScanner
+    vision_client = providers.get('google_vision') if GOOGLE_APPLICATION_CREDENTIALS else None
+    return BarcodeScanner(vision_client=vision_client)
+
+# Глобальный реестр провайдеров
+providers = ProviderRegistry()
+providers.register('google_vision', _create_google_vision_client)
+providers.register('food_recognition', _create_food_recognition)
+providers.register('aitunnel_vision', _create_aitunnel_vision)
+providers.register('barcode_scanner', _create_barcode_scanner)
@@ -0,0 +1,104 @@
+import os
+import sys
+import copy
+from typing import Dict, Any, Optional
+from utils.cache import LRUCache, SQLiteCache
+from monitoring.metrics import metrics_collector
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PHOTO_CACHE_SIZE, PHOTO_CACHE_TTL, PHOTO_CACHE_DB
+
+class PhotoResultCache:
+    """
+    Кэш результатов анализа фотографий с адресацией по содержимому.
+
+    Основной ключ - SHA-256 байтов изображения. Telegram file_unique_id служит
+    дешевым ключом первого уровня: по нему результат находится еще до загрузки
+    фотографии. Верхний уровень - LRU в памяти, нижний (необязательный) -
+    SQLite с TTL, переживающий перезапуски.
+    """
+
+    def __init__(self, max_size=PHOTO_CACHE_SIZE, ttl=PHOTO_CACHE_TTL, db_path=PHOTO_CACHE_DB):
+        """
+        Инициализация кэша
+
+        Args:
+            max_size (int): Максимальное количество записей в памяти
+            ttl (float): Время жизни записи в секундах
+            db_path (str, optional): Путь к SQLite-файлу (None - только память)
+        """
+        self.memory = LRUCache(max_size=max_size, ttl=ttl, name='photo_cache_memory')
+        self.disk = SQLiteCache(db_path, table='photo_results', ttl=ttl,
+                                name='photo_cache_disk') if db_path else None
+        metrics_collector.register_gauge_provider(self.memory.stats)
+
+    def get_by_file_id(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Поиск результата по Telegram file_unique_id (без загрузки фотографии)
+
+        Args:
+            file_unique_id (str): Уникальный идентификатор файла в Telegram
+
+        Returns:
+            dict: Копия сохраненного результата или None
+        """
+        if not file_unique_id:
+            return None
+        content_hash = self._get(f'file:{file_unique_id}')
+        if content_hash is None:
+            return None
+        return self.get(content_hash)
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Поиск результата по хэшу содержимого изображения
+
+        Args:
+            content_hash (str): SHA-256 содержимого изображения
+
+        Returns:
+            dict: Копия сохраненного результата или None
+        """
+        result = self._get(f'sha256:{content_hash}')
+        metrics_collector.increment('photo_cache_miss' if result is None else 'photo_cache_hit')
+        # Вызывающий код может менять результат - отдаем копию
+        return copy.deepcopy(result) if result is not None else None
+
+    def put(self, content_hash: str, result: Dict[str, Any], file_unique_id: Optional[str] = None):
+        """
+        Сохранение результата анализа
+
+        Args:
+            content_hash (str): SHA-256 содержимого изображения
+            result (dict): Результат анализа
+            file_unique_id (str, optional): Уникальный идентификатор файла в Telegram
+        """
+        self._set(f'sha256:{content_hash}', copy.deepcopy(result))
+        if file_unique_id:
+            self.remember_file_id(file_unique_id, content_hash)
+
+    def remember_file_id(self, file_unique_id: str, content_hash: str):
+        """
+        Связывание file_unique_id с хэшем содержимого
+
+        Args:
+            file_unique_id (str): Уникальный идентификатор файла в Telegram
+            content_hash (str): SHA-256 содержимого изображения
+        """
+        self._set(f'file:{file_unique_id}', content_hash)
+
+    def _get(self, key):
+        """Поиск сначала в памяти, затем на диске (с подъемом записи в память)"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def _set(self, key, value):
+        """Запись в оба уровня кэша"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
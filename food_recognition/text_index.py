@@ -0,0 +1,191 @@
+from array import array
+from collections import deque
+
+class AhoCorasickIndex:
+    """
+    Автомат Ахо-Корасик для поиска всех ключей, входящих в строку запроса.
+
+    Строится один раз по списку ключей; поиск проходит по запросу за один
+    проход, и его время зависит от длины запроса и числа совпадений, но не от
+    количества ключей.
+    """
+
+    def __init__(self, keys):
+        """
+        Args:
+            keys (list): Ключи (строки); результатом поиска являются их индексы
+        """
+        self.keys = list(keys)
+        self._goto = [{}]       # переходы по символам
+        self._fail = [0]        # суффиксные ссылки
+        self._output = [-1]     # индекс ключа, заканчивающегося в узле
+        self._dict_link = [0]   # ближайший по суффиксным ссылкам узел с ключом
+
+        for key_id, key in enumerate(self.keys):
+            if key:
+                self._insert(key, key_id)
+        self._build_links()
+
+    def _insert(self, key, key_id):
+        node = 0
+        for char in key:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+                self._dict_link.append(0)
+                self._goto[node][char] = next_node
+            node = next_node
+        # Дубликаты ключей: остается первый
+        if self._output[node] == -1:
+            self._output[node] = key_id
+
+    def _build_links(self):
+        """Суффиксные и словарные ссылки обходом в ширину"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._output[fail] != -1 else self._dict_link[fail]
+
+    def find_all(self, text):
+        """
+        Все вхождения ключей в текст
+
+        Args:
+            text (str): Строка запроса
+
+        Returns:
+            list: Пары (позиция начала, индекс ключа)
+        """
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            match_node = node if self._output[node] != -1 else self._dict_link[node]
+            while match_node:
+                key_id = self._output[match_node]
+                matches.append((position - len(self.keys[key_id]) + 1, key_id))
+                match_node = self._dict_link[match_node]
+        return matches
+
+    def best_match(self, text):
+        """
+        Самый длинный ключ, входящий в текст; при равной длине - совпадающий
+        с целым словом, затем встречающийся раньше в списке ключей
+
+        Args:
+            text (str): Строка запроса
+
+        Returns:
+            int: Индекс ключа или None
+        """
+        best_id, best_rank = None, None
+        for start, key_id in self.find_all(text):
+            end = start + len(self.keys[key_id])
+            whole_word = (start == 0 or not text[start - 1].isalnum()) and \
+                         (end == len(text) or not text[end].isalnum())
+            rank = (len(self.keys[key_id]), whole_word, -key_id)
+            if best_rank is None or rank > best_rank:
+                best_id, best_rank = key_id, rank
+        return best_id
+
+class SuffixIndex:
+    """
+    Суффиксный массив по всем ключам для поиска ключей, содержащих запрос.
+
+    Все ключи склеиваются через разделитель, суффиксы сортируются один раз.
+    Ключи, содержащие запрос, - это суффиксы, начинающиеся с запроса; они
+    идут подряд и находятся двоичным поиском за O(len(запроса) * log N).
+    """
+
+    SEPARATOR = '\x00'
+
+    def __init__(self, keys, max_candidates=1000):
+        """
+        Args:
+            keys (list): Ключи (строки); результатом поиска являются их индексы
+            max_candidates (int): Максимум просматриваемых совпадений на запрос
+        """
+        self.keys = list(keys)
+        self.max_candidates = max_candidates
+        self._text = self.SEPARATOR.join(self.keys) + self.SEPARATOR
+
+        offsets = array('I')
+        owners = array('I')
+        suffixes = []
+        position = 0
+        for key_id, key in enumerate(self.keys):
+            offsets.extend(range(position, position + len(key)))
+            owners.extend([key_id] * len(key))
+            suffixes.extend(key[start:] for start in range(len(key)))
+            position += len(key) + 1
+
+        # Сортируем по суффиксу до конца ключа; сами строки суффиксов нужны только здесь
+        order = sorted(range(len(suffixes)), key=suffixes.__getitem__)
+        del suffixes
+        self._offsets = array('I', (offsets[i] for i in order))
+        self._owners = array('I', (owners[i] for i in order))
+
+    def _lower_bound(self, query):
+        """Первая позиция, где суффикс не меньше запроса"""
+        text, offsets, size = self._text, self._offsets, len(query)
+        low, high = 0, len(offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if text[offsets[middle]:offsets[middle] + size] < query:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_containing(self, query):
+        """
+        Ключи, содержащие запрос как подстроку
+
+        Args:
+            query (str): Строка запроса
+
+        Returns:
+            list: Индексы ключей (без повторов, не более max_candidates совпадений)
+        """
+        if not query or self.SEPARATOR in query:
+            return []
+        text, offsets, size = self._text, self._offsets, len(query)
+        position = self._lower_bound(query)
+        found, seen = [], set()
+        end = min(len(offsets), position + self.max_candidates)
+        while position < end and text[offsets[position]:offsets[position] + size] == query:
+            key_id = self._owners[position]
+            if key_id not in seen:
+                seen.add(key_id)
+                found.append(key_id)
+            position += 1
+        return found
+
+    def best_match(self, query):
+        """
+        Самый короткий (наиболее близкий к запросу) ключ, содержащий запрос;
+        при равной длине - встречающийся раньше в списке ключей
+
+        Args:
+            query (str): Строка запроса
+
+        Returns:
+            int: Индекс ключа или None
+        """
+        candidates = self.find_containing(query)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda key_id: (len(self.keys[key_id]), key_id))
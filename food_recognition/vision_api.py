@@ -11,6 +11,7 @@ from monitoring.metrics import metrics_collector
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import GOOGLE_APPLICATION_CREDENTIALS
+from food_recognition.image_buffer import ImageBuffer
 
 # Установка переменных окружения для Google Cloud API
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
@@ -18,11 +19,16 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
 class FoodRecognition:
     """Класс для распознавания пищи с использованием Google Cloud Vision API"""
     
-    def __init__(self):
-        self.client = vision.ImageAnnotatorClient()
+    def __init__(self, client=None):
+        """
+        Args:
+            client (vision.ImageAnnotatorClient, optional): Общий клиент Vision API
+                (см. food_recognition.providers); без него создается новый
+        """
+        self.client = client or vision.ImageAnnotatorClient()
 
-    @track_api_call('google_vision')
-    def detect_food(self, image_path=None, image_content=None):
+    @track_api_call('google_vision', none_is_error=True)
+    def detect_food(self, image_path=None, image_content=None, image_buffer=None):
         """
         Улучшенное распознавание пищи на изображении с использованием 
         нескольких методов Vision API
@@ -30,21 +36,17 @@ class FoodRecognition:
         Args:
             image_path (str, optional): Путь к файлу изображения
             image_content (bytes, optional): Содержимое изображения в байтах
+            image_buffer (ImageBuffer, optional): Уже загруженное в память изображение
             
         Returns:
             list: Список обнаруженных продуктов питания с вероятностями
         """
         try:
             # Подготовка изображения
-            if image_path and os.path.exists(image_path):
-                with io.open(image_path, 'rb') as image_file:
-                    content = image_file.read()
-            elif image_content:
-                content = image_content
-            else:
-                raise ValueError("Необходимо предоставить либо путь к изображению, либо его содержимое")
+            if image_buffer is None:
+                image_buffer = ImageBuffer.from_source(image_path, image_content)
             
-            image = vision.Image(content=content)
+            image = vision.Image(content=image_buffer.content)
             
             # Получаем результаты из нескольких методов API для более точного распознавания
             
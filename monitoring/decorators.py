@@ -5,12 +5,14 @@ from monitoring.metrics import metrics_collector
 
 logger = logging.getLogger(__name__)
 
-def track_api_call(api_name):
+def track_api_call(api_name, none_is_error=False):
     """
     Декоратор для отслеживания вызовов API
     
     Args:
         api_name (str): Название API
+        none_is_error (bool): Считать ошибкой возврат None (для функций,
+            которые перехватывают исключения и возвращают None)
         
     Returns:
         Декоратор для функции
@@ -23,6 +25,8 @@ def track_api_call(api_name):
             
             try:
                 result = func(*args, **kwargs)
+                if none_is_error and result is None:
+                    error = True
                 return result
             except Exception as e:
                 error = True
@@ -1,3 +1,4 @@
+import math
 import time
 import logging
 import threading
@@ -23,6 +24,12 @@ class MetricsCollector:
         self.save_interval = save_interval
         self.lock = threading.Lock()
         
+        # Функции, которые возвращают текущие значения метрик по запросу
+        self._gauge_providers = []
+        
+        # Подписчики на вызовы API (например, предохранители)
+        self._api_call_listeners = []
+        
         # Инициализация метрик значениями по умолчанию
         self._init_default_metrics()
         
@@ -47,7 +54,10 @@ class MetricsCollector:
             'errors': defaultdict(int),               # Количество ошибок по типам
             'start_time': current_time,               # Время запуска коллектора
             'restart_count': 0,                       # Счетчик перезапусков
-            'start_times': [current_time]             # История времен запуска
+            'start_times': [current_time],            # История времен запуска
+            'counters': defaultdict(int),             # Произвольные счетчики (очереди, кэши и т.п.)
+            'gauges': {},                             # Текущие значения (глубина очереди и т.п.)
+            'timings': defaultdict(list)              # Произвольные длительности (последние 100)
         }
         self.max_response_times = 100  # Хранить только последние 100 значений времени ответа
         self._last_save = time.time()
@@ -97,6 +107,10 @@ class MetricsCollector:
                     for error, count in saved_metrics.get('errors', {}).items():
                         self.metrics['errors'][error] = count
                     
+                    # Произвольные счетчики (gauges не восстанавливаем - это текущее состояние)
+                    for name, count in saved_metrics.get('counters', {}).items():
+                        self.metrics['counters'][name] = count
+                    
                     # Обновляем счетчик перезапусков
                     self.metrics['restart_count'] = saved_metrics.get('restart_count', 0) + 1
                     
@@ -141,6 +155,42 @@ class MetricsCollector:
                 if api_name not in self.metrics['api_response_times']:
                     self.metrics['api_response_times'][api_name] = deque(maxlen=self.max_response_times)
                 self.metrics['api_response_times'][api_name].append(response_time)
+        
+        # Подписчики вызываются вне блокировки
+        for listener in list(self._api_call_listeners):
+            try:
+                listener(api_name, response_time, error)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике вызова API: {str(e)}")
+    
+    def add_api_call_listener(self, listener):
+        """
+        Подписка на вызовы API
+        
+        Args:
+            listener (callable): Функция (api_name, response_time, error)
+        """
+        with self.lock:
+            self._api_call_listeners.append(listener)
+    
+    def get_response_time_percentile(self, api_name, percentile, min_samples=1):
+        """
+        Перцентиль времени ответа API по последним вызовам
+        
+        Args:
+            api_name (str): Название API
+            percentile (float): Перцентиль от 0 до 1 (например, 0.95)
+            min_samples (int): Минимальное количество замеров
+            
+        Returns:
+            float: Время ответа в секундах или None, если замеров недостаточно
+        """
+        with self.lock:
+            times = sorted(self.metrics['api_response_times'].get(api_name, ()))
+        if not times or len(times) < min_samples:
+            return None
+        index = min(len(times) - 1, max(0, math.ceil(percentile * len(times)) - 1))
+        return times[index]
     
     def track_photo_analysis(self, user_id):
         """
@@ -189,6 +239,52 @@ class MetricsCollector:
         with self.lock:
             self.metrics['errors'][error_type] += 1
     
+    def increment(self, name, value=1):
+        """
+        Увеличение произвольного счетчика
+        
+        Args:
+            name (str): Название счетчика
+            value (int): Величина увеличения
+        """
+        with self.lock:
+            self.metrics['counters'][name] += value
+    
+    def set_gauge(self, name, value):
+        """
+        Установка текущего значения метрики (например, глубины очереди)
+        
+        Args:
+            name (str): Название метрики
+            value (float): Текущее значение
+        """
+        with self.lock:
+            self.metrics['gauges'][name] = value
+    
+    def register_gauge_provider(self, provider):
+        """
+        Регистрация функции, которая возвращает текущие значения метрик.
+        Вызывается при каждом формировании сводки.
+        
+        Args:
+            provider (callable): Функция без аргументов, возвращающая dict {название: значение}
+        """
+        with self.lock:
+            self._gauge_providers.append(provider)
+    
+    def track_timing(self, name, duration):
+        """
+        Отслеживание произвольной длительности
+        
+        Args:
+            name (str): Название метрики
+            duration (float): Длительность в секундах
+        """
+        with self.lock:
+            if name not in self.metrics['timings']:
+                self.metrics['timings'][name] = deque(maxlen=self.max_response_times)
+            self.metrics['timings'][name].append(duration)
+    
     def get_metrics_summary(self):
         """
         Получение сводки по метрикам
@@ -196,6 +292,14 @@ class MetricsCollector:
         Returns:
             dict: Сводка по метрикам
         """
+        # Обновляем значения, которые считаются по запросу (вне блокировки)
+        for provider in list(self._gauge_providers):
+            try:
+                for name, value in provider().items():
+                    self.set_gauge(name, value)
+            except Exception as e:
+                logger.error(f"Ошибка при получении метрик: {str(e)}")
+        
         with self.lock:
             # Расчет метрик
             total_api_calls = sum(self.metrics['api_calls'].values())
@@ -208,6 +312,12 @@ class MetricsCollector:
                 if times:
                     avg_response_times[api] = sum(times) / len(times)
             
+            # Среднее значение произвольных длительностей
+            avg_timings = {}
+            for name, times in self.metrics['timings'].items():
+                if times:
+                    avg_timings[name] = sum(times) / len(times)
+            
             # Расчет времени работы
             start_time = datetime.fromisoformat(self.metrics['start_time'])
             uptime_seconds = (datetime.now() - start_time).total_seconds()
@@ -233,7 +343,10 @@ class MetricsCollector:
                 )[:5]),  # топ-5 ошибок
                 'uptime': f"{uptime_seconds / 3600:.1f} часов",
                 'restart_count': self.metrics.get('restart_count', 0),
-                'start_times': self.metrics.get('start_times', [])
+                'start_times': self.metrics.get('start_times', []),
+                'counters': dict(self.metrics['counters']),
+                'gauges': dict(self.metrics['gauges']),
+                'avg_timings': avg_timings
             }
     
     def save_metrics(self):
@@ -255,6 +368,7 @@ class MetricsCollector:
                     'start_time': self.metrics['start_time'],
                     'restart_count': self.metrics.get('restart_count', 0),
                     'start_times': self.metrics.get('start_times', []),
+                    'counters': dict(self.metrics['counters']),
                     'save_time': datetime.now().isoformat()
                 }
                 
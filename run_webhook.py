@@ -3,6 +3,7 @@ import os
 import sys
 import logging
 import logging.handlers
+import atexit
 from telebot import apihelper
 import telebot
 
@@ -14,9 +15,12 @@ sys.path.append(script_dir)
 from config import (
     TELEGRAM_BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PORT,
     WEBHOOK_HOST, WEBHOOK_LISTEN, WEBHOOK_SSL_CERT, WEBHOOK_SSL_PRIV,
-    LOG_FILE
+    LOG_FILE, ASYNC_UPDATES, UPDATE_WORKERS, UPDATE_QUEUE_SIZE,
+    UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_STATE_FILE
 )
 from bot import bot, logger
+from utils.update_queue import UpdateDispatcher
+from utils.update_dedup import UpdateDeduplicator
 
 # Настройка дополнительного логирования для отладки
 file_handler = logging.handlers.RotatingFileHandler(
@@ -45,6 +49,24 @@ def main():
         certificate=open(WEBHOOK_SSL_CERT, 'rb') if WEBHOOK_SSL_CERT else None
     )
     
+    # Фильтр повторных доставок одного и того же обновления
+    deduplicator = UpdateDeduplicator(
+        window_size=UPDATE_DEDUP_WINDOW,
+        state_file=UPDATE_DEDUP_STATE_FILE
+    )
+    atexit.register(deduplicator.save)
+    
+    # В асинхронном режиме обновления обрабатываются пулом рабочих потоков,
+    # при этом обновления одного пользователя идут строго по порядку
+    update_pool = None
+    if ASYNC_UPDATES:
+        update_pool = UpdateDispatcher(
+            bot.process_new_updates,
+            workers=UPDATE_WORKERS,
+            max_queue_size=UPDATE_QUEUE_SIZE
+        )
+        update_pool.start()
+    
     # Создаем Flask-приложение для обработки webhook
     from flask import Flask, request, abort
     
@@ -66,8 +88,28 @@ def main():
                 update_obj = telebot.types.Update.de_json(update_dict)
                 logger.info("Преобразовано в объект Update")
                 
+                # Повторную доставку подтверждаем, но не обрабатываем второй раз
+                if not deduplicator.is_new(update_obj.update_id):
+                    logger.info(f"Пропущено повторное обновление update_id={update_obj.update_id}")
+                    return 'OK'
+                
+                # В асинхронном режиме только ставим обновление в очередь
+                if update_pool is not None:
+                    if not update_pool.submit(update_obj):
+                        logger.warning(f"Очередь обновлений переполнена, update_id={update_obj.update_id}")
+                        deduplicator.forget(update_obj.update_id)
+                        # Telegram повторит доставку позже
+                        return 'Queue is full', 503, {'Retry-After': '5'}
+                    logger.info("Обновление поставлено в очередь")
+                    return 'OK'
+                
                 # Обрабатываем обновление
-                bot.process_new_updates([update_obj])
+                try:
+                    bot.process_new_updates([update_obj])
+                except Exception:
+                    # Ответим 500, Telegram доставит обновление повторно - его нужно обработать
+                    deduplicator.forget(update_obj.update_id)
+                    raise
                 logger.info("Webhook успешно обработан")
                 
                 return 'OK'
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import concurrent.futures
+
+class AsyncLoopRunner:
+    """
+    Цикл событий asyncio в отдельном фоновом потоке.
+
+    Позволяет синхронному коду (обработчикам бота) запускать корутины: все
+    запросы выполняются в одном потоке цикла, а вызывающие потоки только
+    ждут результата.
+    """
+
+    def __init__(self, name='async-loop'):
+        """
+        Args:
+            name (str): Имя фонового потока
+        """
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """Цикл событий, запускается при первом обращении"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=self._run, args=(loop,),
+                                                    name=self.name, daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Запуск корутины в фоновом цикле без ожидания результата
+
+        Args:
+            coro: Корутина
+
+        Returns:
+            concurrent.futures.Future: Результат корутины (отмена future отменяет корутину)
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """
+        Выполнение корутины в фоновом цикле с ожиданием результата
+
+        Args:
+            coro: Корутина
+            timeout (float, optional): Максимальное время ожидания в секундах
+
+        Returns:
+            Результат корутины
+
+        Raises:
+            concurrent.futures.TimeoutError: Если результат не получен за timeout
+                (корутина при этом отменяется)
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Остановка цикла событий"""
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+                self._loop = None
+                self._thread = None
+
+# Глобальный цикл для асинхронных клиентов внешних API
+async_runner = AsyncLoopRunner()
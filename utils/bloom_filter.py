@@ -0,0 +1,123 @@
+import os
+import math
+import struct
+import hashlib
+
+HASH_PAIR = struct.Struct('<QQ')
+
+class BloomFilter:
+    """
+    Фильтр Блума: компактное множество с проверкой "точно нет / возможно есть".
+
+    Ложноотрицательных ответов не бывает; доля ложноположительных при
+    заполнении до capacity не больше error_rate. Позиции битов получаются
+    двойным хэшированием из одного 128-битного BLAKE2b.
+    """
+
+    MAGIC = b'BLM2'
+    # метка, битов, хэш-функций, элементов, емкость, доля ошибок, метка пользователя
+    HEADER = struct.Struct('<4sQIQQdQ')
+
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        """
+        Args:
+            capacity (int): Ожидаемое количество элементов
+            error_rate (float): Допустимая доля ложноположительных ответов
+        """
+        capacity = max(1, int(capacity))
+        bit_count = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        hash_count = max(1, int(round(bit_count / capacity * math.log(2))))
+        self._init(bit_count, hash_count, bytearray((bit_count + 7) // 8), 0)
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+    def _init(self, bit_count, hash_count, bits, count):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bits
+        self.count = count
+
+    def _hashes(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = HASH_PAIR.unpack(digest)
+        return first, second | 1
+
+    def _positions(self, item):
+        first, second = self._hashes(item)
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Добавление строки; возвращает True, если ее, возможно, уже не было"""
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        # Проверка до первого нулевого бита: для отсутствующих элементов обычно 1-2 бита
+        first, second = self._hashes(item)
+        bits, bit_count = self.bits, self.bit_count
+        for i in range(self.hash_count):
+            position = (first + i * second) % bit_count
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def false_positive_rate(self):
+        """Ожидаемая доля ложноположительных ответов при текущем заполнении"""
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_count)) ** self.hash_count
+
+    def save(self, path, tag=0):
+        """
+        Сохранение на диск (через временный файл)
+
+        Args:
+            path (str): Путь к файлу
+            tag (int): Метка для проверки актуальности при загрузке
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.bit_count, self.hash_count, self.count,
+                                     self.capacity, self.error_rate, tag))
+            f.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Загрузка с диска
+
+        Args:
+            path (str): Путь к файлу
+
+        Returns:
+            tuple: (фильтр, метка) или (None, None), если файла нет, он поврежден
+                   или записан в старом формате
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls.HEADER.size)
+                magic, bit_count, hash_count, count, capacity, error_rate, tag = cls.HEADER.unpack(header)
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None, None
+        if magic != cls.MAGIC or len(bits) != (bit_count + 7) // 8:
+            return None, None
+
+        bloom = cls.__new__(cls)
+        bloom._init(bit_count, hash_count, bits, count)
+        bloom.capacity = capacity
+        bloom.error_rate = error_rate
+        return bloom, tag
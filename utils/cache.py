@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from monitoring.metrics import metrics_collector
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш в памяти с ограничением размера и необязательным TTL.
+    Попадания, промахи и вытеснения считаются в metrics_collector
+    под префиксом name.
+    """
+
+    def __init__(self, max_size=1000, ttl=None, name='cache'):
+        """
+        Инициализация кэша
+
+        Args:
+            max_size (int): Максимальное количество записей
+            ttl (float, optional): Время жизни записи в секундах (None - бессрочно)
+            name (str): Префикс для имен метрик
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.name = name
+        self.lock = threading.Lock()
+        self._data = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None, track=True):
+        """
+        Получение значения из кэша
+
+        Args:
+            key: Ключ
+            default: Значение, возвращаемое при промахе
+            track (bool): Учитывать ли обращение в метриках попаданий/промахов
+
+        Returns:
+            Значение из кэша или default
+        """
+        with self.lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is not None and expires_at < time.time():
+                    del self._data[key]
+                    entry = None
+                else:
+                    self._data.move_to_end(key)
+            if track:
+                if entry is None:
+                    self._misses += 1
+                else:
+                    self._hits += 1
+
+        if track:
+            metrics_collector.increment(f'{self.name}_miss' if entry is None else f'{self.name}_hit')
+        return default if entry is None else value
+
+    def set(self, key, value, ttl=None):
+        """
+        Сохранение значения в кэше
+
+        Args:
+            key: Ключ
+            value: Значение
+            ttl (float, optional): Время жизни этой записи (по умолчанию - TTL кэша)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        evicted = 0
+        with self.lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                evicted += 1
+
+        if evicted:
+            metrics_collector.increment(f'{self.name}_eviction', evicted)
+
+    def delete(self, key):
+        """Удаление записи из кэша"""
+        with self.lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Очистка кэша"""
+        with self.lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Текущие показатели кэша для metrics_collector
+
+        Returns:
+            dict: Размер кэша и доля попаданий
+        """
+        with self.lock:
+            total = self._hits + self._misses
+            return {
+                f'{self.name}_size': len(self._data),
+                f'{self.name}_hit_rate': round(self._hits / total, 3) if total else 0
+            }
+
+    def __len__(self):
+        with self.lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Персистентный кэш в SQLite с TTL. Значения хранятся в JSON,
+    поэтому подходит для словарей с результатами анализа.
+    """
+
+    def __init__(self, db_path, table='cache', ttl=None, name='cache'):
+        """
+        Инициализация кэша
+
+        Args:
+            db_path (str): Путь к файлу базы данных SQLite
+            table (str): Имя таблицы
+            ttl (float, optional): Время жизни записи в секундах (None - бессрочно)
+            name (str): Префикс для имен метрик
+        """
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.name = name
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+            )
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        """
+        Получение значения из кэша
+
+        Args:
+            key (str): Ключ
+            default: Значение, возвращаемое при промахе
+
+        Returns:
+            Значение из кэша или default
+        """
+        with self.lock:
+            row = self._conn.execute(
+                f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] < time.time():
+                self._conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                self._conn.commit()
+                row = None
+
+        metrics_collector.increment(f'{self.name}_miss' if row is None else f'{self.name}_hit')
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """
+        Сохранение значения в кэше
+
+        Args:
+            key (str): Ключ
+            value: Значение, сериализуемое в JSON
+            ttl (float, optional): Время жизни этой записи (по умолчанию - TTL кэша)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self.lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            self._conn.commit()
+
+    def set_many(self, items, ttl=None):
+        """
+        Сохранение нескольких значений одной транзакцией
+
+        Args:
+            items (dict): Ключи и значения, сериализуемые в JSON
+            ttl (float, optional): Время жизни записей (по умолчанию - TTL кэша)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        rows = [(key, json.dumps(value, ensure_ascii=False), expires_at) for key, value in items.items()]
+        with self.lock:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """
+        Удаление всех записей
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        with self.lock:
+            cursor = self._conn.execute(f'DELETE FROM {self.table}')
+            self._conn.commit()
+            return cursor.rowcount
+
+    def purge_expired(self):
+        """
+        Удаление просроченных записей
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        with self.lock:
+            cursor = self._conn.execute(
+                f'DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?',
+                (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from monitoring.metrics import metrics_collector
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    CIRCUIT_BREAKER_WINDOW, CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_FAILURE_RATE, CIRCUIT_BREAKER_RESET_TIMEOUT
+)
+
+# Время ответа, после которого вызов считается неудачным (по провайдерам), сек
+SLOW_CALL_THRESHOLDS = {
+    'aitunnel_vision': 30,
+    'google_vision': 10,
+    'barcode_product_info': 8,
+}
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего провайдера.
+
+    Закрыт - вызовы разрешены. Если среди последних window вызовов доля
+    ошибок и слишком медленных ответов превышает failure_rate, предохранитель
+    размыкается, и вызовы сразу отклоняются. Через reset_timeout пропускается
+    один пробный вызов: успех замыкает предохранитель, ошибка снова размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_threshold=None, reset_timeout=30):
+        """
+        Args:
+            name (str): Название провайдера (совпадает с названием в track_api_call)
+            window (int): Количество последних вызовов для оценки
+            min_calls (int): Минимум вызовов в окне для размыкания
+            failure_rate (float): Доля неудачных вызовов для размыкания
+            slow_call_threshold (float, optional): Время ответа, после которого вызов неудачный
+            reset_timeout (float): Время до пробного вызова после размыкания, сек
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+
+        self._outcomes = deque(maxlen=window)  # True - неудачный вызов
+        self._state = self.CLOSED
+        self._opened_at = 0
+        self._trial_started_at = None
+
+    @property
+    def state(self):
+        """Текущее состояние с учетом истекшего reset_timeout"""
+        with self.lock:
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """
+        Проверка, можно ли выполнять вызов
+
+        Returns:
+            bool: False, если предохранитель разомкнут (вызов нужно пропустить)
+        """
+        with self.lock:
+            now = time.time()
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_started_at = None
+
+            # Полуоткрыт: пропускаем один пробный вызов. Если его результат так и
+            # не пришел, через reset_timeout разрешаем следующий
+            if self._trial_started_at is None or now - self._trial_started_at >= self.reset_timeout:
+                self._trial_started_at = now
+                return True
+            return False
+
+    def record(self, response_time=None, error=False):
+        """
+        Учет результата вызова
+
+        Args:
+            response_time (float, optional): Время ответа в секундах
+            error (bool): Флаг ошибки вызова
+        """
+        failed = error or (self.slow_call_threshold is not None and response_time is not None
+                           and response_time > self.slow_call_threshold)
+        with self.lock:
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    self._trial_started_at = None
+                    metrics_collector.increment(f'circuit_{self.name}_closed')
+                return
+
+            self._outcomes.append(failed)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+                if self._current_failure_rate() >= self.failure_rate:
+                    self._open()
+
+    def failure_rate_value(self):
+        """Доля неудачных вызовов в окне"""
+        with self.lock:
+            return self._current_failure_rate()
+
+    def _current_failure_rate(self):
+        """Доля неудачных вызовов (вызывается под блокировкой)"""
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def _open(self):
+        """Размыкание (вызывается под блокировкой)"""
+        self._state = self.OPEN
+        self._opened_at = time.time()
+        self._trial_started_at = None
+        self._outcomes.clear()
+        metrics_collector.increment(f'circuit_{self.name}_opened')
+
+class CircuitBreakerRegistry:
+    """
+    Предохранители по названиям провайдеров.
+
+    Результаты вызовов поступают из MetricsCollector.track_api_call, поэтому
+    достаточно, чтобы вызов провайдера был обернут декоратором track_api_call
+    с тем же названием.
+    """
+
+    def __init__(self, names):
+        """
+        Args:
+            names (list): Названия провайдеров
+        """
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                window=CIRCUIT_BREAKER_WINDOW,
+                min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+                failure_rate=CIRCUIT_BREAKER_FAILURE_RATE,
+                slow_call_threshold=SLOW_CALL_THRESHOLDS.get(name),
+                reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT
+            )
+            for name in names
+        }
+        metrics_collector.add_api_call_listener(self._on_api_call)
+        metrics_collector.register_gauge_provider(self.stats)
+
+    def get(self, name):
+        """Предохранитель провайдера"""
+        return self.breakers[name]
+
+    def _on_api_call(self, api_name, response_time, error):
+        breaker = self.breakers.get(api_name)
+        if breaker is not None:
+            breaker.record(response_time, error)
+
+    def stats(self):
+        """Состояние предохранителей для /metrics"""
+        stats = {}
+        for name, breaker in self.breakers.items():
+            stats[f'circuit_{name}'] = breaker.state
+            stats[f'circuit_{name}_failure_rate'] = f"{breaker.failure_rate_value():.0%}"
+        return stats
+
+# Глобальные предохранители для провайдеров распознавания
+circuit_breakers = CircuitBreakerRegistry(list(SLOW_CALL_THRESHOLDS))
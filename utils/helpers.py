@@ -1,32 +1,28 @@
 import os
 import tempfile
-import requests
 from datetime import datetime
 import sys
 from database.db_manager import DatabaseManager
 
 # Добавляем корневую директорию проекта в путь для импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DEBUG_PHOTOS_DIR
+from utils.http_client import http_client
 
 def download_photo(file_path):
     """
-    Загрузка фотографии по URL
+    Загрузка фотографии по URL в память
     
     Args:
         file_path (str): URL фотографии
         
     Returns:
-        str: Путь к временному файлу с фотографией
+        bytes: Содержимое фотографии или None при ошибке
     """
     try:
-        response = requests.get(file_path, stream=True)
+        response = http_client.get(file_path)
         if response.status_code == 200:
-            # Создаем временный файл
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            for chunk in response.iter_content(1024):
-                temp_file.write(chunk)
-            temp_file.close()
-            return temp_file.name
+            return response.content
         else:
             print(f"Ошибка при загрузке фотографии: {response.status_code}")
             return None
@@ -34,6 +30,29 @@ def download_photo(file_path):
         print(f"Ошибка при загрузке фотографии: {str(e)}")
         return None
 
+def save_debug_photo(content):
+    """
+    Сохранение фотографии на диск для отладки (только если задан DEBUG_PHOTOS_DIR)
+    
+    Args:
+        content (bytes): Содержимое фотографии
+        
+    Returns:
+        str: Путь к сохраненному файлу или None, если сохранение отключено
+    """
+    if not DEBUG_PHOTOS_DIR:
+        return None
+    
+    try:
+        os.makedirs(DEBUG_PHOTOS_DIR, exist_ok=True)
+        photo_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir=DEBUG_PHOTOS_DIR)
+        with photo_file:
+            photo_file.write(content)
+        return photo_file.name
+    except Exception as e:
+        print(f"Ошибка при сохранении фотографии для отладки: {str(e)}")
+        return None
+
 def format_nutrition_result(nutrition_data, user_id=None):
     """
     Форматирование результатов анализа пищевой ценности в компактном виде
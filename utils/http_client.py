@@ -0,0 +1,102 @@
+import os
+import sys
+import requests
+from requests.adapters import HTTPAdapter
+from monitoring.metrics import metrics_collector
+
+# Добавляем корневую директорию проекта в путь для импорта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_KEEP_ALIVE,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+)
+
+class HttpClient:
+    """
+    Общий HTTP-клиент с пулом keep-alive соединений.
+
+    Одна сессия requests на весь процесс: urllib3 держит отдельный пул
+    соединений для каждого хоста, поэтому повторные запросы к
+    api.telegram.org, Edadeal и OpenFoodFacts не платят за TCP/TLS-рукопожатие.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, keep_alive=True, timeout=(5, 15)):
+        """
+        Инициализация клиента
+
+        Args:
+            pool_connections (int): Количество хостов, для которых хранятся пулы
+            pool_maxsize (int): Максимум соединений в пуле одного хоста
+            keep_alive (bool): Переиспользовать соединения между запросами
+            timeout (tuple): Таймауты по умолчанию (подключение, чтение) в секундах
+        """
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Выполнение HTTP-запроса через общий пул соединений
+
+        Args:
+            method (str): HTTP-метод
+            url (str): URL запроса
+            timeout (float | tuple, optional): Таймаут, по умолчанию - из настроек клиента
+            **kwargs: Остальные параметры requests
+
+        Returns:
+            requests.Response: Ответ сервера
+        """
+        pool = self.adapter.get_connection(url)
+        connections_before = pool.num_connections
+
+        response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+        # Если пулу пришлось открыть новое соединение - это промах
+        if pool.num_connections > connections_before:
+            metrics_collector.increment('http_pool_miss')
+        else:
+            metrics_collector.increment('http_pool_hit')
+        return response
+
+    def get(self, url, **kwargs):
+        """GET-запрос через общий пул соединений"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """POST-запрос через общий пул соединений"""
+        return self.request('POST', url, **kwargs)
+
+    def pool_stats(self):
+        """
+        Статистика пулов соединений по хостам, включая запросы telebot,
+        которые идут через ту же сессию
+
+        Returns:
+            dict: {метрика: значение}
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host
+            stats[f'http_{host}_connections'] = pool.num_connections
+            stats[f'http_{host}_requests'] = pool.num_requests
+            stats[f'http_{host}_reused'] = max(0, pool.num_requests - pool.num_connections)
+        return stats
+
+
+# Глобальный экземпляр HTTP-клиента
+http_client = HttpClient(
+    pool_connections=HTTP_POOL_CONNECTIONS,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    keep_alive=HTTP_KEEP_ALIVE,
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+)
+metrics_collector.register_gauge_provider(http_client.pool_stats)
@@ -0,0 +1,152 @@
+import os
+import json
+import logging
+import threading
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+class UpdateDeduplicator:
+    """
+    Отсев повторно доставленных обновлений Telegram по update_id.
+
+    Хранит последние window_size идентификаторов в кольцевом буфере и множестве
+    (фиксированный объем памяти). Максимальный увиденный update_id периодически
+    сохраняется на диск, чтобы повторы отсеивались и после перезапуска.
+    """
+
+    def __init__(self, window_size=10000, state_file='data/update_dedup.json', persist_every=50):
+        """
+        Инициализация фильтра
+
+        Args:
+            window_size (int): Количество запоминаемых последних update_id
+            state_file (str): Файл для сохранения максимального update_id (None - не сохранять)
+            persist_every (int): Сохранять состояние после каждых N новых обновлений
+        """
+        self.window_size = max(1, window_size)
+        self.state_file = state_file
+        self.persist_every = max(1, persist_every)
+        self.lock = threading.Lock()
+        # Запись файла - под отдельной блокировкой, чтобы не задерживать is_new
+        self._save_lock = threading.Lock()
+        self._saved_mark = None
+
+        self._ring = [None] * self.window_size
+        self._position = 0
+        self._seen = set()
+        self._high_water_mark = None
+        self._unsaved = 0
+
+        # Максимальный update_id, обработанный до перезапуска
+        self._restored_mark = self._load_state()
+
+    def _load_state(self):
+        """
+        Загрузка сохраненного максимального update_id
+
+        Returns:
+            int: Сохраненный update_id или None
+        """
+        if not self.state_file or not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                mark = json.load(f).get('high_water_mark')
+            logger.info(f"Восстановлен максимальный update_id: {mark}")
+            return mark
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке состояния дедупликации: {str(e)}")
+            return None
+
+    def save(self):
+        """Сохранение максимального update_id на диск (атомарно, через временный файл)"""
+        with self.lock:
+            mark = self._high_water_mark
+            self._unsaved = 0
+        if not self.state_file or mark is None:
+            return
+        # Одновременные вызовы (периодическое сохранение и atexit) пишут по очереди,
+        # и более старая отметка не перезаписывает уже сохраненную новую
+        with self._save_lock:
+            if self._saved_mark is not None and mark <= self._saved_mark:
+                return
+            try:
+                directory = os.path.dirname(self.state_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.state_file}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'high_water_mark': mark}, f)
+                os.replace(tmp_path, self.state_file)
+                self._saved_mark = mark
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояния дедупликации: {str(e)}")
+
+    def is_new(self, update_id):
+        """
+        Проверка обновления и запоминание его update_id
+
+        Args:
+            update_id (int): Идентификатор обновления
+
+        Returns:
+            bool: True для нового обновления, False для повтора
+        """
+        with self.lock:
+            if self._is_replay(update_id):
+                duplicate = True
+            else:
+                duplicate = False
+                self._remember(update_id)
+                self._unsaved += 1
+            need_save = self._unsaved >= self.persist_every
+
+        if duplicate:
+            metrics_collector.increment('updates_duplicates_dropped')
+            return False
+
+        if need_save:
+            self.save()
+        return True
+
+    def forget(self, update_id):
+        """
+        Отмена запоминания update_id, например если обновление не удалось
+        поставить в очередь и Telegram должен доставить его повторно
+
+        Args:
+            update_id (int): Идентификатор обновления
+        """
+        with self.lock:
+            if update_id not in self._seen:
+                return
+            self._seen.discard(update_id)
+            # Обновление добавлено только что, поэтому ищем его с конца окна
+            for offset in range(1, self.window_size + 1):
+                index = (self._position - offset) % self.window_size
+                if self._ring[index] == update_id:
+                    self._ring[index] = None
+                    break
+
+    def _is_replay(self, update_id):
+        """Проверка, видели ли мы уже этот update_id (вызывается под блокировкой)"""
+        if update_id in self._seen:
+            return True
+        # После перезапуска отсеиваем все, что не новее сохраненной отметки.
+        # Слишком старые id не отсеиваем: после недели простоя Telegram
+        # начинает нумерацию заново со случайного значения
+        mark = self._restored_mark
+        return mark is not None and mark - self.window_size < update_id <= mark
+
+    def _remember(self, update_id):
+        """Добавление update_id в окно с вытеснением самого старого (под блокировкой)"""
+        evicted = self._ring[self._position]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._ring[self._position] = update_id
+        self._seen.add(update_id)
+        self._position = (self._position + 1) % self.window_size
+
+        if self._high_water_mark is None or update_id > self._high_water_mark:
+            self._high_water_mark = update_id
@@ -0,0 +1,178 @@
+import time
+import logging
+import threading
+from collections import deque
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Поля обновления Telegram, в которых может быть отправитель
+UPDATE_USER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'pre_checkout_query',
+    'shipping_query', 'inline_query', 'chosen_inline_result', 'poll_answer',
+    'my_chat_member', 'chat_member', 'chat_join_request'
+)
+
+def get_update_user_id(update):
+    """
+    Определение Telegram ID пользователя, от которого пришло обновление
+
+    Args:
+        update (telebot.types.Update): Обновление Telegram
+
+    Returns:
+        int: ID пользователя или None, если обновление не связано с пользователем
+    """
+    for field in UPDATE_USER_FIELDS:
+        payload = getattr(update, field, None)
+        if payload is None:
+            continue
+        user = getattr(payload, 'from_user', None) or getattr(payload, 'user', None)
+        if user is not None:
+            return user.id
+    return None
+
+class UpdateDispatcher:
+    """
+    Диспетчер обновлений Telegram с упорядочиванием по пользователю.
+
+    Обновления одного пользователя обрабатываются строго по очереди (иначе
+    ломаются состояния BotStates и user_data), а обновления разных
+    пользователей - параллельно в пуле рабочих потоков. Общее количество
+    ожидающих обновлений ограничено.
+    """
+
+    def __init__(self, process_func, workers=4, max_queue_size=100, name='updates'):
+        """
+        Инициализация диспетчера
+
+        Args:
+            process_func (callable): Функция обработки списка обновлений
+                (обычно bot.process_new_updates)
+            workers (int): Количество рабочих потоков
+            max_queue_size (int): Максимальное количество ожидающих обновлений
+            name (str): Префикс для имен метрик и потоков
+        """
+        self.process_func = process_func
+        self.workers = max(1, workers)
+        self.max_queue_size = max_queue_size
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._has_space = threading.Condition(self._lock)
+        self._has_ready = threading.Condition(self._lock)
+        # Очереди обновлений по пользователям; ключ присутствует, пока
+        # у пользователя есть необработанные обновления
+        self._pending = {}
+        # Пользователи, чьи обновления можно брать в работу
+        self._ready = deque()
+        self._size = 0
+        self._threads = []
+        self._stopped = False
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name}-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Запущено {self.workers} рабочих потоков для обработки обновлений")
+
+    def submit(self, update, block=False, timeout=None):
+        """
+        Постановка обновления в очередь его пользователя
+
+        Args:
+            update (telebot.types.Update): Обновление Telegram
+            block (bool): Ждать освобождения места, если очередь переполнена
+            timeout (float, optional): Максимальное время ожидания места
+
+        Returns:
+            bool: True, если обновление принято, False - если очередь переполнена
+        """
+        user_id = get_update_user_id(update)
+        # Обновления без пользователя не требуют упорядочивания
+        key = user_id if user_id is not None else ('update', update.update_id)
+
+        with self._lock:
+            if self._size >= self.max_queue_size:
+                if not block or not self._has_space.wait_for(
+                        lambda: self._size < self.max_queue_size, timeout):
+                    metrics_collector.increment(f'{self.name}_queue_rejected')
+                    return False
+
+            item = (time.time(), update)
+            if key in self._pending:
+                # Пользователь уже в работе или в очереди - просто дописываем
+                self._pending[key].append(item)
+            else:
+                self._pending[key] = deque([item])
+                self._ready.append(key)
+                self._has_ready.notify()
+
+            self._size += 1
+            size = self._size
+
+        metrics_collector.set_gauge(f'{self.name}_queue_depth', size)
+        return True
+
+    def submit_many(self, updates):
+        """
+        Постановка списка обновлений с ожиданием свободного места.
+        Подходит для подмены bot.process_new_updates в режиме поллинга.
+
+        Args:
+            updates (list): Список обновлений Telegram
+        """
+        for update in updates:
+            self.submit(update, block=True)
+
+    def stop(self, timeout=None):
+        """
+        Остановка рабочих потоков после обработки уже принятых обновлений
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания каждого потока
+        """
+        with self._lock:
+            self._stopped = True
+            self._has_ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _worker_loop(self):
+        """Цикл рабочего потока: берет очередного пользователя и обрабатывает одно его обновление"""
+        while True:
+            with self._lock:
+                self._has_ready.wait_for(lambda: self._ready or (self._stopped and not self._pending))
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                enqueued_at, update = self._pending[key].popleft()
+
+            metrics_collector.track_timing(f'{self.name}_queue_wait', time.time() - enqueued_at)
+
+            try:
+                self.process_func([update])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {str(e)}")
+                metrics_collector.track_error('update_processing')
+            finally:
+                with self._lock:
+                    self._size -= 1
+                    size = self._size
+                    if self._pending[key]:
+                        # Следующее обновление пользователя ставим в конец,
+                        # чтобы активный пользователь не занимал поток бесконечно
+                        self._ready.append(key)
+                        self._has_ready.notify()
+                    else:
+                        del self._pending[key]
+                        if self._stopped and not self._pending:
+                            self._has_ready.notify_all()
+                    self._has_space.notify()
+                metrics_collector.set_gauge(f'{self.name}_queue_depth', size)